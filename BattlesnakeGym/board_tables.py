@@ -0,0 +1,104 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+from functools import lru_cache
+
+import numpy as np
+
+# Precomputed geometry of the boards, built once per board size and process.
+#
+# A cell is identified by row * width + column. In the gym, the row is i and the column is j.
+# With the Battlesnake API, the row is y and the column is x.
+#
+# The neighbours of a cell are ordered by the actions of the gym (Snake.UP, Snake.DOWN,
+# Snake.LEFT, Snake.RIGHT), that is row - 1, row + 1, column - 1 and column + 1.
+# As y grows upwards in the API, the corresponding API moves are API_MOVES.
+
+DELTAS = ((-1, 0), (1, 0), (0, -1), (0, 1))
+API_MOVES = ("down", "up", "left", "right")
+API_MOVE_INDEX = {move: k for k, move in enumerate(API_MOVES)}
+OFF_BOARD = -1
+
+def _read_only(array):
+    # The tables are shared by every caller, so they must not be modified
+    array.flags.writeable = False
+    return array
+
+@lru_cache(maxsize=None)
+def get_neighbours(height, width):
+    '''
+    Neighbours of each cell
+
+    Returns:
+    --------
+    neighbours: np.array(height * width, 4) of int32
+        neighbours[cell, k] is the cell reached from cell by the direction DELTAS[k],
+        OFF_BOARD if it is outside of the board
+    '''
+    rows, columns = np.divmod(np.arange(height * width), width)
+    neighbours = np.empty((height * width, len(DELTAS)), dtype=np.int32)
+    for k, (di, dj) in enumerate(DELTAS):
+        i, j = rows + di, columns + dj
+        on_board = (i >= 0) & (i < height) & (j >= 0) & (j < width)
+        neighbours[:, k] = np.where(on_board, i * width + j, OFF_BOARD)
+    return _read_only(neighbours)
+
+@lru_cache(maxsize=None)
+def get_neighbour_lists(height, width):
+    '''
+    Neighbours of each cell on the board as tuples of python ints, faster to iterate than
+    get_neighbours in pure python loops (e.g., flood fills)
+
+    Returns:
+    --------
+    neighbour_lists: ((int))
+        neighbour_lists[cell] holds the neighbours of cell that are on the board
+    '''
+    return tuple(tuple(n for n in row if n != OFF_BOARD) for row in get_neighbours(height, width).tolist())
+
+@lru_cache(maxsize=None)
+def get_move_table(height, width):
+    '''
+    get_neighbours as tuples of python ints, faster to index than a numpy array one cell at a time
+
+    Returns:
+    --------
+    move_table: ((int))
+        move_table[cell][k] is get_neighbours(height, width)[cell, k]
+    '''
+    return tuple(tuple(row) for row in get_neighbours(height, width).tolist())
+
+@lru_cache(maxsize=None)
+def get_wall_mask(height, width):
+    '''
+    Moves leaving the board
+
+    Returns:
+    --------
+    wall_mask: np.array(height * width, 4) of bool
+        wall_mask[cell, k] is True if the direction DELTAS[k] leads outside of the board from cell
+    '''
+    return _read_only(get_neighbours(height, width) == OFF_BOARD)
+
+@lru_cache(maxsize=None)
+def get_manhattan_distances(height, width):
+    '''
+    Manhattan distance between every pair of cells
+
+    Returns:
+    --------
+    distances: np.array(height * width, height * width) of int16
+    '''
+    rows, columns = np.divmod(np.arange(height * width), width)
+    distances = np.abs(rows[:, None] - rows[None, :]) + np.abs(columns[:, None] - columns[None, :])
+    return _read_only(distances.astype(np.int16))
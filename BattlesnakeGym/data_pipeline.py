@@ -0,0 +1,241 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import glob
+import os
+import queue
+import threading
+from functools import partial
+
+import numpy as np
+
+from vec_env import is_episode_over
+
+COLUMNS = ["observation", "action", "reward", "done", "legal_mask"]
+
+def random_policy(observation, legal_mask, rng=None):
+    '''
+    Policy choosing a random legal action for each snake
+
+    Parameters:
+    ----------
+    rng: np.random.Generator, optional
+        Random number generator of the actions, np.random is used if None
+    '''
+    if rng is None:
+        rng = np.random
+    random_values = rng.random(legal_mask.shape) * legal_mask
+    return np.argmax(random_values, axis=1)
+
+def generate_transitions(env_fn, policy=None, number_of_episodes=None, seed=None):
+    '''
+    Generator running BattlesnakeGym episodes and yielding each transition.
+
+    Parameters:
+    ----------
+    env_fn: callable
+        Function creating the BattlesnakeGym
+    policy: callable, optional, default=None
+        policy(observation, legal_mask) returns an action for each snake.
+        If None, random_policy with a generator seeded by seed
+    number_of_episodes: int, optional, default=None
+        Number of episodes to run. If None, episodes are generated forever
+    seed: int, optional, default=None
+        Seed of the default random_policy
+
+    Yields:
+    -------
+    observation: np.array(observation_space.shape)
+    action: np.array(number_of_snakes)
+    reward: np.array(number_of_snakes)
+    done: np.array(number_of_snakes)
+        True if the snake is dead or if the episode is over
+    legal_mask: np.array(number_of_snakes, 4)
+        The allowed actions in observation (see BattlesnakeGym.get_action_mask)
+    '''
+    if policy is None:
+        policy = partial(random_policy, rng=np.random.default_rng(seed))
+    env = env_fn()
+    episode = 0
+    while number_of_episodes is None or episode < number_of_episodes:
+        observation, _, _, info = env.reset()
+        legal_mask = info["action_mask"]
+        episode_over = False
+        while not episode_over:
+            action = np.asarray(policy(observation, legal_mask))
+            next_observation, reward, dones, info = env.step(action)
+            episode_over = is_episode_over(dones)
+            reward = np.array([reward[i] for i in range(env.number_of_snakes)])
+            done = np.array([dones[i] or episode_over for i in range(env.number_of_snakes)])
+            yield observation, action, reward, done, legal_mask
+
+            observation = next_observation
+            legal_mask = info["action_mask"]
+        episode += 1
+    env.close()
+
+class ShardWriter:
+    '''
+    Writes transitions into fixed-size chunks saved as compressed columnar .npz shards.
+    The shards are compressed and written by a background thread. At most max_queued_chunks
+    chunks wait to be written (add blocks otherwise), so the memory used is bounded.
+
+    Parameters:
+    ----------
+    directory: str
+    chunk_size: int, optional, default=4096
+        Number of transitions in each shard
+    max_queued_chunks: int, optional, default=4
+    prefix: str, optional, default="shard"
+    '''
+    def __init__(self, directory, chunk_size=4096, max_queued_chunks=4, prefix="shard"):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self.prefix = prefix
+        os.makedirs(directory, exist_ok=True)
+
+        self.number_of_shards = len(glob.glob(os.path.join(directory, "{}-*.npz".format(prefix))))
+        self.number_of_transitions = 0
+        self._chunk = None
+        self._chunk_length = 0
+
+        self._queue = queue.Queue(maxsize=max_queued_chunks)
+        self._error = None
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._thread.start()
+
+    def _write_loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            path, chunk = item
+            if self._error is not None:
+                continue
+            try:
+                # Write to a temporary file so readers never see a partial shard
+                temporary_path = path + ".tmp"
+                with open(temporary_path, "wb") as f:
+                    np.savez_compressed(f, **chunk)
+                os.replace(temporary_path, path)
+            except Exception as error:
+                self._error = error
+
+    def _check_error(self):
+        if self._error is not None:
+            raise RuntimeError("Failed to write a shard") from self._error
+
+    def add(self, observation, action, reward, done, legal_mask):
+        '''
+        Add a transition (as yielded by generate_transitions)
+        '''
+        self._check_error()
+        values = (observation, action, reward, done, legal_mask)
+        if self._chunk is None:
+            self._chunk = {}
+            for column, value in zip(COLUMNS, values):
+                value = np.asarray(value)
+                self._chunk[column] = np.empty((self.chunk_size,) + value.shape, dtype=value.dtype)
+        for column, value in zip(COLUMNS, values):
+            self._chunk[column][self._chunk_length] = value
+        self._chunk_length += 1
+        self.number_of_transitions += 1
+        if self._chunk_length == self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        '''
+        Send the current (possibly partial) chunk to the writer thread
+        '''
+        if self._chunk is None or self._chunk_length == 0:
+            return
+        chunk = {column: values[:self._chunk_length] for column, values in self._chunk.items()}
+        path = os.path.join(self.directory, "{}-{:06d}.npz".format(self.prefix, self.number_of_shards))
+        self._queue.put((path, chunk))
+        self.number_of_shards += 1
+        self._chunk = None
+        self._chunk_length = 0
+
+    def close(self):
+        '''
+        Write the remaining transitions and wait for the writer thread
+        '''
+        self.flush()
+        self._queue.put(None)
+        self._thread.join()
+        self._check_error()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def write_shards(transitions, directory, chunk_size=4096, max_queued_chunks=4, prefix="shard"):
+    '''
+    Consume transitions (e.g., from generate_transitions) and write them into shards.
+
+    Returns:
+    --------
+    number_of_transitions: int
+    '''
+    with ShardWriter(directory, chunk_size, max_queued_chunks, prefix) as writer:
+        for transition in transitions:
+            writer.add(*transition)
+    return writer.number_of_transitions
+
+def iterate_shards(directory, batch_size, shards_in_memory=2, seed=None, drop_last=False):
+    '''
+    Streaming loader of the shards written by ShardWriter. The order of the shards is
+    shuffled and the transitions of shards_in_memory shards at a time are shuffled together,
+    only those shards are held in memory.
+
+    Parameters:
+    ----------
+    directory: str
+    batch_size: int
+    shards_in_memory: int, optional, default=2
+    seed: int, optional, default=None
+    drop_last: bool, optional, default=False
+        Whether to drop the last incomplete batch
+
+    Yields:
+    -------
+    batch: {str: np.array}
+        The columns of batch_size transitions (see COLUMNS)
+    '''
+    rng = np.random.default_rng(seed)
+    paths = sorted(glob.glob(os.path.join(directory, "*.npz")))
+    rng.shuffle(paths)
+
+    leftover = None
+    for start in range(0, len(paths), shards_in_memory):
+        shards = []
+        for path in paths[start:start + shards_in_memory]:
+            with np.load(path) as shard:
+                shards.append({column: shard[column] for column in shard.files})
+        if leftover is not None:
+            shards.append(leftover)
+        columns = {column: np.concatenate([shard[column] for shard in shards]) for column in shards[0]}
+
+        number_of_transitions = len(columns[COLUMNS[0]])
+        permutation = rng.permutation(number_of_transitions)
+        number_of_full_batches = number_of_transitions // batch_size
+        for batch in range(number_of_full_batches):
+            indexes = permutation[batch * batch_size:(batch + 1) * batch_size]
+            yield {column: values[indexes] for column, values in columns.items()}
+        indexes = permutation[number_of_full_batches * batch_size:]
+        leftover = {column: values[indexes] for column, values in columns.items()}
+
+    if leftover is not None and len(leftover[COLUMNS[0]]) > 0 and not drop_last:
+        yield leftover
@@ -0,0 +1,297 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import bisect
+import mmap
+import os
+import struct
+from array import array
+from collections import deque
+
+import numpy as np
+
+# Binary episode format (little endian)
+#
+# File header: magic "BSEP", uint8 version, uint16 map height, uint16 map width, uint8 number of snakes
+#
+# Followed by records, each starting with a uint8 record type and a uint32 payload size:
+# - KEYFRAME, written at the start of each episode:
+#     uint16 turn
+#     for each snake: uint8 is alive, uint8 health, uint16 length, uint16 cells[length] (tail to head)
+#     uint16 number of food, uint16 food cells
+# - TURN, written after each step:
+#     uint16 turn
+#     for each snake: uint8 flags (see _MOVED, _TAIL_POPPED, _DIED), uint8 health, uint16 new head cell
+#     uint16 number of food added, uint16 food cells added
+#     uint16 number of food removed, uint16 food cells removed
+#
+# Cells are stored as i * map_width + j.
+
+MAGIC = b"BSEP"
+VERSION = 1
+_FILE_HEADER = struct.Struct("<4sBHHB")
+_RECORD_HEADER = struct.Struct("<BI")
+_TURN = struct.Struct("<H")
+_SNAKE_KEYFRAME = struct.Struct("<BBH")
+_SNAKE_TURN = struct.Struct("<BBH")
+_COUNT = struct.Struct("<H")
+
+KEYFRAME = 1
+TURN = 2
+
+_MOVED = 1
+_TAIL_POPPED = 2
+_DIED = 4
+_NO_CELL = 0xFFFF
+
+class EpisodeRecorder:
+    '''
+    Records the episodes of a BattlesnakeGym into a compact append-only binary file.
+    Call record_reset after each env.reset() and record_step after each env.step().
+    Only the changes of each turn are written: the new heads, the tails popped,
+    the deaths and the food added or removed.
+
+    Parameters:
+    ----------
+    path: str
+        File to append the episodes to. If the file exists, its map size and number of snakes
+        must be identical
+    map_size: (int, int)
+    number_of_snakes: int
+    '''
+    def __init__(self, path, map_size, number_of_snakes):
+        self.path = path
+        self.map_size = tuple(map_size)
+        self.number_of_snakes = number_of_snakes
+
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            with open(path, "rb") as f:
+                header = _FILE_HEADER.unpack(f.read(_FILE_HEADER.size))
+            if header != (MAGIC, VERSION, self.map_size[0], self.map_size[1], number_of_snakes):
+                raise ValueError("{} was recorded with a different version, map size or number of snakes".format(path))
+            self.file = open(path, "ab")
+        else:
+            self.file = open(path, "wb")
+            self.file.write(_FILE_HEADER.pack(MAGIC, VERSION, self.map_size[0], self.map_size[1],
+                                              number_of_snakes))
+
+        self._bodies = None
+        self._food = None
+
+    def _get_food_cells(self, env):
+        return set(np.flatnonzero(env.food.get_food_map().ravel()).tolist())
+
+    def _write_record(self, record_type, payload):
+        self.file.write(_RECORD_HEADER.pack(record_type, len(payload)))
+        self.file.write(payload)
+
+    def record_reset(self, env):
+        '''
+        Record the full state of the gym, to be called after env.reset()
+        '''
+        payload = [_TURN.pack(env.turn_count)]
+        self._bodies = []
+        for snake in env.snakes.get_snakes():
+            body = deque(snake.cells)
+            self._bodies.append(body)
+            payload.append(_SNAKE_KEYFRAME.pack(snake.is_alive(), snake.health, len(body)))
+            payload.append(array("H", body).tobytes())
+
+        self._food = self._get_food_cells(env)
+        payload.append(_COUNT.pack(len(self._food)))
+        payload.append(array("H", sorted(self._food)).tobytes())
+        self._write_record(KEYFRAME, b"".join(payload))
+
+    def record_step(self, env):
+        '''
+        Record the changes of the last turn, to be called after env.step()
+        '''
+        if self._bodies is None:
+            raise RuntimeError("record_reset must be called before record_step")
+
+        payload = [_TURN.pack(env.turn_count)]
+        for body, snake in zip(self._bodies, env.snakes.get_snakes()):
+            flags = 0
+            head_cell = _NO_CELL
+            if len(body) > 0 and not snake.is_alive():
+                flags = _DIED
+                body.clear()
+            elif snake.is_alive():
+                flags = _MOVED
+                head_cell = snake.get_head_cell()
+                # The snake grew by one (new head) unless its tail was removed
+                if len(body) + 1 - len(snake.cells) == 1:
+                    flags |= _TAIL_POPPED
+                    body.popleft()
+                body.append(head_cell)
+            payload.append(_SNAKE_TURN.pack(flags, snake.health, head_cell))
+
+        food = self._get_food_cells(env)
+        food_added = sorted(food - self._food)
+        food_removed = sorted(self._food - food)
+        self._food = food
+        payload.append(_COUNT.pack(len(food_added)))
+        payload.append(array("H", food_added).tobytes())
+        payload.append(_COUNT.pack(len(food_removed)))
+        payload.append(array("H", food_removed).tobytes())
+        self._write_record(TURN, b"".join(payload))
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class EpisodeReader:
+    '''
+    Reads a file written by EpisodeRecorder. The file is memory-mapped: only the record
+    headers are scanned when opening it, turns are decoded on demand.
+
+    Parameters:
+    ----------
+    path: str
+    '''
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, height, width, number_of_snakes = _FILE_HEADER.unpack_from(self.mmap, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("{} is not an episode file of version {}".format(path, VERSION))
+        self.map_size = (height, width)
+        self.number_of_snakes = number_of_snakes
+
+        # Index the records by hopping from record header to record header
+        offsets = []
+        self.episode_starts = []
+        offset = _FILE_HEADER.size
+        while offset + _RECORD_HEADER.size <= len(self.mmap):
+            record_type, size = _RECORD_HEADER.unpack_from(self.mmap, offset)
+            if offset + _RECORD_HEADER.size + size > len(self.mmap):
+                break # Truncated record, e.g., the recorder is still writing
+            if record_type == KEYFRAME:
+                self.episode_starts.append(len(offsets))
+            offsets.append(offset)
+            offset += _RECORD_HEADER.size + size
+        self.offsets = np.array(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def _read_cells(self, offset, count):
+        cells = np.frombuffer(self.mmap, dtype="<u2", count=count, offset=offset).tolist()
+        return cells, offset + 2*count
+
+    def _apply_record(self, index, state):
+        '''
+        Helper function to apply a record to the state (bodies, healths, food, turn)
+        '''
+        offset = int(self.offsets[index])
+        record_type, _ = _RECORD_HEADER.unpack_from(self.mmap, offset)
+        offset += _RECORD_HEADER.size
+        state["turn"], = _TURN.unpack_from(self.mmap, offset)
+        offset += _TURN.size
+
+        if record_type == KEYFRAME:
+            state["bodies"] = []
+            state["health"] = []
+            for _ in range(self.number_of_snakes):
+                _, health, length = _SNAKE_KEYFRAME.unpack_from(self.mmap, offset)
+                offset += _SNAKE_KEYFRAME.size
+                body, offset = self._read_cells(offset, length)
+                state["bodies"].append(deque(body))
+                state["health"].append(health)
+            count, = _COUNT.unpack_from(self.mmap, offset)
+            food, _ = self._read_cells(offset + _COUNT.size, count)
+            state["food"] = set(food)
+        elif record_type == TURN:
+            for k in range(self.number_of_snakes):
+                flags, health, head_cell = _SNAKE_TURN.unpack_from(self.mmap, offset)
+                offset += _SNAKE_TURN.size
+                body = state["bodies"][k]
+                if flags & _DIED:
+                    body.clear()
+                elif flags & _MOVED:
+                    if flags & _TAIL_POPPED:
+                        body.popleft()
+                    body.append(head_cell)
+                state["health"][k] = health
+            count, = _COUNT.unpack_from(self.mmap, offset)
+            food_added, offset = self._read_cells(offset + _COUNT.size, count)
+            count, = _COUNT.unpack_from(self.mmap, offset)
+            food_removed, offset = self._read_cells(offset + _COUNT.size, count)
+            state["food"].update(food_added)
+            state["food"].difference_update(food_removed)
+        else:
+            raise ValueError("Unknown record type {} at offset {}".format(record_type, offset))
+
+    def _to_json(self, state):
+        '''
+        Helper function to convert the state into the representation of BattlesnakeGym.get_json
+        '''
+        width = self.map_size[1]
+        food_list = []
+        for cell in sorted(state["food"]):
+            y, x = divmod(cell, width)
+            food_list.append({"x": x, "y": y})
+
+        snake_dict_list = []
+        for i, (body, health) in enumerate(zip(state["bodies"], state["health"])):
+            snake_location = []
+            for cell in reversed(body):
+                y, x = divmod(cell, width)
+                snake_location.append({"x": x, "y": y})
+            snake_dict_list.append({"health": health, "body": snake_location,
+                                    "id": i, "name": "Snake {}".format(i)})
+
+        return {"turn": state["turn"],
+                "board": {"height": self.map_size[0],
+                          "width": self.map_size[1],
+                          "food": food_list,
+                          "snakes": snake_dict_list}}
+
+    def iter_turns(self, start=0):
+        '''
+        Iterate over the turns recorded, starting from the record index start.
+        Each turn is in the same representation as BattlesnakeGym.get_json.
+        '''
+        if len(self) == 0:
+            return
+        state = {}
+        first = self.episode_starts[bisect.bisect_right(self.episode_starts, start) - 1]
+        for index in range(first, len(self)):
+            self._apply_record(index, state)
+            if index >= start:
+                yield self._to_json(state)
+
+    def get_turn(self, index):
+        '''
+        Rebuild the turn of the record index, in the same representation as
+        BattlesnakeGym.get_json. The turn is rebuilt from the keyframe of its episode.
+        '''
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return next(self.iter_turns(start=index))
+
+    def close(self):
+        self.mmap.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
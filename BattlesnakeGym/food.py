@@ -12,7 +12,6 @@
 # permissions and limitations under the License.
 
 import math
-import random
 
 import numpy as np
 from utils import get_random_coordinates, generate_coordinate_list_from_binary_map
@@ -26,15 +25,26 @@ class Food:
         Parameter to force food to spawn in certain positions. Used for testing
         Food will spawn in the coordinates provided in the list until the list is exhausted.
         After the list is exhausted, food will be randomly spawned
+    food_spawn_chance: float optional
+        Chance of spawning a food at the end of each turn
+    minimum_food: int optional
+        Food is spawned at the end of each turn until there are at least minimum_food on the map
+    rng: np.random.Generator optional
+        Random number generator used to spawn food, np.random is used if None
     '''
 
-    def __init__(self, map_size, food_spawn_locations=[], food_spawn_chance=0.15):
+    def __init__(self, map_size, food_spawn_locations=[], food_spawn_chance=0.15, minimum_food=0,
+                 rng=None):
         self.map_size = map_size
         self.locations_map = np.zeros(shape=(map_size[0], map_size[1]))
 
         self.food_spawn_locations = food_spawn_locations
 
         self.FOOD_SPAWN_CHANCE = food_spawn_chance
+        self.MINIMUM_FOOD = minimum_food
+        self.rng = np.random if rng is None else rng
+
+        self.free_cells = None
 
     @classmethod
     def make_from_list(cls, map_size, food_list):
@@ -52,7 +62,20 @@ class Food:
             cls.locations_map[i, j] = 1
         return cls
 
-    def spawn_food(self, snake_map):
+    def attach_free_cells(self, free_cells):
+        '''
+        Function to keep free_cells updated with the food. Once attached, food is randomly
+        spawned by sampling free_cells instead of scanning the snake map.
+
+        Parameters:
+        ----------
+        free_cells: FreeCells
+        '''
+        self.free_cells = free_cells
+        for location in np.argwhere(self.locations_map == 1):
+            self.free_cells.occupy(location)
+
+    def spawn_food(self, snake_map=None, n=1):
         '''
         Helper function to generate another food.
         
@@ -60,26 +83,53 @@ class Food:
         ----------
         snake_map, np.array(map_size[0], map_size[1], 1)
             The map of the location of each snake, generated by Snakes.get_snake_binary_map
+            Only required if free cells were not attached (see attach_free_cells)
+
+        n: int, optional, default=1
+            Number of food to spawn
         '''
         # if we have any locations to spawn food, do so (and them remove that)
-        if len(self.food_spawn_locations) > 0:
-            locations = [self.food_spawn_locations[0]]
-            self.food_spawn_locations = self.food_spawn_locations[1:]
+        number_of_forced_locations = min(n, len(self.food_spawn_locations))
+        locations = list(self.food_spawn_locations[:number_of_forced_locations])
+        self.food_spawn_locations = self.food_spawn_locations[number_of_forced_locations:]
         # otherwise, random spawn
-        else:
-            snake_locations = generate_coordinate_list_from_binary_map(snake_map)
-            locations = get_random_coordinates(self.map_size, 1, excluding=snake_locations)
+        number_of_random_locations = n - number_of_forced_locations
+        if number_of_random_locations > 0:
+            if self.free_cells is not None:
+                locations += self.free_cells.sample(number_of_random_locations)
+            else:
+                snake_locations = generate_coordinate_list_from_binary_map(snake_map)
+                locations += list(get_random_coordinates(self.map_size, number_of_random_locations,
+                                                         excluding=snake_locations, rng=self.rng))
         # update location map
         for location in locations:
-            self.locations_map[location[0], location[1]] = 1
+            self.add_food_to_coord(location)
+
+    def spawn_minimum_food(self, snake_map=None):
+        '''
+        Helper function to spawn food until there are at least self.MINIMUM_FOOD on the map.
+
+        Returns:
+        --------
+        number_of_food_spawned: int
+        '''
+        if self.MINIMUM_FOOD <= 0:
+            return 0
+        number_of_missing_food = self.MINIMUM_FOOD - int(np.count_nonzero(self.locations_map))
+        if number_of_missing_food <= 0:
+            return 0
+        self.spawn_food(snake_map, n=number_of_missing_food)
+        return number_of_missing_food
         
-    def end_of_turn(self, snake_locations):
+    def end_of_turn(self, snake_locations=None):
         '''
         Function to be called at the end of each step. 
         Adapted from 
         https://github.com/BattlesnakeOfficial/rules/blob/44b6b946661d42401f5a33b74303cd9071d0db18/standard.go#L392
         '''
-        if random.random() < self.FOOD_SPAWN_CHANCE:
+        if self.spawn_minimum_food(snake_locations) > 0:
+            return
+        if self.rng.random() < self.FOOD_SPAWN_CHANCE:
             self.spawn_food(snake_locations)
                     
     def get_food_map(self):
@@ -106,8 +156,22 @@ class Food:
 
         return self.locations_map[coord[0], coord[1]] == 1
 
+    def add_food_to_coord(self, coord):
+        '''
+        Function to add a food at coord
+        '''
+        if self.locations_map[coord[0], coord[1]] == 1:
+            return
+        self.locations_map[coord[0], coord[1]] = 1
+        if self.free_cells is not None:
+            self.free_cells.occupy(coord)
+
     def remove_food_from_coord(self, coord):
         '''
         Function to remove a food present at coord
         '''
+        if self.locations_map[coord[0], coord[1]] == 0:
+            return
         self.locations_map[coord[0], coord[1]] = 0
+        if self.free_cells is not None:
+            self.free_cells.release(coord)
@@ -0,0 +1,132 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import numpy as np
+
+class FreeCells:
+    '''
+    Index of the cells of the map that are not occupied by a snake or a food.
+    The index is updated incrementally as snakes move and food is spawned or eaten so that
+    random free cells can be sampled in O(1).
+
+    Cells are identified by i * map_size[1] + j. The free cells are stored at the start of a
+    dense list (self.cells[:self.number_of_free_cells]) and self.positions maps each cell to its
+    position in the dense list. A cell can be occupied several times (e.g., a stacked snake body
+    at the start of the game) so the number of occupants of each cell is also kept.
+
+    Parameters
+    ----------
+    map_size: (int, int)
+    rng: np.random.Generator, optional
+        Random number generator used to sample free cells, np.random is used if None
+    '''
+    def __init__(self, map_size, rng=None):
+        self.map_size = map_size
+        self.rng = np.random if rng is None else rng
+        number_of_cells = map_size[0] * map_size[1]
+        self.cells = list(range(number_of_cells))
+        self.positions = list(range(number_of_cells))
+        self.occupancy = [0] * number_of_cells
+        self.number_of_free_cells = number_of_cells
+
+    def __len__(self):
+        return self.number_of_free_cells
+
+    def _get_cell(self, coord):
+        '''
+        Helper function to convert a coordinate into a cell. Returns None if the
+        coordinate is outside of the map
+        '''
+        i, j = coord
+        if 0 <= i < self.map_size[0] and 0 <= j < self.map_size[1]:
+            return int(i) * self.map_size[1] + int(j)
+        return None
+
+    def _swap(self, position1, position2):
+        cell1 = self.cells[position1]
+        cell2 = self.cells[position2]
+        self.cells[position1] = cell2
+        self.cells[position2] = cell1
+        self.positions[cell2] = position1
+        self.positions[cell1] = position2
+
+    def occupy(self, coord):
+        '''
+        Mark a coordinate as occupied by one more snake segment or food.
+        Coordinates outside of the map are ignored.
+        '''
+        cell = self._get_cell(coord)
+        if cell is not None:
+            self.occupy_cell(cell)
+
+    def occupy_cell(self, cell):
+        '''
+        occupy with a cell id, the cell OFF_BOARD (-1) is ignored
+        '''
+        if cell < 0:
+            return
+        self.occupancy[cell] += 1
+        if self.occupancy[cell] == 1:
+            # Move the cell to the end of the free cells and shrink them
+            self.number_of_free_cells -= 1
+            self._swap(self.positions[cell], self.number_of_free_cells)
+
+    def release(self, coord):
+        '''
+        Mark a coordinate as occupied by one less snake segment or food.
+        Coordinates outside of the map are ignored.
+        '''
+        cell = self._get_cell(coord)
+        if cell is not None:
+            self.release_cell(cell)
+
+    def release_cell(self, cell):
+        '''
+        release with a cell id, the cell OFF_BOARD (-1) is ignored
+        '''
+        if cell < 0:
+            return
+        self.occupancy[cell] -= 1
+        if self.occupancy[cell] == 0:
+            # Move the cell to the end of the free cells and grow them
+            self._swap(self.positions[cell], self.number_of_free_cells)
+            self.number_of_free_cells += 1
+
+    def is_free(self, coord):
+        cell = self._get_cell(coord)
+        return cell is not None and self.occupancy[cell] == 0
+
+    def sample(self, n=1):
+        '''
+        Sample n distinct free coordinates. The cells are not occupied by this function.
+        If there are less than n free cells, all the free cells are returned.
+
+        Returns:
+        --------
+        coordinates: [(int, int)]
+        '''
+        n = min(n, self.number_of_free_cells)
+        coordinates = []
+        for k in range(n):
+            # Partial Fisher-Yates shuffle of the free cells
+            self._swap(k, k + int(self.rng.random() * (self.number_of_free_cells - k)))
+            coordinates.append(divmod(self.cells[k], self.map_size[1]))
+        return coordinates
+
+    def get_free_map(self):
+        '''
+        Returns a binary image of size map_size indicating the free cells
+        '''
+        free_map = np.zeros(self.map_size[0] * self.map_size[1], dtype=np.uint8)
+        free_map[self.cells[:self.number_of_free_cells]] = 1
+        return free_map.reshape(self.map_size)
@@ -11,10 +11,8 @@
 # express or implied. See the License for the specific language governing 
 # permissions and limitations under the License.
 
-from snake import Snakes
+from snake import Snake, Snakes
 from food import Food
-import pandas as pd
-import string
 import numpy as np
 
 class Game_state_parser:
@@ -34,7 +32,21 @@ class Game_state_parser:
         self.map_size = (self.board_dict["height"], self.board_dict["width"]) 
         self.number_of_snakes = len(self.board_dict["snakes"])
                 
-    def parse(self):     
+    def parse(self, rng=None):
+        '''
+        Build the classes of the gym for the game state
+
+        Parameters:
+        -----------
+        rng: np.random.Generator, optional
+            Random number generator used to pick the colours of the snakes, np.random is used if None
+
+        Returns:
+        --------
+        snakes: Snakes
+        food: Food
+        turn_count: int
+        '''
         # Get food locations
         food_locations = []
         for food_location in self.board_dict["food"]:
@@ -42,8 +54,189 @@ class Game_state_parser:
             food_locations.append((y, x))
         
         food = Food.make_from_list(self.map_size, food_locations)
-        snakes = Snakes.make_from_dict(self.map_size, self.board_dict["snakes"])
+        snakes = Snakes.make_from_dict(self.map_size, self.board_dict["snakes"], rng=rng)
 
         turn_count = self.game_dict["turn"]
 
         return snakes, food, turn_count
+
+class GameStateBatch:
+    '''
+    Batch of game states stacked into arrays, generated by parse_batch.
+    All the states have the same map size. States with less snakes than the batch are padded
+    with dead snakes (length 0).
+
+    Attributes:
+    ----------
+    map_size: (int, int)
+    turns: np.array(batch_size)
+    bodies: np.array(batch_size, number_of_snakes, max_length)
+        Cells of the body of each snake (i * map_size[1] + j, with i = y and j = x),
+        ordered from the head to the tail as in the battlesnake engine and padded with -1
+    lengths: np.array(batch_size, number_of_snakes)
+    health: np.array(batch_size, number_of_snakes)
+    food: np.array(batch_size, map_size[0], map_size[1])
+        Binary images of the locations of the food
+    you: np.array(batch_size)
+        Index of the "you" snake of each state, -1 if the state has no "you" snake
+    snake_ids: [[str]]
+    snake_names: [[str]]
+    '''
+    def __init__(self, map_size, turns, bodies, lengths, health, food, you, snake_ids, snake_names):
+        self.map_size = map_size
+        self.turns = turns
+        self.bodies = bodies
+        self.lengths = lengths
+        self.health = health
+        self.food = food
+        self.you = you
+        self.snake_ids = snake_ids
+        self.snake_names = snake_names
+        self.number_of_snakes = bodies.shape[1]
+
+    def __len__(self):
+        return len(self.turns)
+
+    def get_body_coordinates(self, index, snake_index):
+        '''
+        Get the body of a snake as a list of (i, j) coordinates, from the head to the tail
+        '''
+        body = self.bodies[index, snake_index, :self.lengths[index, snake_index]]
+        return list(zip(*np.divmod(body, self.map_size[1])))
+
+    def parse(self, index, rng=None):
+        '''
+        Build the classes of the gym for a state of the batch, in the same form as
+        Game_state_parser.parse. Use BattlesnakeGym.load_game_state to seed a gym with them.
+
+        Parameters:
+        -----------
+        index: int
+        rng: np.random.Generator, optional
+            Random number generator used to pick the colours of the snakes, np.random is used if None
+
+        Returns:
+        --------
+        snakes: Snakes
+        food: Food
+        turn_count: int
+        '''
+        snakes = Snakes(self.map_size, 0, rng=rng)
+        snakes.number_of_snakes = self.number_of_snakes
+        for snake_index in range(self.number_of_snakes):
+            locations = [(int(i), int(j)) for i, j in self.get_body_coordinates(index, snake_index)]
+            snakes.snakes.append(Snake.make_from_list(locations, int(self.health[index, snake_index]),
+                                                      self.map_size, rng=rng))
+        food_locations = [tuple(location) for location in np.argwhere(self.food[index]).tolist()]
+        food = Food.make_from_list(self.map_size, food_locations)
+        return snakes, food, int(self.turns[index])
+
+    def to_game_dict(self, index):
+        '''
+        Build the dictionary of a state of the batch in the form of the battlesnake engine
+        (https://docs.battlesnake.com/references/api), e.g., to be searched by main.move
+        '''
+        snake_dicts = []
+        for snake_index in range(self.number_of_snakes):
+            if self.lengths[index, snake_index] == 0:
+                continue
+            body = [{"x": int(j), "y": int(i)} for i, j in self.get_body_coordinates(index, snake_index)]
+            snake_dicts.append({"id": self.snake_ids[index][snake_index],
+                                "name": self.snake_names[index][snake_index],
+                                "health": int(self.health[index, snake_index]),
+                                "body": body,
+                                "head": body[0],
+                                "length": len(body)})
+
+        food = [{"x": int(j), "y": int(i)} for i, j in np.argwhere(self.food[index]).tolist()]
+        game_dict = {"turn": int(self.turns[index]),
+                     "board": {"height": self.map_size[0], "width": self.map_size[1],
+                               "food": food, "hazards": [], "snakes": snake_dicts}}
+        you = self.you[index]
+        if you >= 0:
+            you_id = self.snake_ids[index][you]
+            game_dict["you"] = next(snake for snake in snake_dicts if snake["id"] == you_id)
+        return game_dict
+
+def parse_batch(game_dicts):
+    '''
+    Parse a list (or any iterable, e.g., a stream) of game states in the form of the battlesnake
+    engine into a GameStateBatch in a single pass.
+
+    Parameters:
+    ----------
+    game_dicts: iterable of dict
+        https://docs.battlesnake.com/references/api
+
+    Returns:
+    --------
+    batch: GameStateBatch
+    '''
+    map_size = None
+    turns, you, snake_ids, snake_names = [], [], [], []
+    cells, lengths, health = [], [], []
+    food_states, food_cells = [], []
+    number_of_snakes = 0
+
+    for index, game_dict in enumerate(game_dicts):
+        board_dict = game_dict["board"]
+        state_map_size = (board_dict["height"], board_dict["width"])
+        if map_size is None:
+            map_size = state_map_size
+        elif state_map_size != map_size:
+            raise ValueError("All the game states of a batch must have the same map size, "
+                             "got {} and {}".format(map_size, state_map_size))
+        width = map_size[1]
+
+        turns.append(game_dict.get("turn", 0))
+        state_snake_ids, state_snake_names, state_lengths, state_health = [], [], [], []
+        for snake_index, snake_dict in enumerate(board_dict["snakes"]):
+            body = snake_dict["body"]
+            cells.extend(location["y"] * width + location["x"] for location in body)
+            state_lengths.append(len(body))
+            state_health.append(snake_dict["health"])
+            state_snake_ids.append(snake_dict.get("id", snake_index))
+            state_snake_names.append(snake_dict.get("name", "Snake {}".format(snake_index)))
+        lengths.append(state_lengths)
+        health.append(state_health)
+        snake_ids.append(state_snake_ids)
+        snake_names.append(state_snake_names)
+        number_of_snakes = max(number_of_snakes, len(state_lengths))
+
+        you_id = game_dict["you"].get("id") if "you" in game_dict else None
+        you.append(state_snake_ids.index(you_id) if you_id in state_snake_ids else -1)
+
+        for location in board_dict["food"]:
+            food_states.append(index)
+            food_cells.append(location["y"] * width + location["x"])
+
+    if map_size is None:
+        raise ValueError("Cannot parse an empty batch of game states")
+    batch_size = len(turns)
+
+    # Pad the states with less snakes with dead snakes
+    padded_lengths = np.zeros((batch_size, number_of_snakes), dtype=np.int32)
+    padded_health = np.zeros((batch_size, number_of_snakes), dtype=np.int16)
+    for index in range(batch_size):
+        padded_lengths[index, :len(lengths[index])] = lengths[index]
+        padded_health[index, :len(health[index])] = health[index]
+        missing = number_of_snakes - len(snake_ids[index])
+        snake_ids[index] += [None] * missing
+        snake_names[index] += [None] * missing
+
+    # Scatter the concatenated bodies into the padded (state, snake, segment) array
+    flat_lengths = padded_lengths.ravel()
+    max_length = int(flat_lengths.max()) if flat_lengths.size > 0 else 0
+    bodies = np.full((batch_size * number_of_snakes, max_length), -1, dtype=np.int32)
+    starts = np.cumsum(flat_lengths) - flat_lengths
+    rows = np.repeat(np.arange(len(flat_lengths)), flat_lengths)
+    columns = np.arange(len(cells)) - np.repeat(starts, flat_lengths)
+    bodies[rows, columns] = cells
+    bodies = bodies.reshape(batch_size, number_of_snakes, max_length)
+
+    food = np.zeros((batch_size, map_size[0] * map_size[1]), dtype=np.uint8)
+    food[food_states, food_cells] = 1
+
+    return GameStateBatch(map_size, np.array(turns, dtype=np.int32), bodies, padded_lengths,
+                          padded_health, food.reshape(batch_size, map_size[0], map_size[1]),
+                          np.array(you, dtype=np.int32), snake_ids, snake_names)
@@ -1,75 +1,461 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
-# 
+#
 # Licensed under the Apache License, Version 2.0 (the "License").
 # You may not use this file except in compliance with the License.
 # A copy of the License is located at
-# 
+#
 #     http://www.apache.org/licenses/LICENSE-2.0
-# 
-# or in the "license" file accompanying this file. This file is distributed 
-# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either 
-# express or implied. See the License for the specific language governing 
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
 # permissions and limitations under the License.
 
+"""
+Benchmark suite of the BattlesnakeGym.
+
+Each scenario (map size, number of snakes, policy and starting state) is run for a number of
+warmup steps followed by repeated trials. The step, reset and observation throughputs, the memory
+allocated per step and the peak RSS are reported and can be saved as JSON to be compared with
+the results of another commit:
+
+    python measure_performance.py --output before.json
+    python measure_performance.py --output after.json --compare before.json
+"""
+
+import argparse
+import datetime
+import json
 import os
+import platform
+import resource
+import subprocess
+import sys
 import time
+import tracemalloc
+from functools import partial
 
+import numpy as np
 
 from snake_gym import BattlesnakeGym
-from snake import Snake
+from snake import Snake, Snakes
+from food import Food
+from vec_env import SubprocVecEnv, is_episode_over
 
-from test_utils import simulate_snake
+RESULTS_VERSION = 1
 
+# Metrics compared by --compare, and whether higher values are better
+COMPARED_METRICS = {"steps_per_second": True,
+                    "resets_per_second": True,
+                    "observations_per_second": True,
+                    "collision_checks_per_second": True,
+                    "action_masks_per_second": True,
+                    "allocated_bytes_per_step": False}
 
-def test_gym_performance(map_sizes, number_of_snakes):
+
+def random_policy(env, rng):
+    """
+    Random action allowed by the action mask of the environment for each snake
     """
-    Measure the performance of the gym in steps per seconds
+    action_mask = env.get_action_mask()
+    return np.argmax(rng.random(action_mask.shape) * action_mask, axis=1)
+
 
-    :param map_sizes: [()]
-    :param number_of_snakes: []
-    :return:
+def safe_policy(env, rng):
     """
+    Random action avoiding the walls and the cells occupied by snakes, so that the snakes
+    survive longer than with random_policy. Falls back to random_policy if no action is safe
+    """
+    actions = random_policy(env, rng)
+    for i, snake in enumerate(env.snakes.get_snakes()):
+        if not snake.is_alive():
+            continue
+        head = snake.get_head()
+        safe_actions = []
+        for action in (Snake.UP, Snake.DOWN, Snake.LEFT, Snake.RIGHT):
+            if snake.is_facing_opposite_of_direction(action):
+                continue
+            new_head = snake._translate_coordinate_in_direction(head, action)
+            if env.free_cells.is_free(new_head) or \
+                    (env.free_cells._get_cell(new_head) is not None and env.food.does_coord_have_food(new_head)):
+                safe_actions.append(action)
+        if len(safe_actions) > 0:
+            actions[i] = safe_actions[rng.integers(len(safe_actions))]
+    return actions
 
-    max_turns_num = 100
-    for map_size in map_sizes:
-        for num_snakes in number_of_snakes:
-            # Create the snakes one after each others
-            snake_locations = []
-            i = 0
-            j = 0
-            for _ in range(num_snakes):
-                snake_locations.append([i, j])
-                if j >= map_size[1] - 2:
-                    i += 1
-                    j = 0
-                else:
-                    j += 1
-                if i >= map_size[0] - 2:
-                    raise Exception("Incompatible map size and number of snakes")
 
-            # Create the food always in the same spot
-            food_location = [(map_size[0]-1, map_size[1]-1)]*max_turns_num*max_turns_num
-            print(snake_locations)
-            # Create the gym
-            env = BattlesnakeGym(map_size=map_size, number_of_snakes=num_snakes,
-                                 snake_spawn_locations=snake_locations,
-                                 food_spawn_locations=food_location)
+SCRIPTED_LOOP = [Snake.RIGHT, Snake.DOWN, Snake.LEFT, Snake.UP]
 
-            actions =[[Snake.RIGHT]*num_snakes,
-                 [Snake.DOWN]*num_snakes,
-                 [Snake.LEFT]*num_snakes,
-                 [Snake.UP]*num_snakes] * max_turns_num
 
-            tic = time.time()
-            _, _, _, info = simulate_snake(env, actions, render=False)
-            toc = time.time()
+def scripted_policy(env, rng):
+    """
+    Every snake moves in a loop (right, down, left, up), as in the original benchmark
+    """
+    return np.full(env.number_of_snakes, SCRIPTED_LOOP[env.turn_count % len(SCRIPTED_LOOP)])
 
-            print("Map Size {}, Num Snake {}, Num Turns {}, Total time: {:.4f}s, Steps per seconds {:.4f}".format(
-                map_size, num_snakes, info['current_turn'], toc-tic, info['current_turn']/(toc-tic)))
 
+def get_loop_spawn_locations(map_size, num_snakes):
+    """
+    Spawn locations of snakes every 3 cells, so that the 2x2 loops of scripted_policy do not overlap
+
+    :param map_size: ()
+    :param num_snakes: int
+    :return: [[int, int]]
+    """
+    snake_locations = [[i, j] for i in range(0, map_size[0] - 1, 3) for j in range(0, map_size[1] - 1, 3)]
+    if len(snake_locations) < num_snakes:
+        raise Exception("Incompatible map size and number of snakes")
+    return snake_locations[:num_snakes]
+
+
+def load_endgame_state(env, fill_ratio=0.6):
+    """
+    Load an endgame in env: each snake is a long body winding through its own horizontal band of
+    the map, together covering about fill_ratio of the cells. Used to measure the gym with
+    long snakes.
+
+    :param env: BattlesnakeGym
+    :param fill_ratio: float
+    """
+    height, width = env.map_size
+    band_height = height // env.number_of_snakes
+    rows_filled = max(1, int(band_height * fill_ratio))
+    snake_list = []
+    for k in range(env.number_of_snakes):
+        locations = []
+        for i in range(k * band_height, k * band_height + rows_filled):
+            columns = range(width) if (i - k * band_height) % 2 == 0 else range(width - 1, -1, -1)
+            locations += [(i, j) for j in columns]
+        # Snake.make_from_list expects the head first
+        snake_list.append(Snake.make_from_list(locations[::-1], Snake.FULL_HEALTH, env.map_size))
+
+    snakes = Snakes(env.map_size, 0)
+    snakes.number_of_snakes = env.number_of_snakes
+    snakes.snakes = snake_list
+    food = Food(env.map_size, food_spawn_chance=env.food_spawn_chance)
+    env.load_game_state(snakes, food, turn_count=0)
+
+
+# Scenarios of the benchmark. Each scenario is given by the arguments of BattlesnakeGym, its policy,
+# and whether the games start from an endgame (see load_endgame_state) instead of env.reset()
+SCENARIOS = {
+    "7x7-1snake-random": dict(map_size=(7, 7), number_of_snakes=1, policy="random"),
+    "7x7-2snakes-safe": dict(map_size=(7, 7), number_of_snakes=2, policy="safe"),
+    "11x11-4snakes-random": dict(map_size=(11, 11), number_of_snakes=4, policy="random"),
+    "11x11-4snakes-safe": dict(map_size=(11, 11), number_of_snakes=4, policy="safe"),
+    "11x11-4snakes-scripted": dict(map_size=(11, 11), number_of_snakes=4, policy="scripted"),
+    "15x15-8snakes-safe": dict(map_size=(15, 15), number_of_snakes=8, policy="safe"),
+    "19x19-4snakes-safe": dict(map_size=(19, 19), number_of_snakes=4, policy="safe"),
+    "19x19-8snakes-random": dict(map_size=(19, 19), number_of_snakes=8, policy="random"),
+    "25x25-8snakes-safe": dict(map_size=(25, 25), number_of_snakes=8, policy="safe"),
+    "11x11-2snakes-endgame": dict(map_size=(11, 11), number_of_snakes=2, policy="safe", endgame=True),
+    "19x19-4snakes-endgame": dict(map_size=(19, 19), number_of_snakes=4, policy="safe", endgame=True),
+}
+
+
+def make_scenario(scenario, seed):
+    """
+    Create the gym, the policy and the function starting a new game of a scenario
+
+    :param scenario: {}, element of SCENARIOS
+    :param seed: int
+    :return: (BattlesnakeGym, callable, callable)
+    """
+    map_size = scenario["map_size"]
+    num_snakes = scenario["number_of_snakes"]
+    if scenario["policy"] == "scripted":
+        # Without food, the snakes loop until they starve
+        env = BattlesnakeGym(map_size=map_size, number_of_snakes=num_snakes,
+                             snake_spawn_locations=get_loop_spawn_locations(map_size, num_snakes),
+                             food_spawn_chance=0.0, seed=seed)
+        policy = scripted_policy
+    else:
+        env = BattlesnakeGym(map_size=map_size, number_of_snakes=num_snakes, seed=seed)
+        policy = safe_policy if scenario["policy"] == "safe" else random_policy
+
+    if scenario.get("endgame", False):
+        load_endgame_state(env)
+        endgame_state = env.get_state()
+        start_game = partial(env.set_state, endgame_state)
+    else:
+        start_game = env.reset
+    return env, policy, start_game
+
+
+def run_steps(env, policy, start_game, rng, num_steps, measure_allocations=False):
+    """
+    Step the gym num_steps times, starting a new game when a game is over.
+    Only the time spent in env.step is measured.
+
+    :return: (float, int, int) step time in seconds, number of games started,
+        total bytes allocated at the peak of each step (if measure_allocations)
+    """
+    step_time = 0.0
+    allocated_bytes = 0
+    num_games = 0
+    game_over = True
+    for _ in range(num_steps):
+        if game_over:
+            start_game()
+            num_games += 1
+        actions = policy(env, rng)
+        if measure_allocations:
+            tracemalloc.reset_peak()
+            memory_before, _ = tracemalloc.get_traced_memory()
+        tic = time.perf_counter()
+        _, _, dones, _ = env.step(actions)
+        step_time += time.perf_counter() - tic
+        if measure_allocations:
+            _, peak = tracemalloc.get_traced_memory()
+            allocated_bytes += peak - memory_before
+        game_over = is_episode_over(dones)
+    return step_time, num_games, allocated_bytes
+
+
+def time_calls(function, num_calls):
+    """
+    :return: float, calls per second
+    """
+    tic = time.perf_counter()
+    for _ in range(num_calls):
+        function()
+    return num_calls / (time.perf_counter() - tic)
+
+
+def get_midgame_state(env, policy, start_game, rng, num_turns=30):
+    """
+    Snapshot of a game played for num_turns turns (or until it is over), used to time the
+    phases of step on snakes that have left their starting position
+
+    :return: np.array, see BattlesnakeGym.get_state
+    """
+    start_game()
+    for _ in range(num_turns):
+        _, _, dones, _ = env.step(policy(env, rng))
+        if is_episode_over(dones):
+            break
+    return env.get_state()
 
-if __name__ == '__main__':
-    map_sizes = [(8, 8), (10, 10), (12, 12), (14, 14), (20, 20)]
-    number_of_snakes = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
-    test_gym_performance(map_sizes, number_of_snakes)
 
+def check_collisions(env):
+    """
+    The collision checks of a step: BattlesnakeGym._did_snake_collide for each snake alive
+    """
+    for snake in env.snakes.get_snakes():
+        if snake.is_alive():
+            env._did_snake_collide(snake, [])
+
+
+def get_peak_rss_kb():
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak_rss //= 1024 # bytes on macOS
+    return peak_rss
+
+
+def summarise(values):
+    return {"median": float(np.median(values)), "min": float(np.min(values)), "max": float(np.max(values))}
+
+
+def run_scenario(name, scenario, num_steps, num_trials, num_warmup_steps, num_resets,
+                 num_observations, num_allocation_steps, seed, profile_dir=None, num_micro_calls=2000):
+    """
+    Run the benchmark of a scenario. If profile_dir is given, the phases of step and reset are
+    also profiled over num_steps steps and exported as <profile_dir>/<name>.folded for flamegraph tools.
+    The collision checks and action masks of a step are timed (num_micro_calls calls per trial)
+    on a midgame snapshot (see get_midgame_state)
+
+    :return: {} results of the scenario
+    """
+    env, policy, start_game = make_scenario(scenario, seed)
+    rng = np.random.default_rng(seed)
+
+    run_steps(env, policy, start_game, rng, num_warmup_steps)
+    midgame_state = get_midgame_state(env, policy, start_game, np.random.default_rng(seed))
+
+    steps_per_second, resets_per_second, observations_per_second, turns_per_game = [], [], [], []
+    collision_checks_per_second, action_masks_per_second = [], []
+    for _ in range(num_trials):
+        step_time, num_games, _ = run_steps(env, policy, start_game, rng, num_steps)
+        steps_per_second.append(num_steps / step_time)
+        turns_per_game.append(num_steps / num_games)
+        resets_per_second.append(time_calls(start_game, num_resets))
+        observations_per_second.append(time_calls(env.get_observation, num_observations))
+        env.set_state(midgame_state)
+        collision_checks_per_second.append(time_calls(partial(check_collisions, env), num_micro_calls))
+        action_masks_per_second.append(time_calls(env.get_action_mask, num_micro_calls))
+
+    tracemalloc.start()
+    _, _, allocated_bytes = run_steps(env, policy, start_game, rng, num_allocation_steps,
+                                      measure_allocations=True)
+    tracemalloc.stop()
+
+    if profile_dir is not None:
+        env.enable_profiling()
+        run_steps(env, policy, start_game, rng, num_steps)
+        os.makedirs(profile_dir, exist_ok=True)
+        env.export_profile(os.path.join(profile_dir, "{}.folded".format(name)))
+        print(env.profile_report())
+        env.disable_profiling()
+    env.close()
+
+    return {"map_size": list(scenario["map_size"]),
+            "number_of_snakes": scenario["number_of_snakes"],
+            "policy": scenario["policy"],
+            "endgame": scenario.get("endgame", False),
+            "steps_per_second": summarise(steps_per_second),
+            "resets_per_second": summarise(resets_per_second),
+            "observations_per_second": summarise(observations_per_second),
+            "collision_checks_per_second": summarise(collision_checks_per_second),
+            "action_masks_per_second": summarise(action_masks_per_second),
+            "allocated_bytes_per_step": {"median": allocated_bytes / max(1, num_allocation_steps)},
+            "turns_per_game": summarise(turns_per_game),
+            "peak_rss_kb": get_peak_rss_kb()}
+
+
+def get_metadata():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"version": RESULTS_VERSION,
+            "commit": commit,
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count()}
+
+
+def compare_results(results, baseline, threshold):
+    """
+    Print the relative change of each metric against the baseline results.
+
+    :param results: {} results of this run
+    :param baseline: {} results loaded from the JSON of another run
+    :param threshold: float, relative change considered as a regression
+    :return: [str] names of the regressed metrics
+    """
+    regressions = []
+    print("\nComparison with commit {}".format(baseline["metadata"].get("commit")))
+    for name, scenario_results in results["scenarios"].items():
+        if name not in baseline["scenarios"]:
+            continue
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if metric not in baseline["scenarios"][name]:
+                # Metric added after the baseline was recorded
+                continue
+            value = scenario_results[metric]["median"]
+            baseline_value = baseline["scenarios"][name][metric]["median"]
+            if baseline_value == 0:
+                continue
+            change = (value - baseline_value) / baseline_value
+            regressed = (-change if higher_is_better else change) > threshold
+            if regressed:
+                regressions.append("{} {}".format(name, metric))
+            print("{:<24} {:<25} {:>14.1f} -> {:>14.1f} ({:+.1%}){}".format(
+                name, metric, baseline_value, value, change, "  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def test_vec_env_performance(map_size, num_snakes, numbers_of_envs, num_steps=2000):
+    """
+    Measure the throughput of SubprocVecEnv in total environment steps per seconds
+    (summed over the environments) for different numbers of worker processes
+
+    :param map_size: ()
+    :param num_snakes: int
+    :param numbers_of_envs: []
+    :param num_steps: int, number of steps taken by each environment
+    :return: {int: float} steps per seconds for each number of environments
+    """
+    env_fn = partial(BattlesnakeGym, map_size=map_size, number_of_snakes=num_snakes)
+    results = {}
+    for num_envs in numbers_of_envs:
+        vec_env = SubprocVecEnv([env_fn] * num_envs, seed=0)
+        vec_env.reset()
+        actions = np.random.randint(0, 4, size=(num_steps, num_envs, num_snakes))
+
+        tic = time.time()
+        for step in range(num_steps):
+            vec_env.step(actions[step])
+        toc = time.time()
+        vec_env.close()
+
+        results[num_envs] = num_envs*num_steps/(toc-tic)
+        print("Map Size {}, Num Snake {}, Num Envs {}, Total time: {:.4f}s, Steps per seconds {:.4f}".format(
+            map_size, num_snakes, num_envs, toc-tic, results[num_envs]))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark suite of the BattlesnakeGym")
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS),
+                        help="Scenarios to run (default: all), see --list")
+    parser.add_argument("--list", action="store_true", help="List the scenarios and exit")
+    parser.add_argument("--steps", type=int, default=2000, help="Steps per trial")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--warmup-steps", type=int, default=200)
+    parser.add_argument("--resets", type=int, default=200, help="Resets timed per trial")
+    parser.add_argument("--observations", type=int, default=2000, help="Observations timed per trial")
+    parser.add_argument("--allocation-steps", type=int, default=200,
+                        help="Steps traced with tracemalloc to measure the allocations")
+    parser.add_argument("--micro-calls", type=int, default=2000,
+                        help="Collision checks and action masks timed per trial")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of the JSON file to write the results to")
+    parser.add_argument("--compare", help="JSON results of another run to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="Relative change of a metric considered as a regression by --compare")
+    parser.add_argument("--vec-env", action="store_true", help="Also measure SubprocVecEnv")
+    parser.add_argument("--profile-dir",
+                        help="Profile the phases of step and reset and write collapsed stacks to this directory")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, scenario in SCENARIOS.items():
+            print(name, scenario)
+        return 0
+
+    unknown_scenarios = [name for name in args.scenarios if name not in SCENARIOS]
+    if len(unknown_scenarios) > 0:
+        parser.error("unknown scenarios {}".format(unknown_scenarios))
+
+    results = {"metadata": get_metadata(), "scenarios": {}}
+    for name in args.scenarios:
+        scenario_results = run_scenario(name, SCENARIOS[name], args.steps, args.trials,
+                                        args.warmup_steps, args.resets, args.observations,
+                                        args.allocation_steps, args.seed, args.profile_dir,
+                                        args.micro_calls)
+        results["scenarios"][name] = scenario_results
+        print("{:<24} steps/s {:>9.1f}  resets/s {:>9.1f}  observations/s {:>9.1f}  "
+              "collisions/s {:>9.1f}  masks/s {:>9.1f}  "
+              "bytes/step {:>9.1f}  turns/game {:>6.1f}  peak RSS {} kB".format(
+                name, scenario_results["steps_per_second"]["median"],
+                scenario_results["resets_per_second"]["median"],
+                scenario_results["observations_per_second"]["median"],
+                scenario_results["collision_checks_per_second"]["median"],
+                scenario_results["action_masks_per_second"]["median"],
+                scenario_results["allocated_bytes_per_step"]["median"],
+                scenario_results["turns_per_game"]["median"],
+                scenario_results["peak_rss_kb"]))
+
+    if args.vec_env:
+        numbers_of_envs = [n for n in [1, 2, 4, 8, 16] if n <= (os.cpu_count() or 1)]
+        results["vec_env"] = test_vec_env_performance((11, 11), 4, numbers_of_envs)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare is not None:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if len(compare_results(results, baseline, args.threshold)) > 0:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
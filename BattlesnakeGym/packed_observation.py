@@ -0,0 +1,123 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import numpy as np
+
+# Packed observation format (1D uint8 array), used by the "flat-packed" observation types
+#
+# - the binary planes of the food and of the body of each snake (including the head), in this
+#   order, each plane of map_size[0] x map_size[1] cells in row major order, packed with
+#   np.packbits (8 cells per byte)
+# - the head cell of each snake as a little endian uint16 (i * map_size[1] + j), NO_HEAD if the
+#   snake is dead
+# - optionally ("flat-packed-health"), the health of each snake as a uint8
+#
+# Unpacking gives the "flat-51s" observation: 1 for the food and the bodies, 5 for the heads.
+
+NO_HEAD = 0xFFFF
+HEAD_VALUE = 5
+
+def get_number_of_plane_bytes(map_size, number_of_snakes):
+    return (map_size[0] * map_size[1] * (number_of_snakes + 1) + 7) // 8
+
+def get_packed_size(map_size, number_of_snakes, include_health=False):
+    '''
+    Number of bytes of a packed observation
+    '''
+    size = get_number_of_plane_bytes(map_size, number_of_snakes) + 2 * number_of_snakes
+    if include_health:
+        size += number_of_snakes
+    return size
+
+def pack_observation(planes, heads, health=None, out=None):
+    '''
+    Pack an observation.
+
+    Parameters:
+    ----------
+    planes: np.array(number_of_snakes + 1, map_size[0], map_size[1])
+        Non zero where there is food (plane 0) or the body of snake k (plane k + 1)
+    heads: [int]
+        Head cell of each snake, NO_HEAD if the snake is dead
+    health: [int], optional, default=None
+        Health of each snake, only stored if not None
+    out: np.array(packed size, uint8), optional, default=None
+
+    Returns:
+    --------
+    packed: np.array(packed size, uint8)
+    '''
+    number_of_snakes = planes.shape[0] - 1
+    map_size = planes.shape[1:]
+    if out is None:
+        out = np.empty(get_packed_size(map_size, number_of_snakes, health is not None), dtype=np.uint8)
+    number_of_plane_bytes = get_number_of_plane_bytes(map_size, number_of_snakes)
+    out[:number_of_plane_bytes] = np.packbits(planes.ravel() != 0)
+    heads_end = number_of_plane_bytes + 2 * number_of_snakes
+    out[number_of_plane_bytes:heads_end] = np.asarray(heads, dtype="<u2").view(np.uint8)
+    if health is not None:
+        out[heads_end:heads_end + number_of_snakes] = np.clip(health, 0, 255)
+    return out
+
+def unpack_observations(packed, map_size, number_of_snakes, include_health=False):
+    '''
+    Unpack a batch of packed observations.
+
+    Parameters:
+    ----------
+    packed: np.array(batch_size, packed size) of uint8
+    map_size: (int, int)
+    number_of_snakes: int
+    include_health: bool, optional, default=False
+        Whether the observations hold the health of the snakes ("flat-packed-health")
+
+    Returns:
+    --------
+    observations: np.array(batch_size, map_size[0], map_size[1], number_of_snakes + 1) of uint8
+        The observations in the "flat-51s" format
+    health: np.array(batch_size, number_of_snakes) of uint8, or None if include_health is False
+    '''
+    packed = np.asarray(packed, dtype=np.uint8)
+    batch_size = packed.shape[0]
+    height, width = map_size
+    number_of_cells = height * width
+    number_of_plane_bytes = get_number_of_plane_bytes(map_size, number_of_snakes)
+
+    bits = np.unpackbits(packed[:, :number_of_plane_bytes], axis=1,
+                         count=number_of_cells * (number_of_snakes + 1))
+    observations = np.ascontiguousarray(
+        bits.reshape(batch_size, number_of_snakes + 1, height, width).transpose(0, 2, 3, 1))
+
+    heads_end = number_of_plane_bytes + 2 * number_of_snakes
+    heads = np.ascontiguousarray(packed[:, number_of_plane_bytes:heads_end]).view("<u2")
+    observation_indexes, snake_indexes = np.nonzero(heads != NO_HEAD)
+    head_cells = heads[observation_indexes, snake_indexes].astype(np.intp)
+    observations[observation_indexes, head_cells // width, head_cells % width, snake_indexes + 1] = HEAD_VALUE
+
+    health = None
+    if include_health:
+        health = packed[:, heads_end:heads_end + number_of_snakes].copy()
+    return observations, health
+
+def unpack_observation(packed, map_size, number_of_snakes, include_health=False):
+    '''
+    Unpack a single packed observation, see unpack_observations.
+
+    Returns:
+    --------
+    observation: np.array(map_size[0], map_size[1], number_of_snakes + 1) of uint8
+    health: np.array(number_of_snakes) of uint8, or None if include_health is False
+    '''
+    observations, health = unpack_observations(np.asarray(packed)[None], map_size, number_of_snakes,
+                                               include_health)
+    return observations[0], None if health is None else health[0]
@@ -0,0 +1,113 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import time
+
+class PhaseProfiler:
+    '''
+    Accumulates the time spent and the number of calls of named phases.
+
+    Phases are named by their stack of frames separated by ";" (e.g., "step;move"), phases
+    nested in "step" are recorded in addition to "step" itself. Typical use:
+
+        start = profiler.clock()
+        ...
+        start = profiler.record("step;move", start)
+        ...
+        profiler.record("step;observation", start)
+    '''
+    SEPARATOR = ";"
+
+    def __init__(self):
+        self.clock = time.perf_counter
+        self.reset()
+
+    def reset(self):
+        '''
+        Clear the recorded times and counts
+        '''
+        self.times = {}
+        self.counts = {}
+
+    def record(self, phase, start):
+        '''
+        Record the time elapsed since start in phase.
+
+        Parameters:
+        ----------
+        phase: str
+        start: float
+            Value of self.clock() at the start of the phase
+
+        Returns:
+        --------
+        now: float
+            Value of self.clock() at the end of the phase, to be used as the start of the next phase
+        '''
+        now = self.clock()
+        self.times[phase] = self.times.get(phase, 0.0) + now - start
+        self.counts[phase] = self.counts.get(phase, 0) + 1
+        return now
+
+    def _get_self_times(self):
+        '''
+        Helper function to get the time of each phase excluding the time of its nested phases
+        '''
+        self_times = dict(self.times)
+        for phase, phase_time in self.times.items():
+            parent = phase.rpartition(self.SEPARATOR)[0]
+            if parent in self_times:
+                self_times[parent] -= phase_time
+        return self_times
+
+    def report(self):
+        '''
+        Summarise the phases recorded.
+
+        Returns:
+        --------
+        report: str
+            Table of the calls, total time, time per call and share of the parent phase of each phase
+        '''
+        lines = ["{:<32} {:>10} {:>12} {:>13} {:>8}".format("phase", "calls", "total (ms)", "per call (us)", "share")]
+        for phase in sorted(self.times):
+            parent = phase.rpartition(self.SEPARATOR)[0]
+            parent_time = self.times.get(parent, self.times[phase])
+            share = self.times[phase] / parent_time if parent_time > 0 else 0.0
+            depth = phase.count(self.SEPARATOR)
+            name = "  " * depth + phase.rpartition(self.SEPARATOR)[2]
+            lines.append("{:<32} {:>10} {:>12.3f} {:>13.3f} {:>8.1%}".format(
+                name, self.counts[phase], 1e3 * self.times[phase],
+                1e6 * self.times[phase] / self.counts[phase], share))
+        return "\n".join(lines)
+
+    def get_collapsed_stacks(self):
+        '''
+        Export the phases in the collapsed stack format read by flamegraph tools
+        (e.g., flamegraph.pl, inferno or speedscope): one line per phase with its frames
+        separated by ";" and its own time in microseconds.
+
+        Returns:
+        --------
+        collapsed_stacks: str
+        '''
+        lines = []
+        for phase, self_time in sorted(self._get_self_times().items()):
+            microseconds = int(round(1e6 * self_time))
+            if microseconds > 0:
+                lines.append("{} {}".format(phase, microseconds))
+        return "\n".join(lines) + "\n"
+
+    def write_collapsed_stacks(self, path):
+        with open(path, "w") as f:
+            f.write(self.get_collapsed_stacks())
@@ -0,0 +1,154 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import numpy as np
+
+class BoardRenderer:
+    '''
+    Renders the state of the gym (generated by BattlesnakeGym._get_state) as an rgb image.
+
+    Each cell is given a label (empty, food, body of snake k or head of snake k) and the image
+    is built by looking up the tile of each label and copying the tiles into the board with
+    array indexing. The tiles are built once from masks and the snake colours.
+
+    Parameters:
+    ----------
+    map_size: (int, int)
+    number_of_snakes: int
+    '''
+    BOUNDARY = 20
+    BOX_SIZE = 40
+    SPACE_BETWEEN_BOXES = 10
+    BOX_COLOUR = 255 * 0.7
+    FOOD_COLOUR = [255, 0, 0]
+    HEAD_COLOUR = [255, 255, 255]
+    FOOD_MARGIN = int(BOX_SIZE / 5)
+    HEAD_MARGIN = 10
+
+    EMPTY_LABEL = 0
+    FOOD_LABEL = 1
+    FIRST_SNAKE_LABEL = 2
+
+    def __init__(self, map_size, number_of_snakes):
+        self.map_size = tuple(map_size)
+        self.number_of_snakes = number_of_snakes
+
+        cell_size = self.BOX_SIZE + self.SPACE_BETWEEN_BOXES
+        self.board_shape = (map_size[0] * cell_size + 2 * self.BOUNDARY,
+                            map_size[1] * cell_size + 2 * self.BOUNDARY, 3)
+        self.background = np.full(self.board_shape, 255, dtype=np.uint8)
+
+        self.food_mask = self._get_margin_mask(self.FOOD_MARGIN)
+        self.head_mask = self._get_margin_mask(self.HEAD_MARGIN)
+
+        self._tiles = None
+        self._tiles_colours = None
+
+    def _get_margin_mask(self, margin):
+        '''
+        Helper function to get a mask of a box excluding a margin on each side
+        '''
+        mask = np.zeros((self.BOX_SIZE, self.BOX_SIZE), dtype=bool)
+        mask[margin:self.BOX_SIZE - margin, margin:self.BOX_SIZE - margin] = True
+        return mask
+
+    def _get_tiles(self, snake_colours):
+        '''
+        Helper function to get the tile of each label, rebuilt only if the snake colours changed.
+
+        Returns:
+        --------
+        tiles: np.array(2 + 2*number_of_snakes, BOX_SIZE, BOX_SIZE, 3)
+            Labels 2...number_of_snakes+1 are the bodies of the snakes and
+            the following number_of_snakes labels are the heads of the snakes
+        '''
+        colours = tuple(tuple(int(c) for c in colour) for colour in snake_colours)
+        if self._tiles is not None and colours == self._tiles_colours:
+            return self._tiles
+
+        number_of_labels = self.FIRST_SNAKE_LABEL + 2 * self.number_of_snakes
+        tiles = np.empty((number_of_labels, self.BOX_SIZE, self.BOX_SIZE, 3), dtype=np.uint8)
+        tiles[self.EMPTY_LABEL] = self.BOX_COLOUR
+        tiles[self.FOOD_LABEL] = self.BOX_COLOUR
+        tiles[self.FOOD_LABEL][self.food_mask] = self.FOOD_COLOUR
+        for k, colour in enumerate(colours):
+            body_label = self.FIRST_SNAKE_LABEL + k
+            head_label = body_label + self.number_of_snakes
+            tiles[body_label] = colour
+            tiles[head_label] = colour
+            tiles[head_label][self.head_mask] = self.HEAD_COLOUR
+
+        self._tiles = tiles
+        self._tiles_colours = colours
+        return tiles
+
+    def get_labels(self, state):
+        '''
+        Get the label of each cell of the state.
+
+        Parameters:
+        ----------
+        state: np.array(map_size[0], map_size[1], number_of_snakes + 1)
+            Generated by BattlesnakeGym._get_state
+
+        Returns:
+        --------
+        labels: np.array(map_size[0], map_size[1])
+        '''
+        snake_state = state[:, :, 1:]
+        has_body = (snake_state == 1).any(axis=2)
+        has_head = (snake_state == 5).any(axis=2)
+        # As in the original renderer, the cell takes the colour of the snake with the
+        # largest value in the cell
+        snake_present_in = np.argmax(snake_state, axis=2)
+
+        labels = np.zeros(self.map_size, dtype=np.intp)
+        labels[state[:, :, 0] >= 1] = self.FOOD_LABEL
+        has_snake = has_body | has_head
+        labels[has_snake] = self.FIRST_SNAKE_LABEL + snake_present_in[has_snake]
+        labels[has_head] += self.number_of_snakes
+        return labels
+
+    def render(self, state, snake_colours, out=None):
+        '''
+        Render the state as an rgb image.
+
+        Parameters:
+        ----------
+        state: np.array(map_size[0], map_size[1], number_of_snakes + 1)
+            Generated by BattlesnakeGym._get_state
+        snake_colours: [[int, int, int]]
+            Colour of each snake
+        out: np.array(board_shape, uint8), optional, default=None
+            Array to write the image into, e.g., a frame of a preallocated video buffer
+
+        Returns:
+        --------
+        board: np.array(board_shape, uint8)
+        '''
+        if out is None:
+            board = self.background.copy()
+        else:
+            board = out
+            board[...] = self.background
+
+        tiles = self._get_tiles(snake_colours)
+        labels = self.get_labels(state)
+
+        cell_size = self.BOX_SIZE + self.SPACE_BETWEEN_BOXES
+        height, width = self.map_size
+        cells = board[self.BOUNDARY:self.BOUNDARY + height * cell_size,
+                      self.BOUNDARY:self.BOUNDARY + width * cell_size]
+        cells = cells.reshape(height, cell_size, width, cell_size, 3)
+        cells[:, :self.BOX_SIZE, :, :self.BOX_SIZE] = tiles[labels].transpose(0, 2, 1, 3, 4)
+        return board
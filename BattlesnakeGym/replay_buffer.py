@@ -0,0 +1,380 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import json
+import os
+
+import numpy as np
+
+# Replay buffer directory layout
+#
+# - metadata.json: the shapes and dtypes of the columns, the capacity, the write index and the
+#   number of transitions stored. It is only rewritten by ReplayBuffer.flush, after the columns.
+# - <column>.npy: one preallocated .npy file per column (see get_columns), memory-mapped by the
+#   writer and the readers, so the buffer can be much larger than the RAM.
+#
+# A buffer can be reopened by a ReplayBuffer after a restart (the transitions added after the
+# last flush are discarded) and sampled by any number of ReplayBufferReader in other processes.
+
+VERSION = 1
+METADATA_FILE = "metadata.json"
+
+def get_columns(observation_shape, observation_dtype, number_of_snakes, prioritized):
+    '''
+    Shape and dtype of each column of a transition
+
+    Returns:
+    --------
+    columns: {str: ((int), np.dtype)}
+    '''
+    columns = {
+        "observation": (tuple(observation_shape), np.dtype(observation_dtype)),
+        "action": ((number_of_snakes,), np.dtype(np.int8)),
+        "reward": ((number_of_snakes,), np.dtype(np.float32)),
+        "done": ((number_of_snakes,), np.dtype(bool)),
+        "legal_mask": ((number_of_snakes, 4), np.dtype(bool)),
+        "next_observation": (tuple(observation_shape), np.dtype(observation_dtype)),
+    }
+    if prioritized:
+        columns["priority"] = ((), np.dtype(np.float64))
+    return columns
+
+class SumTree:
+    '''
+    Binary tree where each node holds the sum of the priorities of its leaves, used to sample
+    transitions with a probability proportional to their priority in O(log(capacity)).
+    Updates and searches are vectorised over batches of leaves.
+
+    Parameters:
+    ----------
+    capacity: int
+    '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.leaf_start = 1 << max(0, (capacity - 1).bit_length())
+        self.tree = np.zeros(2 * self.leaf_start, dtype=np.float64)
+
+    def total(self):
+        return self.tree[1]
+
+    def build(self, priorities):
+        '''
+        Rebuild the whole tree from the priorities of the leaves
+        '''
+        self.tree[:] = 0
+        self.tree[self.leaf_start:self.leaf_start + len(priorities)] = priorities
+        size = self.leaf_start
+        while size > 1:
+            size //= 2
+            self.tree[size:2*size] = self.tree[2*size:4*size:2] + self.tree[2*size+1:4*size:2]
+
+    def update(self, indexes, priorities):
+        '''
+        Set the priorities of the leaves indexes
+        '''
+        nodes = np.asarray(indexes, dtype=np.int64) + self.leaf_start
+        self.tree[nodes] = priorities
+        while nodes[0] > 1:
+            nodes = np.unique(nodes // 2)
+            self.tree[nodes] = self.tree[2*nodes] + self.tree[2*nodes + 1]
+
+    def find(self, values):
+        '''
+        Find the leaves where the cumulative sum of the priorities reaches values
+
+        Parameters:
+        ----------
+        values: np.array(batch_size)
+            Values in [0, total())
+
+        Returns:
+        --------
+        indexes: np.array(batch_size) of int
+        '''
+        values = np.array(values, dtype=np.float64)
+        nodes = np.ones(len(values), dtype=np.int64)
+        while nodes[0] < self.leaf_start:
+            left = self.tree[2*nodes]
+            # Never go right into an empty subtree (possible when values round up to the total)
+            go_right = (values >= left) & (self.tree[2*nodes + 1] > 0)
+            values = np.where(go_right, values - left, values)
+            nodes = 2*nodes + go_right
+        return np.minimum(nodes - self.leaf_start, self.capacity - 1)
+
+class ReplayBufferReader:
+    '''
+    Read-only view of a replay buffer written by a ReplayBuffer, e.g., in another process.
+    The columns are memory-mapped: sampling only reads the transitions of the minibatch.
+    Call refresh to see the transitions flushed by the writer since the buffer was opened.
+
+    Parameters:
+    ----------
+    directory: str
+    seed: int, optional, default=None
+        Seed of the random number generator used for sampling
+    '''
+    _MODE = "r"
+
+    def __init__(self, directory, seed=None):
+        self.directory = directory
+        self.rng = np.random.default_rng(seed)
+        metadata = self._read_metadata()
+        self.capacity = metadata["capacity"]
+        self.number_of_snakes = metadata["number_of_snakes"]
+        self.prioritized = metadata["prioritized"]
+        self.columns = get_columns(metadata["observation_shape"], metadata["observation_dtype"],
+                                   self.number_of_snakes, self.prioritized)
+        self.arrays = {column: np.lib.format.open_memmap(self._get_column_path(column), mode=self._MODE)
+                       for column in self.columns}
+        self.sum_tree = SumTree(self.capacity) if self.prioritized else None
+        self._load_metadata(metadata)
+
+    def _get_column_path(self, column):
+        return os.path.join(self.directory, column + ".npy")
+
+    def _read_metadata(self):
+        with open(os.path.join(self.directory, METADATA_FILE)) as f:
+            metadata = json.load(f)
+        if metadata["version"] != VERSION:
+            raise ValueError("{} is not a replay buffer of version {}".format(self.directory, VERSION))
+        return metadata
+
+    def _load_metadata(self, metadata):
+        self.index = metadata["index"]
+        self.size = metadata["size"]
+        self.max_priority = metadata["max_priority"]
+        if self.prioritized:
+            self.sum_tree.build(self.arrays["priority"][:self.size])
+
+    def refresh(self):
+        '''
+        Reload the write index and the number of transitions flushed by the writer
+        '''
+        self._load_metadata(self._read_metadata())
+
+    def __len__(self):
+        return self.size
+
+    def get_transitions(self, indexes):
+        '''
+        Read the transitions indexes
+
+        Returns:
+        --------
+        batch: {str: np.array}
+            The columns of the transitions (see get_columns)
+        '''
+        return {column: np.asarray(array[indexes]) for column, array in self.arrays.items()}
+
+    def sample(self, batch_size, beta=0.4):
+        '''
+        Sample a minibatch of transitions, uniformly or proportionally to their priority
+        if the buffer is prioritized.
+
+        Parameters:
+        ----------
+        batch_size: int
+        beta: float, optional, default=0.4
+            Exponent of the importance sampling weights of a prioritized buffer
+
+        Returns:
+        --------
+        batch: {str: np.array}
+            The columns of the transitions (see get_columns) and their "indexes" in the buffer.
+            A prioritized buffer also returns the importance sampling "weights" (normalised by
+            their maximum) of the transitions
+        '''
+        if self.size == 0:
+            raise ValueError("Cannot sample from an empty replay buffer")
+        if self.prioritized:
+            total = self.sum_tree.total()
+            # Stratified sampling: one value in each of batch_size segments of the total priority
+            values = (np.arange(batch_size) + self.rng.random(batch_size)) * (total / batch_size)
+            indexes = self.sum_tree.find(values)
+        else:
+            indexes = self.rng.integers(0, self.size, size=batch_size)
+        # Reading the memory maps in order keeps the accesses sequential
+        indexes.sort()
+
+        batch = self.get_transitions(indexes)
+        batch["indexes"] = indexes
+        if self.prioritized:
+            probabilities = self.sum_tree.tree[indexes + self.sum_tree.leaf_start] / total
+            weights = (self.size * probabilities) ** -beta
+            batch["weights"] = (weights / weights.max()).astype(np.float32)
+        return batch
+
+    def close(self):
+        # The files are unmapped once the last view of the memory maps is released
+        self.arrays = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class ReplayBuffer(ReplayBufferReader):
+    '''
+    Circular replay buffer of BattlesnakeGym transitions backed by preallocated memory-mapped
+    files. Once capacity transitions are stored, the oldest transitions are overwritten.
+    If directory already holds a buffer, it is reopened (e.g., to resume training after
+    a restart) and its capacity, shapes and dtypes must be identical.
+
+    The gym can write its next observation straight into the buffer:
+
+        observation, _, _, info = env.reset()
+        while ...:
+            next_observation, reward, dones, info = env.step(actions, out=buffer.get_next_observation_slot())
+            buffer.add(observation, actions, reward, dones, legal_mask)
+            observation = next_observation
+
+    Parameters:
+    ----------
+    directory: str
+    capacity: int
+    observation_space: gym.spaces.Box
+        Observation space of the gym (e.g., env.observation_space)
+    number_of_snakes: int
+    prioritized: Bool, optional, default=False
+        Whether to sample the transitions proportionally to their priority (see update_priorities)
+    seed: int, optional, default=None
+        Seed of the random number generator used for sampling
+    '''
+    _MODE = "r+"
+
+    def __init__(self, directory, capacity, observation_space, number_of_snakes, prioritized=False,
+                 seed=None):
+        metadata = {"version": VERSION, "capacity": capacity,
+                    "observation_shape": list(observation_space.shape),
+                    "observation_dtype": np.dtype(observation_space.dtype).str,
+                    "number_of_snakes": number_of_snakes, "prioritized": prioritized}
+        metadata_path = os.path.join(directory, METADATA_FILE)
+        if os.path.exists(metadata_path):
+            with open(metadata_path) as f:
+                existing_metadata = json.load(f)
+            if any(existing_metadata.get(key) != value for key, value in metadata.items()):
+                raise ValueError("{} holds a replay buffer with a different version, capacity, "
+                                 "observation space, number of snakes or prioritization".format(directory))
+        else:
+            os.makedirs(directory, exist_ok=True)
+            columns = get_columns(observation_space.shape, observation_space.dtype, number_of_snakes,
+                                  prioritized)
+            for column, (shape, dtype) in columns.items():
+                array = np.lib.format.open_memmap(os.path.join(directory, column + ".npy"), mode="w+",
+                                                  dtype=dtype, shape=(capacity,) + shape)
+                array.flush()
+                del array
+            metadata.update(index=0, size=0, max_priority=1.0)
+            self._write_metadata(directory, metadata)
+        super().__init__(directory, seed)
+
+    @staticmethod
+    def _write_metadata(directory, metadata):
+        # Write to a temporary file so readers never see a partial metadata file
+        path = os.path.join(directory, METADATA_FILE)
+        temporary_path = path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(metadata, f)
+        os.replace(temporary_path, path)
+
+    def get_next_observation_slot(self):
+        '''
+        View of the next observation of the transition that the next call of add writes,
+        to be passed as the out argument of env.step
+        '''
+        return self.arrays["next_observation"][self.index]
+
+    def add(self, observation, action, reward, done, legal_mask, next_observation=None):
+        '''
+        Add a transition (as yielded by data_pipeline.generate_transitions)
+
+        Parameters:
+        ----------
+        next_observation: np.array, optional, default=None
+            If None, the next observation must already be written into get_next_observation_slot()
+        '''
+        index = self.index
+        arrays = self.arrays
+        arrays["observation"][index] = observation
+        arrays["action"][index] = action
+        arrays["reward"][index] = [reward[i] for i in range(self.number_of_snakes)] \
+            if isinstance(reward, dict) else reward
+        arrays["done"][index] = [done[i] for i in range(self.number_of_snakes)] \
+            if isinstance(done, dict) else done
+        arrays["legal_mask"][index] = legal_mask
+        if next_observation is not None:
+            arrays["next_observation"][index] = next_observation
+        if self.prioritized:
+            arrays["priority"][index] = self.max_priority
+            self.sum_tree.update([index], [self.max_priority])
+        self.index = (index + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def add_batch(self, observations, actions, rewards, dones, legal_masks, next_observations):
+        '''
+        Add a batch of transitions, e.g., the transitions of the environments of a SubprocVecEnv
+
+        Parameters:
+        ----------
+        observations: np.array(batch_size, observation shape)
+        actions: np.array(batch_size, number_of_snakes)
+        rewards: np.array(batch_size, number_of_snakes)
+        dones: np.array(batch_size, number_of_snakes)
+        legal_masks: np.array(batch_size, number_of_snakes, 4)
+        next_observations: np.array(batch_size, observation shape)
+        '''
+        values = {"observation": observations, "action": actions, "reward": rewards, "done": dones,
+                  "legal_mask": legal_masks, "next_observation": next_observations}
+        batch_size = len(observations)
+        indexes = (self.index + np.arange(batch_size)) % self.capacity
+        for column, value in values.items():
+            self.arrays[column][indexes] = value
+        if self.prioritized:
+            self.arrays["priority"][indexes] = self.max_priority
+            self.sum_tree.update(indexes, np.full(batch_size, self.max_priority))
+        self.index = int((self.index + batch_size) % self.capacity)
+        self.size = min(self.size + batch_size, self.capacity)
+
+    def update_priorities(self, indexes, priorities):
+        '''
+        Set the priorities of sampled transitions (e.g., their absolute TD errors)
+
+        Parameters:
+        ----------
+        indexes: np.array(batch_size)
+            The "indexes" returned by sample
+        priorities: np.array(batch_size)
+            Positive priorities
+        '''
+        if not self.prioritized:
+            raise ValueError("The replay buffer is not prioritized")
+        priorities = np.asarray(priorities, dtype=np.float64)
+        self.arrays["priority"][indexes] = priorities
+        self.sum_tree.update(indexes, priorities)
+        self.max_priority = max(self.max_priority, float(priorities.max()))
+
+    def flush(self):
+        '''
+        Write the transitions to disk and publish them to the readers and to later restarts
+        '''
+        for array in self.arrays.values():
+            array.flush()
+        metadata = self._read_metadata()
+        metadata.update(index=self.index, size=self.size, max_priority=self.max_priority)
+        self._write_metadata(self.directory, metadata)
+
+    def close(self):
+        if self.arrays:
+            self.flush()
+        super().close()
@@ -13,18 +13,85 @@
 
 import numpy as np
 
+# Events counted by the gym for each snake during a turn
+EVENTS = ["another_turn",
+          "ate_food",
+          "won",
+          "died",
+          "ate_another_snake",
+          "hit_wall",
+          "hit_other_snake",
+          "hit_self",
+          "was_eaten",
+          "other_snake_hit_body",
+          "forbidden_move",
+          "starved"]
+EVENT_INDEX = {name: k for k, name in enumerate(EVENTS)}
+
 class Rewards:
     '''
-    Base class to set up rewards for the battlesnake gym
+    Base class to set up rewards for the battlesnake gym.
+
+    Each turn, the gym counts the events (see EVENTS) of each snake in an event matrix and the
+    rewards are the product of the event matrix with the reward weights of the events.
+    Reward schemes can either implement get_reward (the weights are then looked up event by event)
+    or override get_reward_weights directly. The weights are cached by compute_rewards and only
+    rebuilt when the number of snakes or the episode changes, so they must only depend on these.
     '''
     def get_reward(self, name, snake_id, episode):
-        raise NotImplemented()
+        raise NotImplementedError()
+
+    def get_reward_weights(self, number_of_snakes, episode):
+        '''
+        Get the reward of each event.
+
+        Parameters:
+        ----------
+        number_of_snakes: int
+        episode: int or None
+
+        Returns:
+        --------
+        weights: np.array(len(EVENTS)) or np.array(number_of_snakes, len(EVENTS))
+            The weight of each event, or of each event for each snake
+        '''
+        return np.array([[self.get_reward(name, i, episode) for name in EVENTS]
+                         for i in range(number_of_snakes)])
+
+    def compute_rewards(self, events, episode):
+        '''
+        Compute the rewards from the event counts.
+
+        Parameters:
+        ----------
+        events: np.array(number_of_snakes, len(EVENTS))
+            events[i, k] is the number of times snake i triggered the event EVENTS[k]
+        episode: int or None
+
+        Returns:
+        --------
+        rewards: np.array(number_of_snakes)
+        '''
+        key = (events.shape[0], episode)
+        if getattr(self, "_reward_weights_key", None) != key:
+            self._reward_weights = self.get_reward_weights(*key)
+            self._reward_weights_key = key
+        weights = self._reward_weights
+        if weights.ndim == 1:
+            return events @ weights
+        return np.einsum("ij,ij->i", events, weights)
 
 class SimpleRewards(Rewards):
     '''
     Simple class to handle a fixed reward scheme
+
+    Parameters:
+    ----------
+    reward_dict: {str: float}, optional
+        Reward of each event, overriding the default rewards. The rewards are read once, when
+        the scheme is created
     '''
-    def __init__(self):
+    def __init__(self, reward_dict=None):
         self.reward_dict = {"another_turn": 1,
                             "ate_food": 0,
                             "won": 0,
@@ -37,6 +104,13 @@ class SimpleRewards(Rewards):
                             "other_snake_hit_body": 0,
                             "forbidden_move": 0,
                             "starved": 0}
+        if reward_dict is not None:
+            self.reward_dict.update(reward_dict)
+        # The same weights are used for every snake
+        self.reward_weights = np.array([self.reward_dict[name] for name in EVENTS])
 
     def get_reward(self, name, snake_id, episode):
         return self.reward_dict[name]
+
+    def get_reward_weights(self, number_of_snakes, episode):
+        return self.reward_weights
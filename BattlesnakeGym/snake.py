@@ -13,12 +13,18 @@
 
 import numpy as np
 
+from board_tables import get_move_table, OFF_BOARD
 from utils import get_random_coordinates
 
 class Snake:
     '''
     The Snake class mimics the behaviour of snakes in Battlesnake.io based on 
     https://docs.battlesnake.com/references/rules
+
+    The body is stored in self.cells as cell ids i * map_size[1] + j, from the tail to the head,
+    and moves are lookups in the move table of the map (see board_tables.get_move_table).
+    A head that moved outside of the map is the cell OFF_BOARD (its coordinate is kept in
+    self._outside_head). self.locations gives the body as (i, j) coordinates.
     
     Parameters:
     -----------
@@ -27,6 +33,9 @@ class Snake:
 
     map_size: (int, int)
         The size of the map
+
+    rng: np.random.Generator, optional
+        Random number generator used to pick the colour of the snake, np.random is used if None
     '''
 
     UP = 0
@@ -35,21 +44,30 @@ class Snake:
     RIGHT = 3
 
     FULL_HEALTH = 100
+    # Snakes at least this long are drawn by get_snake_map with one fancy indexing assignment,
+    # shorter snakes cell by cell (cheaper than the temporary index arrays)
+    VECTORIZED_MAP_LENGTH = 16
     
-    def __init__(self, starting_position, map_size):
+    def __init__(self, starting_position, map_size, rng=None):
         self.health = self.FULL_HEALTH
-        self.locations = [] # Head of the snake is element n and the end is element 0
-        self.locations.append(starting_position)
+        self.map_size = map_size
+        self._width = map_size[1]
+        self._move_table = get_move_table(map_size[0], map_size[1])
+        self._outside_head = None
+        # Head of the snake is element n and the end is element 0
+        self.cells = [] if starting_position is None else [self.get_cell(starting_position)]
         self.facing_direction = None
         self._is_alive = True
         self.ate_food = False
-        self.map_size = map_size
-        self.colour = list(np.random.choice(range(256), size=3))
+        if rng is None:
+            rng = np.random
+        self.colour = list(rng.choice(range(256), size=3))
         self._number_of_initial_body_stacking = 2 # At the start of the game, snakes of size 3 are stacked.
         # self._number_of_initial_body_stacking == 2 to account for the initial body
+        self.free_cells = None
 
     @classmethod
-    def make_from_list(cls, locations, health, map_size):
+    def make_from_list(cls, locations, health, map_size, rng=None):
         '''
         Class method to make a snake from a list of coordinates.
         Parameters:
@@ -59,35 +77,59 @@ class Snake:
         health: int
             The health of the snake
         map_size: (int, int)
+        rng: np.random.Generator, optional
+            Random number generator used to pick the colour of the snake, np.random is used if None
         '''
-        tmp_locations = []
-        for i, j in locations[::-1]: # head is element n
-            tmp_locations.append(np.array([i, j])) 
-
-        if len(tmp_locations) == 0:
-            head = None
-        else:
-            head = tmp_locations[-1]
-        cls = Snake(head, map_size)
-        cls.locations = tmp_locations
+        cls = Snake(None, map_size, rng=rng)
+        cls.locations = locations[::-1] # head is element n
         cls.health = health
-        if len(tmp_locations) == 0:
+        if len(cls.cells) == 0:
             cls.kill_snake()
 
-        if len(cls.locations) > 1:
+        if len(cls.cells) > 1:
             # Calculate the facing direction with the head and the next location
-            snake_head = cls.locations[-1]
-            snake_2nd_body = cls.locations[-2]
-            difference = (snake_head[0] - snake_2nd_body[0], snake_head[1] - snake_2nd_body[1])
-            if difference[0] == -1 and difference[1] == 0:
-                cls.facing_direction = Snake.UP
-            elif difference[0] == 1 and difference[1] == 0:
-                cls.facing_direction = Snake.DOWN
-            elif difference[0] == 0 and difference[1] == -1:
-                cls.facing_direction = Snake.LEFT
-            elif difference[0] == 0 and difference[1] == 1:
-                cls.facing_direction = Snake.RIGHT
+            for direction, cell in enumerate(cls._move_table[cls.cells[-2]]):
+                if cell == cls.cells[-1]:
+                    cls.facing_direction = direction
         return cls
+
+    def get_cell(self, coordinate):
+        '''
+        Cell id of a coordinate (i, j) of the map
+        '''
+        return int(coordinate[0]) * self._width + int(coordinate[1])
+
+    def get_coordinate(self, cell):
+        '''
+        Coordinate (i, j) of a cell id, the coordinate outside of the map of an OFF_BOARD head
+        '''
+        if cell == OFF_BOARD:
+            return self._outside_head
+        return divmod(cell, self._width)
+
+    @property
+    def locations(self):
+        '''
+        The body as a list of (i, j) coordinates from the tail to the head
+        '''
+        return [self.get_coordinate(cell) for cell in self.cells]
+
+    @locations.setter
+    def locations(self, locations):
+        self.cells = [self.get_cell(location) for location in locations]
+        self._outside_head = None
+
+    def attach_free_cells(self, free_cells):
+        '''
+        Function to keep free_cells updated with the locations of the snake as it moves
+
+        Parameters:
+        -----------
+        free_cells: FreeCells
+        '''
+        self.free_cells = free_cells
+        for cell in self.cells:
+            self.free_cells.occupy_cell(cell)
         
     def move(self, direction):
         '''
@@ -108,16 +150,22 @@ class Snake:
         is_forbidden = False
         if not self._is_alive:
             return is_forbidden
-        
+
+        if isinstance(direction, np.ndarray):
+            # e.g., actions given as np.array(number_of_snakes, 1)
+            direction = direction.item()
+
         if self.facing_direction == None:
             self.facing_direction == direction
 
-        if self.is_facing_opposite_of_direction(direction) and len(self.locations) > 0:
+        if self.is_facing_opposite_of_direction(direction) and len(self.cells) > 0:
             direction = self.facing_direction
             is_forbidden = True
 
-        head = self.get_head()
-        new_head = self._translate_coordinate_in_direction(head, direction)
+        head = self.cells[-1]
+        new_head = self._move_table[head][direction]
+        if new_head == OFF_BOARD:
+            self._outside_head = self._translate_coordinate_in_direction(self.get_coordinate(head), direction)
 
         # If the snake is within the first 3 turns of being alive, do no remove the end
         if self._number_of_initial_body_stacking > 0:
@@ -126,8 +174,12 @@ class Snake:
         elif self.ate_food:
             self.ate_food = False
         else:
-            self.locations = self.locations[1:] # remove the end
-        self.locations.append(new_head)
+            tail = self.cells.pop(0) # remove the end
+            if self.free_cells is not None:
+                self.free_cells.release_cell(tail)
+        self.cells.append(new_head)
+        if self.free_cells is not None:
+            self.free_cells.occupy_cell(new_head)
         self.facing_direction = direction
         return is_forbidden
         
@@ -151,30 +203,29 @@ class Snake:
             return True
         return False
 
+    def get_previous_head_cell(self):
+        '''
+        Returns the cell of the head in the previous time step: the cell behind the head,
+        or the head itself if the snake did not move yet
+        '''
+        if self.facing_direction is None or len(self.cells) < 2:
+            return self.cells[-1]
+        return self.cells[-2]
+
     def get_previous_snake_head(self):
         '''
         Returns the location of head in the previous time step
-        
-        Move 1 space in the opposite direction of self.facing direction
         '''
-        head = self.get_head()
-        previous_head = np.copy(head)
-        
-        if self.facing_direction == Snake.UP:
-            previous_head[0] += 1
-        elif self.facing_direction == Snake.DOWN:
-            previous_head[0] -= 1
-        elif self.facing_direction == Snake.RIGHT:
-            previous_head[1] -= 1
-        elif self.facing_direction == Snake.LEFT:
-            previous_head[1] += 1
-        return previous_head
+        return self.get_coordinate(self.get_previous_head_cell())
+
+    def get_head_cell(self):
+        return self.cells[-1]
 
     def get_head(self):
-        return self.locations[-1]
+        return self.get_coordinate(self.cells[-1])
 
     def get_tail(self):
-        return self.locations[0]
+        return self.get_coordinate(self.cells[0])
 
     def get_body(self):
         return self.locations[:-1]
@@ -196,17 +247,16 @@ class Snake:
         coordinate: (int, int)
             Translated coordinate
         '''
-        new_coordinate = np.copy(origin)
+        i, j = int(origin[0]), int(origin[1])
         if direction == self.UP:
-            new_coordinate[0] = new_coordinate[0] - 1
+            return (i - 1, j)
         elif direction == self.DOWN:
-            new_coordinate[0] = new_coordinate[0] + 1
+            return (i + 1, j)
         elif direction == self.LEFT:
-            new_coordinate[1] = new_coordinate[1] - 1
+            return (i, j - 1)
         elif direction == self.RIGHT:
-            new_coordinate[1] = new_coordinate[1] + 1
-        
-        return new_coordinate
+            return (i, j + 1)
+        return (i, j)
 
     def can_snake_move_in_direction(self, direction):
         '''
@@ -236,13 +286,9 @@ class Snake:
         '''
         Returns a boolean indicating if the snake head is outside the map
         '''
-        i_head, j_head = self.get_head()
-        if 0 <= j_head < self.map_size[1]:
-            if 0 <= i_head < self.map_size[0]:
-                return False
-        return True
+        return self.cells[-1] == OFF_BOARD
 
-    def get_snake_map(self, return_type="Binary"):
+    def get_snake_map(self, return_type="Binary", out=None):
         '''
         Return an image including the positions of the snakes
 
@@ -254,12 +300,19 @@ class Snake:
             if Numbered, an image with 1 as the head, 2, 3, 4 as the body
                 is returned
 
+        out: np.array, optional, default=None
+            Preallocated image of the same shape as the returned map_image. If provided,
+            it is cleared and written in place instead of allocating a new image
+
         Returns:
         --------
         map_image, np.array(self.map_size)
             image of the position of this snake
         '''        
-        if return_type == "Colour":
+        if out is not None:
+            map_image = out
+            map_image[...] = 0
+        elif return_type == "Colour":
             map_image = np.zeros((self.map_size[0], self.map_size[1], 3))
         else:
             map_image = np.zeros((self.map_size[0], self.map_size[1]))
@@ -268,19 +321,32 @@ class Snake:
             # To check if the snake is dead or not
             return map_image
 
-        for i, location in enumerate(self.locations):
+        width = self._width
+        if len(self.cells) >= self.VECTORIZED_MAP_LENGTH:
+            i, j = np.divmod(self.cells, width)
             if return_type == "Colour":
-                map_image[location[0], location[1], :] = self.colour
+                map_image[i, j, :] = self.colour
             elif return_type == "Binary":
-                map_image[location[0], location[1]] = 1
+                map_image[i, j] = 1
             elif return_type == "Numbered":
-                map_image[location[0], location[1]] = i+1
+                # Stacked segments keep the number of the last one, as in the loop below
+                map_image[i, j] = np.arange(1, len(self.cells) + 1)
+        else:
+            for k, cell in enumerate(self.cells):
+                i, j = divmod(cell, width)
+                if return_type == "Colour":
+                    map_image[i, j, :] = self.colour
+                elif return_type == "Binary":
+                    map_image[i, j] = 1
+                elif return_type == "Numbered":
+                    map_image[i, j] = k+1
 
         # Color the head differently
+        head_i, head_j = divmod(self.cells[-1], width)
         if return_type == "Colour":
-            map_image[self.get_head()[0], self.get_head()[1], :] *= 0.5
+            map_image[head_i, head_j, :] *= 0.5
         elif return_type == "Binary":
-            map_image[self.get_head()[0], self.get_head()[1]] = 5
+            map_image[head_i, head_j] = 5
 
         return map_image
 
@@ -288,8 +354,12 @@ class Snake:
         '''
         Set snake to be dead
         '''
+        if self.free_cells is not None:
+            for cell in self.cells:
+                self.free_cells.release_cell(cell)
         self._is_alive = False
-        self.locations = []
+        self.cells = []
+        self._outside_head = None
 
     def is_alive(self):
         '''
@@ -301,7 +371,7 @@ class Snake:
         '''
         Get the snake size
         '''
-        return len(self.locations)
+        return len(self.cells)
 
     def set_ate_food(self):
         '''
@@ -321,29 +391,36 @@ class Snakes:
     
     snake_spawn_locations: [(int, int)] optional
         Parameter to force snakes to spawn in certain positions. Used for testing
+
+    rng: np.random.Generator, optional
+        Random number generator used to spawn the snakes, np.random is used if None
     '''
-    def __init__(self, map_size, number_of_snakes, snake_spawn_locations=[]):
+    def __init__(self, map_size, number_of_snakes, snake_spawn_locations=[], rng=None):
         self.map_size = map_size
         self.number_of_snakes = number_of_snakes
+        self.rng = rng
         self.snakes = self._initialise_snakes(number_of_snakes, snake_spawn_locations)
 
     def _initialise_snakes(self, number_of_snakes, snake_spawn_locations):
         snakes = []
+        if number_of_snakes == 0:
+            return snakes
 
         if len(snake_spawn_locations) == 0:
-            starting_positions = get_random_coordinates(self.map_size, number_of_snakes)
+            starting_positions = get_random_coordinates(self.map_size, number_of_snakes, rng=self.rng)
         else:
             error_message = "the number of coordinates in snake_spawn_locations must match the number of snakes"
             assert len(snake_spawn_locations) == self.number_of_snakes, error_message
             starting_positions = snake_spawn_locations
 
         for i in range(number_of_snakes):
-            snakes.append(Snake(starting_position=starting_positions[i], map_size=self.map_size))
+            snakes.append(Snake(starting_position=starting_positions[i], map_size=self.map_size,
+                                rng=self.rng))
 
         return snakes
 
     @classmethod
-    def make_from_dict(cls, map_size, snake_dicts):
+    def make_from_dict(cls, map_size, snake_dicts, rng=None):
         '''
         Class method to create the Snakes class from a dictionary of snakes
 
@@ -353,10 +430,12 @@ class Snakes:
         snake_dicts: [{}]
             A list of snake_dict.
             dictionary are in the form of the battlesnake engine
+        rng: np.random.Generator, optional
+            Random number generator used to pick the colours of the snakes, np.random is used if None
         '''
         number_of_snakes = len(snake_dicts)
-        cls = Snakes(map_size, number_of_snakes)
-        cls.snakes = []
+        cls = Snakes(map_size, 0, rng=rng)
+        cls.number_of_snakes = number_of_snakes
         
         for snake_dict in snake_dicts:
             locations = []
@@ -365,10 +444,21 @@ class Snakes:
                 locations.append((loc["y"], loc["x"]))
             
             health = snake_dict["health"]
-            snake = Snake.make_from_list(locations, health, map_size)
+            snake = Snake.make_from_list(locations, health, map_size, rng=rng)
             cls.snakes.append(snake)
         return cls
 
+    def attach_free_cells(self, free_cells):
+        '''
+        Function to keep free_cells updated with the locations of every snake
+
+        Parameters
+        ----------
+        free_cells: FreeCells
+        '''
+        for snake in self.snakes:
+            snake.attach_free_cells(free_cells)
+
     def get_snake_51_map(self, excluded_snakes=[]):
         '''
         Function to generate a 51 map of the locations of any snake
@@ -406,7 +496,7 @@ class Snakes:
         return np.sum(self.get_snake_depth_numbered_map(
             excluded_snakes=excluded_snakes), 2)
 
-    def get_snake_depth_numbered_map(self, excluded_snakes=[]):
+    def get_snake_depth_numbered_map(self, excluded_snakes=[], out=None):
         '''
         Function to generate a numbered map of the locations of any snake
         1 will be the head, 2, 3 etc will be the body
@@ -417,6 +507,9 @@ class Snakes:
             Snakes to not be included in the binary map. 
             Used to check if there are collisions between snakes
 
+        out: np.array(map_size[0], map_size[1], number_of_snakes), optional
+            Preallocated image to write the map into instead of allocating a new one
+
         Returns:
         --------
         map_image: np.array(map_sizep[0], map_size[1], number_of_snakes)
@@ -425,16 +518,21 @@ class Snakes:
              the body that the snake is present in that location and 0
             indicates that the snake is not present in that location
         '''
-        map_image = np.zeros((self.map_size[0], self.map_size[1],
-                              len(self.snakes)),
-                             dtype=np.uint8)
+        if out is None:
+            map_image = np.zeros((self.map_size[0], self.map_size[1],
+                                  len(self.snakes)),
+                                 dtype=np.uint8)
+        else:
+            map_image = out
         for i, snake in enumerate(self.snakes):
             if snake not in excluded_snakes:
-                map_image[:, :, i] = snake.get_snake_map(return_type="Numbered")
+                snake.get_snake_map(return_type="Numbered", out=map_image[:, :, i])
+            elif out is not None:
+                map_image[:, :, i] = 0
         return map_image
 
 
-    def get_snake_depth_51_map(self, excluded_snakes=[]):
+    def get_snake_depth_51_map(self, excluded_snakes=[], out=None):
         '''
         Function to generate a 51 map of the locations of the snakes
 
@@ -444,6 +542,9 @@ class Snakes:
             Snakes to not be included in the binary map. 
             Used to check if there are collisions between snakes
 
+        out: np.array(map_size[0], map_size[1], number_of_snakes), optional
+            Preallocated image to write the map into instead of allocating a new one
+
         Returns:
         --------
         map_image: np.array(map_sizep[0], map_size[1], number_of_snakes)
@@ -452,12 +553,17 @@ class Snakes:
              that the snake is present in that location and 0
             indicates that the snake is not present in that location
         '''
-        map_image = np.zeros((self.map_size[0], self.map_size[1],
-                              len(self.snakes)),
-                             dtype=np.uint8)
+        if out is None:
+            map_image = np.zeros((self.map_size[0], self.map_size[1],
+                                  len(self.snakes)),
+                                 dtype=np.uint8)
+        else:
+            map_image = out
         for i, snake in enumerate(self.snakes):
             if snake not in excluded_snakes:
-                map_image[:, :, i] = snake.get_snake_map(return_type="Binary")
+                snake.get_snake_map(return_type="Binary", out=map_image[:, :, i])
+            elif out is not None:
+                map_image[:, :, i] = 0
 
         return map_image
 
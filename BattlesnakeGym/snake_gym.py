@@ -18,11 +18,32 @@ from gymnasium.utils import seeding
 import json
 import string
 
-from snake import Snakes
+from snake import Snakes, Snake
 from food import Food
+from free_cells import FreeCells
+from profiler import PhaseProfiler
+from renderer import BoardRenderer
 from game_state_parser import Game_state_parser
-from rewards import SimpleRewards
-from utils import get_random_coordinates, MultiAgentActionSpace, get_distance
+from packed_observation import get_packed_size, pack_observation, NO_HEAD
+from rewards import SimpleRewards, EVENTS, EVENT_INDEX
+from utils import get_random_coordinates, MultiAgentActionSpace
+from board_tables import OFF_BOARD
+
+# Moves of the Battlesnake API and the corresponding actions of the gym. The rows of the gym are
+# the y coordinates of the API (see get_json) so moving "up" in the API is Snake.DOWN in the gym
+API_MOVE_TO_ACTION = {"up": Snake.DOWN, "down": Snake.UP, "left": Snake.LEFT, "right": Snake.RIGHT}
+
+# Event counted for each collision outcome of BattlesnakeGym._did_snake_collide
+COLLISION_OUTCOME_EVENTS = {"Snake hit wall": EVENT_INDEX["hit_wall"],
+                            "Snake was eaten - same tile": EVENT_INDEX["was_eaten"],
+                            "Snake was eaten - adjacent tile": EVENT_INDEX["was_eaten"],
+                            "Snake hit body - hit itself": EVENT_INDEX["hit_self"],
+                            "Snake hit body - hit other": EVENT_INDEX["hit_other_snake"],
+                            "Other snake hit body": EVENT_INDEX["other_snake_hit_body"],
+                            "Ate another snake": EVENT_INDEX["ate_another_snake"]}
+
+DEFAULT_API_GAME = {"id": "battlesnake-gym", "ruleset": {"name": "standard", "version": "gym"},
+                    "map": "standard", "timeout": 500, "source": "custom"}
 
 class BattlesnakeGym(gym.Env):
     metadata = {
@@ -30,7 +51,8 @@ class BattlesnakeGym(gym.Env):
         "observation.types": ["flat-num", "bordered-num",
                               "max-bordered-num",
                               "flat-51s", "bordered-51s", 
-                              "max-bordered-51s"]
+                              "max-bordered-51s",
+                              "flat-packed", "flat-packed-health"]
     }
     '''
     OpenAI Gym for BattlesnakeIO 
@@ -48,6 +70,9 @@ class BattlesnakeGym(gym.Env):
         4- "bordered-51s" similar to flat-51s
         5- "max-bordered-num" option will provide borders of -1 until a maximum map size of 21, 21
         6- "max-bordered-51s" similar to max-bordered-num
+        7- "flat-packed" is flat-51s packed into a 1D uint8 array (see packed_observation),
+           about 8 times smaller. Use packed_observation.unpack_observation(s) to get flat-51s
+        8- "flat-packed-health" similar to flat-packed with the health of each snake
     
     map_size: (int, int), optional, default=(15, 15)
     
@@ -67,12 +92,29 @@ class BattlesnakeGym(gym.Env):
         Dictionary to indicate the initial game state
         Dict is in the same form as in the battlesnake engine
         https://docs.battlesnake.com/references/api
+
+    food_spawn_chance: float, optional, default=0.15
+        Chance of spawning a food at the end of each turn
+
+    minimum_food: int, optional, default=0
+        Food is spawned at the end of each turn until there are at least minimum_food on the map
+
+    reuse_observation_buffer: Bool, optional, default=False
+        Observations are written in place into a buffer preallocated by the gym.
+        If True, step and reset return that buffer itself (it is overwritten by the next call,
+        copy it if it must be kept). If False, a copy of the buffer is returned
+
+    seed: int or np.random.SeedSequence, optional, default=None
+        Seed of the random number generator of the gym (see seed)
     '''
     MAX_BORDER = (21, 21) # Largest map size (19, 19) + 2 for -1 borders
+    SNAPSHOT_VERSION = 3
+    SNAKE_SNAPSHOT_SIZE = 10 # Number of values describing each snake in a snapshot (see get_state)
     def __init__(self, observation_type="flat-51s", map_size=(15, 15),
                  number_of_snakes=4, 
                  snake_spawn_locations=[], food_spawn_locations=[],
-                 verbose=False, initial_game_state=None, rewards=SimpleRewards(), food_spawn_chance=0.15):
+                 verbose=False, initial_game_state=None, rewards=SimpleRewards(), food_spawn_chance=0.15,
+                 minimum_food=0, reuse_observation_buffer=False, seed=None):
         
         self.map_size = map_size
         self.number_of_snakes = number_of_snakes
@@ -80,6 +122,7 @@ class BattlesnakeGym(gym.Env):
         self.snake_spawn_locations = snake_spawn_locations
         self.food_spawn_locations = food_spawn_locations
         self.food_spawn_chance = food_spawn_chance
+        self.minimum_food = minimum_food
         
         self.number_of_snakes = number_of_snakes
         self.map_size = map_size
@@ -89,35 +132,92 @@ class BattlesnakeGym(gym.Env):
 
         self.observation_type = observation_type
         self.observation_space = self.get_observation_space()
+        self.reuse_observation_buffer = reuse_observation_buffer
+        self._allocate_observation_buffers()
         
         self.viewer = None
+        self.renderer = None
         self.state = None
         self.verbose = verbose
         self.rewards = rewards
+        # Events of each snake during the last step, see rewards.EVENTS
+        self.reward_events = None
+        # PhaseProfiler of step and reset, None if profiling is disabled (see enable_profiling)
+        self.profiler = None
+        self.seed(seed)
 
     def get_observation_space(self):
         '''
         Helper function to define the observation space given self.map_size, self.number_of_snakes
         and self.observation_type
         '''
-        if "flat" in self.observation_type:
+        if "packed" in self.observation_type:
+            size = get_packed_size(self.map_size, self.number_of_snakes,
+                                   include_health="health" in self.observation_type)
+            observation_space = spaces.Box(low=0, high=255, shape=(size,),
+                                           dtype=self.get_observation_dtype())
+        elif "flat" in self.observation_type:
             observation_space = spaces.Box(low=0, high=5,
                                            shape=(self.map_size[0],
                                                   self.map_size[1],
                                                   self.number_of_snakes+1),
-                                           dtype=np.uint8)
+                                           dtype=self.get_observation_dtype())
         elif "bordered" in self.observation_type:
-            if "max-bordered" in self.observation_type:
-                border_size = self.MAX_BORDER[0] - self.map_size[0]
-            else:
-                border_size = 2
-            observation_space = spaces.Box(low=0, high=5,
+            border_size = self._get_border_size()
+            observation_space = spaces.Box(low=-1, high=5,
                                            shape=(self.map_size[0]+border_size,
                                                   self.map_size[1]+border_size,
                                                   self.number_of_snakes+1),
-                                           dtype=np.uint8)
+                                           dtype=self.get_observation_dtype())
         return observation_space
 
+    def get_observation_dtype(self):
+        '''
+        Helper function to define the dtype of the observations given self.observation_type.
+        Flat observations are kept as uint8. Bordered observations hold -1 in the border so
+        a signed type is used: int8 for the 51s types and int16 for the numbered types
+        (the body numbers of a long snake do not fit in an int8).
+        '''
+        if "flat" in self.observation_type:
+            return np.uint8
+        if "51s" in self.observation_type:
+            return np.int8
+        return np.int16
+
+    def _get_border_size(self):
+        '''
+        Helper function to get the total number of border tiles added along each axis
+        '''
+        if "flat" in self.observation_type:
+            return 0
+        if "max-bordered" in self.observation_type:
+            return self.MAX_BORDER[0] - self.map_size[0]
+        return 2
+
+    def _allocate_observation_buffers(self):
+        '''
+        Helper function to preallocate the buffer that the observations are written into.
+        The border of the bordered observation types is written once here, each step only
+        writes the interior of the buffer.
+        '''
+        self._observation_buffer = np.empty(self.observation_space.shape,
+                                            dtype=self.observation_space.dtype)
+        self._observation_buffer[...] = -1 if self._get_border_size() > 0 else 0
+        if "packed" in self.observation_type:
+            # The flat-51s state is written into a scratch buffer and then packed
+            self._packed_state_buffer = np.zeros((self.map_size[0], self.map_size[1],
+                                                  self.number_of_snakes + 1), dtype=np.uint8)
+            self._observation_interior = None
+        else:
+            self._observation_interior = self._get_observation_interior(self._observation_buffer)
+
+    def _get_observation_interior(self, observation):
+        '''
+        Helper function returning the view of an observation that holds the map (excluding the border)
+        '''
+        b = self._get_border_size() // 2
+        return observation[b:b+self.map_size[0], b:b+self.map_size[1], :]
+
     def initialise_game_state(self, game_state_dict):
         '''
         Function to initialise the gym with outputs of env.render(mode="ascii")
@@ -129,16 +229,73 @@ class BattlesnakeGym(gym.Env):
         assert np.array_equal(gsp.map_size, self.map_size), "Map size of the game state is incorrect"
         assert gsp.number_of_snakes == self.number_of_snakes, "Number of names of the game state is incorrect"
 
-        return gsp.parse()
+        return gsp.parse(rng=self.np_random)
         
-    def seed(self, seed):
+    def seed(self, seed=None):
         '''
         Inherited function of the openAI gym to set the randomisation seed.
+        All the randomness of the gym (spawning snakes and food, colours) is drawn from
+        self.np_random. The generator is reseeded in place so the snakes and food of the
+        current game keep sharing it.
+
+        Parameters:
+        ----------
+        seed: int or np.random.SeedSequence, optional, default=None
+            If None, the generator is seeded with fresh entropy. A SeedSequence can be used to
+            seed environments with independent streams (see seed_envs)
+
+        Returns:
+        --------
+        seeds: [int]
+            The entropy of the seed, it can be used to replay the games
         '''
-        self.np_random, seed = seeding.np_random(seed)
+        if isinstance(seed, np.random.SeedSequence):
+            bit_generator = np.random.PCG64(seed)
+            seed = seed.entropy
+        else:
+            np_random, seed = seeding.np_random(seed)
+            bit_generator = np_random.bit_generator
+        self.np_random.bit_generator.state = bit_generator.state
         return [seed]
 
-    def reset(self, map_size=None):
+    def enable_profiling(self):
+        '''
+        Start recording the time spent in each phase of step and reset (see profile_report).
+        Profiling is disabled by default and costs a None check per phase when disabled.
+
+        Returns:
+        --------
+        profiler: PhaseProfiler
+        '''
+        if self.profiler is None:
+            self.profiler = PhaseProfiler()
+        return self.profiler
+
+    def disable_profiling(self):
+        self.profiler = None
+
+    def profile_report(self):
+        '''
+        Summary of the time spent in each phase of step and reset since profiling was enabled.
+
+        Returns:
+        --------
+        report: str
+        '''
+        if self.profiler is None:
+            raise RuntimeError("Profiling is not enabled, call enable_profiling first")
+        return self.profiler.report()
+
+    def export_profile(self, path):
+        '''
+        Write the time spent in each phase of step and reset in the collapsed stack format
+        read by flamegraph tools (see PhaseProfiler.get_collapsed_stacks)
+        '''
+        if self.profiler is None:
+            raise RuntimeError("Profiling is not enabled, call enable_profiling first")
+        self.profiler.write_collapsed_stacks(path)
+
+    def reset(self, map_size=None, out=None, seed=None):
         '''
         Inherited function of the openAI gym to reset the environment.
 
@@ -146,21 +303,82 @@ class BattlesnakeGym(gym.Env):
         -----------
         map_size: (int, int), default None
             Optional paramter to reset the map size
+
+        out: np.array, default None
+            Optional array (of shape and dtype observation_space) to write the observation into
+
+        seed: int or np.random.SeedSequence, default None
+            Optional seed to reseed the gym with before resetting (see seed)
         '''
+        prof = self.profiler
+        if prof is not None:
+            reset_start = prof.clock()
+        if seed is not None:
+            self.seed(seed)
+
         if map_size is not None:
-            self.observation_space = self.get_observation_space()
             self.map_size = map_size
+            self.observation_space = self.get_observation_space()
+            self._allocate_observation_buffers()
         
         if self.initial_game_state is not None:
-            self.snakes, self.food, self.turn_count = self.initialise_game_state(self.initial_game_state)
-        else:
-            self.turn_count = 0
+            snakes, food, turn_count = self.initialise_game_state(self.initial_game_state)
+            if prof is not None:
+                start = prof.record("reset;parse", reset_start)
+            outputs = self.load_game_state(snakes, food, turn_count, out=out)
+            if prof is not None:
+                prof.record("reset;load_game_state", start)
+                prof.record("reset", reset_start)
+            return outputs
 
-            self.snakes = Snakes(self.map_size, self.number_of_snakes, self.snake_spawn_locations)
-            self.food = Food(self.map_size, self.food_spawn_locations, self.food_spawn_chance)
-            if self.food_spawn_chance != 0.0:  # only spawn food if necessary
-                self.food.spawn_food(self.snakes.get_snake_51_map())
+        self.turn_count = 0
 
+        self.snakes = Snakes(self.map_size, self.number_of_snakes, self.snake_spawn_locations,
+                             rng=self.np_random)
+        self.food = Food(self.map_size, self.food_spawn_locations, self.food_spawn_chance,
+                         self.minimum_food, rng=self.np_random)
+        self._attach_free_cells()
+        if self.food_spawn_chance != 0.0:  # only spawn food if necessary
+            self.food.spawn_food()
+        self.food.spawn_minimum_food()
+        if prof is not None:
+            start = prof.record("reset;spawn", reset_start)
+        outputs = self._get_reset_outputs(out)
+        if prof is not None:
+            prof.record("reset;observation", start)
+            prof.record("reset", reset_start)
+        return outputs
+
+    def load_game_state(self, snakes, food, turn_count, out=None):
+        '''
+        Reset the environment to a parsed game state, e.g., the output of Game_state_parser.parse
+        or of GameStateBatch.parse for each state of a batch.
+
+        Parameters:
+        -----------
+        snakes: Snakes
+        food: Food
+        turn_count: int
+        out: np.array, default None
+            Optional array (of shape and dtype observation_space) to write the observation into
+
+        Returns:
+        --------
+        The same outputs as reset
+        '''
+        assert tuple(snakes.map_size) == tuple(self.map_size), "Map size of the game state is incorrect"
+        assert snakes.number_of_snakes == self.number_of_snakes, "Number of names of the game state is incorrect"
+        self.snakes, self.food, self.turn_count = snakes, food, turn_count
+        self.food.MINIMUM_FOOD = self.minimum_food
+        self.food.rng = self.np_random
+        self._attach_free_cells()
+        self.food.spawn_minimum_food()
+        return self._get_reset_outputs(out)
+
+    def _get_reset_outputs(self, out=None):
+        '''
+        Helper function to generate the outputs of reset
+        '''
         dones = {i:False for i in range(self.number_of_snakes)}
         
         snakes_health = {}
@@ -173,8 +391,18 @@ class BattlesnakeGym(gym.Env):
         info = {'current_turn': self.turn_count,
                 'snake_health': snakes_health,
                 'snake_info': snake_info, 
-                'snake_max_len': self.snake_max_len}
-        return self._get_observation(), {}, dones, info
+                'snake_max_len': self.snake_max_len,
+                'action_mask': self.get_action_mask()}
+        return self._get_observation(out), {}, dones, info
+
+    def _attach_free_cells(self):
+        '''
+        Helper function to build the index of free cells of the map. The index is kept updated
+        by the snakes and the food as they change, and is used to spawn food
+        '''
+        self.free_cells = FreeCells(self.map_size, rng=self.np_random)
+        self.snakes.attach_free_cells(self.free_cells)
+        self.food.attach_free_cells(self.free_cells)
 
     def _did_snake_collide(self, snake, snakes_to_be_killed):
         '''
@@ -204,7 +432,7 @@ class BattlesnakeGym(gym.Env):
                                       "Ate another snake",
                                       "Other snake hit body"]
         '''       
-        snake_head_location = snake.get_head()
+        snake_head_cell = snake.get_head_cell()
         ate_another_snake = False
         snakes_eaten_this_turn = []
         
@@ -225,8 +453,7 @@ class BattlesnakeGym(gym.Env):
             if other_snake == snake:
                 continue
             if other_snake.is_alive():
-                other_snake_head = other_snake.get_head()
-                if np.array_equal(snake_head_location, other_snake_head):
+                if snake_head_cell == other_snake.get_head_cell():
                     if other_snake.get_size() >= snake.get_size():
                         outcome = "Snake was eaten - same tile"
                         if self.verbose: print(outcome)
@@ -241,36 +468,45 @@ class BattlesnakeGym(gym.Env):
         #    S1     S1
         #   |  |> <|  |
         #
+        snake_previous_head_cell = snake.get_previous_head_cell()
         for other_snake in self.snakes.get_snakes():
             if other_snake == snake:
                 continue
-            # Check if snake swapped places with the other_snake.
-            # 1) check if heads are adjacent
-            # 2) check if heads swapped places
-            if other_snake.is_alive():
-                other_snake_head = other_snake.get_head()
-                if get_distance(snake_head_location, other_snake_head) == 1:
-                    if np.array_equal(snake_head_location, other_snake.get_previous_snake_head())\
-                       and np.array_equal(other_snake_head, snake.get_previous_snake_head()):
-                        if other_snake.get_size() >= snake.get_size():
-                            outcome = "Snake was eaten - adjacent tile"
-                            if self.verbose: print(outcome)
-                            return True, outcome
-                        else:
-                            ate_another_snake = True
-                            snakes_eaten_this_turn.append(other_snake)
+            # Check if snake swapped places with the other_snake
+            # (a head outside of the map cannot have swapped places)
+            if other_snake.is_alive() and not other_snake.is_head_outside_map():
+                other_snake_head_cell = other_snake.get_head_cell()
+                if other_snake_head_cell != snake_head_cell\
+                   and snake_head_cell == other_snake.get_previous_head_cell()\
+                   and other_snake_head_cell == snake_previous_head_cell:
+                    if other_snake.get_size() >= snake.get_size():
+                        outcome = "Snake was eaten - adjacent tile"
+                        if self.verbose: print(outcome)
+                        return True, outcome
+                    else:
+                        ate_another_snake = True
+                        snakes_eaten_this_turn.append(other_snake)
 
         # 3.1) Check if snake ran into it's own body
         outcome = "Snake hit body - hit itself"
-        for self_body_locations in snake.get_body():
-            if np.array_equal(snake_head_location, self_body_locations):
-                if self.verbose: print("Snake hit itself")
-                return True, outcome
+        body_cells = snake.cells[:-1]
+        if snake_head_cell in body_cells:
+            if self.verbose: print("Snake hit itself")
+            return True, outcome
             
-        # 3.2) Check if snake ran into another snake's body
+        # 3.2) Check if snake ran into another snake's body, i.e., the 51 map of the other snakes
+        # (1 for the bodies and 5 for the heads, snakes with a head outside of the map excluded) is 1
         outcome = "Snake hit body - hit other"
-        snake_binary_map = self.snakes.get_snake_51_map(excluded_snakes=[snake]+snakes_eaten_this_turn)
-        if snake_binary_map[snake_head_location[0], snake_head_location[1]] == 1:
+        map_value = 0
+        for other_snake in self.snakes.get_snakes():
+            if other_snake == snake or other_snake in snakes_eaten_this_turn:
+                continue
+            if other_snake.is_alive() and not other_snake.is_head_outside_map():
+                if snake_head_cell == other_snake.get_head_cell():
+                    map_value += 5
+                elif snake_head_cell in other_snake.cells:
+                    map_value += 1
+        if map_value == 1:
             if self.verbose: print("Snake hit another snake")
             return True, outcome
 
@@ -280,17 +516,15 @@ class BattlesnakeGym(gym.Env):
                 continue
             if other_snake.is_alive():
                 if other_snake not in snakes_to_be_killed:
-                    other_snake_head = other_snake.get_head()
-                    for location in snake.get_body():
-                        if np.array_equal(location, other_snake_head):
-                            return False, "Other snake hit body"
+                    if other_snake.get_head_cell() in body_cells:
+                        return False, "Other snake hit body"
         
         if ate_another_snake:                            
             return False, "Ate another snake"
 
         return False, "Did not collide"
 
-    def step(self, actions, episodes=None):
+    def step(self, actions, episodes=None, out=None):
         '''
         Inherited function of the openAI gym. The steps taken mimic the steps provided in 
         https://docs.battlesnake.com/references/rules -> Programming Your Snake -> 3) Turn resolution.
@@ -302,6 +536,10 @@ class BattlesnakeGym(gym.Env):
             The integers range from 0 to 3 corresponding to Snake.UP, Snake.DOWN, Snake.LEFT, Snake.RIGHT 
             respectively
 
+        out: np.array, default None
+            Optional array (of shape and dtype observation_space) to write the observation into,
+            e.g., a slot of a replay buffer
+
         Returns:
         -------
 
@@ -310,23 +548,30 @@ class BattlesnakeGym(gym.Env):
 
         reward: {}
             The rewards obtained by each snake. 
-            Dictionary is of length number_of_snakes
+            Dictionary is of length number_of_snakes.
+            The rewards are computed by self.rewards from the events of each snake during
+            the turn (self.reward_events, see rewards.EVENTS)
 
         done: Bool
             Indication of whether the gym is complete or not.
             Gym is complete when there is only 1 snake remaining
         '''
 
-        # setup reward dict
-        reward = {}
+        prof = self.profiler
+        if prof is not None:
+            step_start = start = prof.clock()
+
+        # Count the events of each snake, the rewards are computed from the counts at the end
+        events = np.zeros((self.number_of_snakes, len(EVENTS)), dtype=np.int64)
         snake_info = {}
 
         # DEBUGING
         json_before_moving = self.get_json()
+        if prof is not None:
+            start = prof.record("step;debug_json", start)
         
         # Reduce health and move
         for i, snake in enumerate(self.snakes.get_snakes()):
-            reward[i] = 0
             if not snake.is_alive():
                 continue
 
@@ -334,7 +579,7 @@ class BattlesnakeGym(gym.Env):
             snake.health -= 1
             if snake.health == 0:
                 snake.kill_snake()
-                reward[i] += self.rewards.get_reward("starved", i, episodes)
+                events[i, EVENT_INDEX["starved"]] += 1
                 snake_info[i] = "Starved"
                 continue
 
@@ -342,7 +587,7 @@ class BattlesnakeGym(gym.Env):
             is_forbidden = snake.move(action)
             if is_forbidden:
                 snake.kill_snake()
-                reward[i] += self.rewards.get_reward("forbidden_move", i, episodes)
+                events[i, EVENT_INDEX["forbidden_move"]] += 1
                 snake_info[i] = "Forbidden move"
             
         # check for food and collision
@@ -350,77 +595,67 @@ class BattlesnakeGym(gym.Env):
         number_of_snakes_alive = 0
 
         
+        if prof is not None:
+            start = prof.record("step;move", start)
+
         # DEBUGING
         json_after_moving = self.get_json()
+        if prof is not None:
+            start = prof.record("step;debug_json", start)
         
         snakes_to_be_killed = []
+        collision_results = []
         for i, snake in enumerate(self.snakes.get_snakes()):
             if not snake.is_alive():
                 continue
 
-            snake_head_location = snake.get_head()
-
             # Check for collisions with the snake
             should_kill_snake, outcome = self._did_snake_collide(snake, snakes_to_be_killed)
             if should_kill_snake:
                 snakes_to_be_killed.append(snake)
+            collision_results.append((i, snake, should_kill_snake))
             snake_info[i] = outcome
 
-            # Check if snakes ate any food
+            # Count the event of the collision
+            if outcome in COLLISION_OUTCOME_EVENTS:
+                events[i, COLLISION_OUTCOME_EVENTS[outcome]] += 1
+        if prof is not None:
+            start = prof.record("step;collisions", start)
+
+        # Check if snakes ate any food
+        for i, snake, should_kill_snake in collision_results:
+            snake_head_location = snake.get_head()
             if not should_kill_snake and self.food.does_coord_have_food(snake_head_location):
                 number_of_food_eaten += 1
                 snake.set_ate_food()
                 self.food.remove_food_from_coord(snake_head_location)
-                reward[i] += self.rewards.get_reward("ate_food", i, episodes)
+                events[i, EVENT_INDEX["ate_food"]] += 1
+        if prof is not None:
+            start = prof.record("step;eat", start)
 
-            # Calculate rewards for collision
-            if outcome == "Snake hit wall":
-                reward[i] += self.rewards.get_reward("hit_wall", i, episodes)
-                
-            elif outcome == "Snake was eaten - same tile":
-                reward[i] += self.rewards.get_reward("was_eaten", i, episodes)
-                
-            elif outcome == "Snake was eaten - adjacent tile":
-                reward[i] += self.rewards.get_reward("was_eaten", i, episodes)
-                
-            elif outcome == "Snake hit body - hit itself":
-                reward[i] += self.rewards.get_reward("hit_self", i, episodes)
-                
-            elif outcome == "Snake hit body - hit other":
-                reward[i] += self.rewards.get_reward("hit_other_snake", i,
-                                                    episodes)
-
-            elif outcome == "Other snake hit body":
-                reward[i] += self.rewards.get_reward("other_snake_hit_body", i,
-                                                    episodes)
-                
-            elif outcome == "Did not collide":
-                pass
-                
-            elif outcome == "Ate another snake":
-                reward[i] += self.rewards.get_reward("ate_another_snake", i,
-                                                    episodes)
         for snake_to_be_killed in snakes_to_be_killed:
             snake_to_be_killed.kill_snake()
         
-        snakes_alive = []
-        for i, snake in enumerate(self.snakes.get_snakes()):
-            snakes_alive.append(snake.is_alive())
-            if snake.is_alive():
-                number_of_snakes_alive += 1
-                reward[i] += self.rewards.get_reward("another_turn", i, episodes)
+        snakes_alive = np.array([snake.is_alive() for snake in self.snakes.get_snakes()], dtype=bool)
+        number_of_snakes_alive = int(np.sum(snakes_alive))
+        events[snakes_alive, EVENT_INDEX["another_turn"]] += 1
+        if prof is not None:
+            start = prof.record("step;kill_snakes", start)
         
-        self.food.end_of_turn(self.snakes.get_snake_51_map())
+        self.food.end_of_turn()
+        if prof is not None:
+            start = prof.record("step;spawn_food", start)
 
-        if self.number_of_snakes > 1 and np.sum(snakes_alive) <= 1:
+        if self.number_of_snakes > 1 and number_of_snakes_alive <= 1:
             done = True
-            for i, is_snake_alive in enumerate(snakes_alive):
-                if is_snake_alive:
-                    reward[i] += self.rewards.get_reward("won", i, episodes)
-                else:
-                    reward[i] += self.rewards.get_reward("died", i, episodes)
+            events[snakes_alive, EVENT_INDEX["won"]] += 1
+            events[~snakes_alive, EVENT_INDEX["died"]] += 1
         else:
             done = False
+
+        self.reward_events = events
+        rewards = self.rewards.compute_rewards(events, episodes)
+        reward = {i: r for i, r in enumerate(rewards.tolist())}
             
         snake_alive_dict = {i: a for i, a in enumerate(np.logical_not(snakes_alive).tolist())}
         self.turn_count += 1
@@ -432,7 +667,8 @@ class BattlesnakeGym(gym.Env):
                 self.snake_max_len[i] += 1
             if i not in snake_info:
                 snake_info[i] = "Dead"
-        
+        if prof is not None:
+            start = prof.record("step;rewards_and_info", start)
                 
         sum_map = self.snakes.get_snake_51_map()
         if np.max(sum_map) > 5 or 2 in sum_map:
@@ -442,38 +678,141 @@ class BattlesnakeGym(gym.Env):
             print("after moving json {}".format(json_after_moving))
             print("final json {}".format(self.get_json()))
             raise
+        if prof is not None:
+            start = prof.record("step;sanity_check", start)
+
+        action_mask = self.get_action_mask()
+        if prof is not None:
+            start = prof.record("step;action_mask", start)
+
+        observation = self._get_observation(out)
+        if prof is not None:
+            prof.record("step;observation", start)
+            prof.record("step", step_start)
             
-        return self._get_observation(), reward, snake_alive_dict, {'current_turn': self.turn_count,
+        return observation, reward, snake_alive_dict, {'current_turn': self.turn_count,
                                                                    'snake_health': snakes_health,
                                                                    'snake_info': snake_info,
-                                                                   'snake_max_len': self.snake_max_len}
+                                                                   'snake_max_len': self.snake_max_len,
+                                                                   'reward_events': events,
+                                                                   'action_mask': action_mask}
                 
-    def _get_observation(self):
+    def get_action_mask(self):
+        '''
+        Get the actions of each snake that do not lead to a certain death on the next turn:
+        moving into a wall, reversing into its neck or moving into a body. The tails that will
+        move on the next turn are free. Moving next to the head of another snake is allowed.
+        The mask is computed from the occupancy of the index of free cells.
+
+        If a snake has no such action, the actions that are not into a wall or its neck are
+        allowed. Every action is allowed for dead snakes (their actions are ignored).
+
+        Returns:
+        --------
+        action_mask: np.array(number_of_snakes, 4) of bool
+            action_mask[i, action] is True if the action is allowed for snake i
+        '''
+        occupancy = self.free_cells.occupancy
+        food_map = self.food.locations_map.ravel()
+        snakes = self.snakes.get_snakes()
+
+        # The tail of a snake moves unless the snake ate food or is still growing at the start
+        vacated_cells = set()
+        for snake in snakes:
+            if snake.is_alive() and snake._number_of_initial_body_stacking == 0 and not snake.ate_food:
+                vacated_cells.add(snake.cells[0])
+
+        action_mask = [[True] * 4 for _ in range(self.number_of_snakes)]
+        for k, snake in enumerate(snakes):
+            if not snake.is_alive():
+                continue
+            legal = [False] * 4
+            safe = [False] * 4
+            for action, cell in enumerate(snake._move_table[snake.cells[-1]]):
+                if cell == OFF_BOARD:
+                    continue
+                if snake.is_facing_opposite_of_direction(action):
+                    continue
+                legal[action] = True
+                # The cell is occupied by nothing, by food only or by a tail moving away
+                safe[action] = occupancy[cell] == 0 or \
+                    (occupancy[cell] == 1 and (cell in vacated_cells or food_map[cell] == 1))
+            if any(safe):
+                action_mask[k] = safe
+            elif any(legal):
+                action_mask[k] = legal
+        return np.array(action_mask, dtype=bool)
+
+    def _get_observation(self, out=None):
         '''
         Helper function to generate the output observation.
+
+        Parameters:
+        -----------
+        out: np.array, default None
+            Array to write the observation into. If None, the observation is written into the
+            buffer preallocated by the gym (see reuse_observation_buffer)
         '''
-        if "flat" in self.observation_type:
-            return self._get_state()
-        elif "bordered" in self.observation_type:
-            state = self._get_state()
+        if "packed" in self.observation_type:
+            if out is None:
+                observation = self._get_packed_observation(out=self._observation_buffer)
+                return observation if self.reuse_observation_buffer else observation.copy()
+            return self._get_packed_observation(out=out)
 
-            if "max-bordered" in self.observation_type:
-                border_size = self.MAX_BORDER[0] - self.map_size[0]
-            else: 
-                border_size = 2
-                
-            bordered_state_shape = (state.shape[0]+border_size, state.shape[1]+border_size,
-                                    state.shape[2])
-            bordered_state = np.ones(shape=bordered_state_shape)*-1
-            
-            b = int(border_size/2)
-            bordered_state[b:-b, b:-b,:] = state
-            return bordered_state
+        if out is None:
+            self._get_state(out=self._observation_interior)
+            if self.reuse_observation_buffer:
+                return self._observation_buffer
+            return self._observation_buffer.copy()
 
-    def _get_state(self):
+        b = self._get_border_size() // 2
+        if b > 0:
+            # The border of a caller provided array is unknown, so write the frame around the map
+            out[:b] = -1
+            out[b+self.map_size[0]:] = -1
+            out[:, :b] = -1
+            out[:, b+self.map_size[1]:] = -1
+        self._get_state(out=self._get_observation_interior(out))
+        return out
+
+    def _get_packed_observation(self, out):
+        '''
+        Helper function to generate the observation of the packed observation types
+        '''
+        state = self._packed_state_buffer
+        state[:, :, 0] = self.food.get_food_map()
+        self.snakes.get_snake_depth_51_map(out=state[:, :, 1:])
+
+        snakes = self.snakes.get_snakes()
+        heads = [NO_HEAD] * self.number_of_snakes
+        for k, snake in enumerate(snakes):
+            if snake.is_alive() and not snake.is_head_outside_map():
+                heads[k] = snake.get_head_cell()
+        health = None
+        if "health" in self.observation_type:
+            health = [snake.health if snake.is_alive() else 0 for snake in snakes]
+        return pack_observation(state.transpose(2, 0, 1), heads, health, out=out)
+
+    def get_observation(self, out=None):
+        '''
+        Generate the observation of the current state of the gym.
+
+        Parameters:
+        -----------
+        out: np.array, default None
+            Optional array (of shape and dtype observation_space) to write the observation into
+        '''
+        return self._get_observation(out)
+
+    def _get_state(self, out=None):
         ''''
         Helper function to generate the state of the game.
 
+        Parameters:
+        -----------
+        out: np.array(map_size[1], map_size[2], number_of_snakes + 1), default None
+            Optional array to write the state into
+
         Returns:
         --------
         state: np.array(map_size[1], map_size[2], number_of_snakes + 1)
@@ -481,75 +820,160 @@ class BattlesnakeGym(gym.Env):
             state[:, :, 1:] corrsponds to binary images of the locations of other snakes
         '''
         FOOD_INDEX = 0
-        SNAKE_INDEXES = FOOD_INDEX + np.array(range(1, self.number_of_snakes + 1))
+        SNAKE_INDEXES = slice(FOOD_INDEX + 1, FOOD_INDEX + 1 + self.number_of_snakes)
 
         depth_of_state = 1 + self.snakes.number_of_snakes
-        state = np.zeros((self.map_size[0], self.map_size[1], depth_of_state),
-                         dtype=np.uint8)
+        if out is None:
+            state = np.zeros((self.map_size[0], self.map_size[1], depth_of_state),
+                             dtype=np.uint8)
+        else:
+            state = out
 
         # Include the postions of the food
         state[:, :, FOOD_INDEX] = self.food.get_food_map()
         
         # Include the positions of the snakes
         if "51s" in self.observation_type:
-            state[:, :, SNAKE_INDEXES] = self.snakes.get_snake_depth_51_map()
+            self.snakes.get_snake_depth_51_map(out=state[:, :, SNAKE_INDEXES])
         else:
-            state[:, :, SNAKE_INDEXES] = self.snakes.get_snake_depth_numbered_map()   
+            self.snakes.get_snake_depth_numbered_map(out=state[:, :, SNAKE_INDEXES])
         return state
 
-    def _get_board(self, state):
+    def _get_board(self, state, out=None):
         ''''
         Generate visualisation of the gym. Based on the state (generated by _get_state).
+
+        Parameters:
+        ----------
+        out: np.array, optional, default=None
+            Array to write the image into, e.g., a frame of a preallocated video buffer
         '''
-        
-        FOOD_INDEX = 0
-        SNAKE_INDEXES = FOOD_INDEX + np.array(range(1, self.number_of_snakes + 1))
+        if self.renderer is None or self.renderer.map_size != tuple(self.map_size):
+            self.renderer = BoardRenderer(self.map_size, self.number_of_snakes)
+        return self.renderer.render(state, self.snakes.get_snake_colours(), out=out)
+    
+    def get_state(self):
+        '''
+        Take a snapshot of the gym that can be restored with set_state, e.g., to branch the game
+        in a tree search. The snapshot includes the snakes, the food, the pending food spawn
+        locations, the index of free cells and the state of the random number generator.
 
-        BOUNDARY = 20
-        BOX_SIZE = 40
-        SPACE_BETWEEN_BOXES = 10
-        snake_colours = self.snakes.get_snake_colours()
-        
-        # Create board
-        board_size = (self.map_size[0]*(BOX_SIZE + SPACE_BETWEEN_BOXES) + 2*BOUNDARY,
-                      self.map_size[1]*(BOX_SIZE + SPACE_BETWEEN_BOXES) + 2*BOUNDARY)
-        board = np.ones((board_size[0], board_size[1], 3), dtype=np.uint8) * 255
+        Returns:
+        -------
+        state: np.array(int64)
+            Flat buffer holding, in order:
+            - a header: version, map height, map width, number of snakes, turn count,
+              number of pending food spawn locations, number of free cells
+            - for each snake: is alive, health, facing direction (-1 if None), ate food,
+              initial body stacking, length, max length, colour (r, g, b)
+            - the cells of the snakes (i * map width + j, from tail to head) and the pending food
+              spawn locations
+            - the food map, the free cells, their positions and their occupancy
+            - the state of the PCG64 generator of self.np_random: state and increment (as
+              128 bit integers split into 64 bit words), has_uint32, uinteger
+        '''
+        header = [self.SNAPSHOT_VERSION, self.map_size[0], self.map_size[1],
+                  self.number_of_snakes, self.turn_count, len(self.food.food_spawn_locations),
+                  self.free_cells.number_of_free_cells]
+
+        snake_values = []
+        for i, snake in enumerate(self.snakes.get_snakes()):
+            facing_direction = -1 if snake.facing_direction is None else snake.facing_direction
+            snake_values += [snake.is_alive(), snake.health, facing_direction, snake.ate_food,
+                             snake._number_of_initial_body_stacking, len(snake.cells),
+                             self.snake_max_len[i]]
+            snake_values += list(snake.colour)
 
-        # Create boxes
-        for i in range(0, self.map_size[0]):
-            for j in range(0, self.map_size[1]):
-                state_value = state[i][j]
+        sections = [np.array(header + snake_values, dtype=np.int64)]
+        for snake in self.snakes.get_snakes():
+            if len(snake.cells) > 0:
+                sections.append(np.array(snake.cells, dtype=np.int64))
+        if len(self.food.food_spawn_locations) > 0:
+            sections.append(np.array(self.food.food_spawn_locations, dtype=np.int64).ravel())
+        sections.append(self.food.locations_map.ravel().astype(np.int64))
+        sections.append(np.array(self.free_cells.cells, dtype=np.int64))
+        sections.append(np.array(self.free_cells.positions, dtype=np.int64))
+        sections.append(np.array(self.free_cells.occupancy, dtype=np.int64))
 
-                t_i1 = BOUNDARY + i * (BOX_SIZE + SPACE_BETWEEN_BOXES)
-                t_i2 = t_i1 + BOX_SIZE
+        # Random number generator
+        rng_state = self.np_random.bit_generator.state
+        if rng_state["bit_generator"] != "PCG64":
+            raise ValueError("Only the PCG64 random number generator can be saved")
+        pcg_state, increment = rng_state["state"]["state"], rng_state["state"]["inc"]
+        words = [pcg_state >> 64, pcg_state & 0xFFFFFFFFFFFFFFFF, increment >> 64, increment & 0xFFFFFFFFFFFFFFFF]
+        sections.append(np.array(words, dtype=np.uint64).view(np.int64))
+        sections.append(np.array([rng_state["has_uint32"], rng_state["uinteger"]], dtype=np.int64))
 
-                t_j1 = BOUNDARY + j * (BOX_SIZE + SPACE_BETWEEN_BOXES)
-                t_j2 = t_j1 + BOX_SIZE
+        return np.concatenate(sections)
 
+    def set_state(self, state):
+        '''
+        Restore the gym to a snapshot taken by get_state. The map size and number of snakes
+        of the snapshot must be identical to the gym.
+
+        Parameters:
+        ----------
+        state: np.array(int64)
+            Snapshot returned by get_state
+        '''
+        version, height, width, number_of_snakes, turn_count, number_of_pending_food, \
+            number_of_free_cells = state[:7].tolist()
+        if version != self.SNAPSHOT_VERSION:
+            raise ValueError("Unsupported snapshot version {}".format(version))
+        if (height, width) != tuple(self.map_size) or number_of_snakes != self.number_of_snakes:
+            raise ValueError("Map size or number of snakes of the snapshot is incorrect")
+        number_of_cells = height * width
+
+        if getattr(self, "snakes", None) is None:
+            # The gym was never reset, create placeholder snakes and food to restore into
+            self.snakes = Snakes.make_from_dict(self.map_size, [{"body": [], "health": 0}] * number_of_snakes,
+                                                 rng=self.np_random)
+            self.food = Food(self.map_size, food_spawn_chance=self.food_spawn_chance,
+                             minimum_food=self.minimum_food, rng=self.np_random)
+            self.free_cells = FreeCells(self.map_size, rng=self.np_random)
+            self.snakes.attach_free_cells(self.free_cells)
+            self.food.attach_free_cells(self.free_cells)
+
+        self.turn_count = turn_count
+        self.snake_max_len = {}
+        offset = 7 + self.SNAKE_SNAPSHOT_SIZE * number_of_snakes
+        snake_values = state[7:offset].reshape(number_of_snakes, self.SNAKE_SNAPSHOT_SIZE).tolist()
+        for i, (snake, values) in enumerate(zip(self.snakes.get_snakes(), snake_values)):
+            is_alive, health, facing_direction, ate_food, stacking, length, max_len = values[:7]
+            snake._is_alive = bool(is_alive)
+            snake.health = health
+            snake.facing_direction = None if facing_direction == -1 else facing_direction
+            snake.ate_food = bool(ate_food)
+            snake._number_of_initial_body_stacking = stacking
+            snake.colour = values[7:]
+            snake.cells = state[offset:offset + length].tolist()
+            snake.free_cells = self.free_cells
+            self.snake_max_len[i] = max_len
+            offset += length
+
+        pending_food = state[offset:offset + 2*number_of_pending_food].reshape(-1, 2).tolist()
+        self.food.food_spawn_locations = [tuple(location) for location in pending_food]
+        offset += 2*number_of_pending_food
+        self.food.locations_map[...] = state[offset:offset + number_of_cells].reshape(self.map_size)
+        offset += number_of_cells
+        self.food.free_cells = self.free_cells
+
+        self.free_cells.cells = state[offset:offset + number_of_cells].tolist()
+        offset += number_of_cells
+        self.free_cells.positions = state[offset:offset + number_of_cells].tolist()
+        offset += number_of_cells
+        self.free_cells.occupancy = state[offset:offset + number_of_cells].tolist()
+        offset += number_of_cells
+        self.free_cells.number_of_free_cells = number_of_free_cells
+
+        # Random number generator
+        state_high, state_low, increment_high, increment_low = state[offset:offset + 4].view(np.uint64).tolist()
+        has_uint32, uinteger = state[offset + 4:offset + 6].tolist()
+        self.np_random.bit_generator.state = {"bit_generator": "PCG64",
+                                              "state": {"state": (state_high << 64) | state_low,
+                                                        "inc": (increment_high << 64) | increment_low},
+                                              "has_uint32": has_uint32, "uinteger": uinteger}
 
-                board[t_i1:t_i2, t_j1:t_j2] = 255 * 0.7
-                
-                # If state contains food
-                if state_value[FOOD_INDEX] >= 1:
-                    box_margin = int(BOX_SIZE/5)
-                    board[t_i1 + box_margin:t_i2 - box_margin,
-                          t_j1 + box_margin:t_j2 - box_margin] = [255, 0, 0]
-
-                # If state contains a snake body
-                if 1 in state_value[SNAKE_INDEXES]:
-                    snake_present_in = np.argmax(state_value[SNAKE_INDEXES])
-                    board[t_i1:t_i2, t_j1:t_j2] = snake_colours[snake_present_in]
-                    
-                # If state contains a snake head
-                if 5 in state_value[SNAKE_INDEXES]:
-                    snake_present_in = np.argmax(state_value[SNAKE_INDEXES])
-                    board[t_i1:t_i2, t_j1:t_j2] = snake_colours[snake_present_in]
-                    t_i_h = 10
-                    t_j_h = 10
-                    board[(t_i1+t_i_h):(t_i2-t_i_h), (t_j1+t_j_h):(t_j2-t_j_h)] = [255, 255, 255]
-
-        return board
-    
     def get_json(self):
         '''
         Generate a json representation of the gym following the same input as the battlesnake
@@ -566,7 +990,7 @@ class BattlesnakeGym(gym.Env):
         # Get food
         food_list = []
         y, x = np.where(self.food.locations_map==1)
-        for x_, y_ in zip(x, y):
+        for x_, y_ in zip(x.tolist(), y.tolist()):
             food_list.append({"x": x_, "y": y_})
         
         # Get snakes
@@ -574,10 +998,10 @@ class BattlesnakeGym(gym.Env):
         for i, snakes in enumerate(self.snakes.snakes):
             snake_location = []
             for coord in snakes.locations[::-1]:
-                snake_location.append({"x": coord[1], "y": coord[0]})
+                snake_location.append({"x": int(coord[1]), "y": int(coord[0])})
                 
             snake_dict = {}
-            snake_dict["health"] = snakes.health
+            snake_dict["health"] = int(snakes.health)
             snake_dict["body"] = snake_location
             snake_dict["id"] = i
             snake_dict["name"] = "Snake {}".format(i)
@@ -590,6 +1014,99 @@ class BattlesnakeGym(gym.Env):
                         }
         return json
 
+    def _get_coordinate_strings(self):
+        '''
+        Helper function to get the json of the coordinate of each cell, built once per map size.
+
+        Returns:
+        --------
+        cells: [str]
+            Json of cell i * map_size[1] + j
+        '''
+        map_size = tuple(self.map_size)
+        if getattr(self, "_coordinate_strings_map_size", None) != map_size:
+            cells = ['{{"x":{},"y":{}}}'.format(j, i)
+                     for i in range(map_size[0]) for j in range(map_size[1])]
+            self._coordinate_strings = cells
+            self._coordinate_strings_map_size = map_size
+        return self._coordinate_strings
+
+    def _get_snake_json_strings(self):
+        '''
+        Helper function to get the json of each snake alive in the Battlesnake API format.
+
+        Returns:
+        --------
+        snake_jsons: {int: str}
+        '''
+        cells = self._get_coordinate_strings()
+        snake_jsons = {}
+        for i, snake in enumerate(self.snakes.get_snakes()):
+            if not snake.is_alive():
+                continue
+            # The body starts with the head in the API
+            body = [cells[cell] for cell in reversed(snake.cells)]
+            snake_jsons[i] = ('{{"id":"{0}","name":"Snake {0}","health":{1},"body":[{2}],'
+                              '"head":{3},"length":{4},"latency":"0","shout":""}}').format(
+                              i, int(snake.health), ",".join(body), body[0], len(body))
+        return snake_jsons
+
+    def _get_board_json_string(self, snake_jsons):
+        '''
+        Helper function to get the json of the board in the Battlesnake API format
+        '''
+        cells = self._get_coordinate_strings()
+        food = [cells[cell] for cell in np.flatnonzero(self.food.get_food_map()).tolist()]
+        return '{{"height":{},"width":{},"food":[{}],"hazards":[],"snakes":[{}]}}'.format(
+            self.map_size[0], self.map_size[1], ",".join(food), ",".join(snake_jsons.values()))
+
+    def _get_move_requests(self, game_json):
+        snake_jsons = self._get_snake_json_strings()
+        prefix = '{{"game":{},"turn":{},"board":{},"you":'.format(
+            game_json, int(self.turn_count), self._get_board_json_string(snake_jsons))
+        return {i: (prefix + snake_json + "}").encode() for i, snake_json in snake_jsons.items()}
+
+    def get_move_requests(self, game=None):
+        '''
+        Generate the body of the /move request of the Battlesnake API for each snake alive.
+        The json is written directly from the internal arrays: the bodies start with the head,
+        the ids are strings and the eliminated snakes are not included in the board.
+        The board is serialised once and shared by the requests of every snake.
+
+        Parameters:
+        ----------
+        game: dict, optional, default=None
+            The "game" object of the requests. DEFAULT_API_GAME is used if None
+
+        Returns:
+        --------
+        requests: {int: bytes}
+            The utf-8 json request of each snake alive, indexed by the snake index
+        '''
+        if game is None:
+            game = DEFAULT_API_GAME
+        return self._get_move_requests(json.dumps(game, separators=(",", ":")))
+
+    def get_json_bytes(self, you=0, game=None):
+        '''
+        Generate the body of the /move request of the Battlesnake API of the snake you.
+        See get_move_requests.
+
+        Parameters:
+        ----------
+        you: int, optional, default=0
+            Index of the snake receiving the request, it must be alive
+        game: dict, optional, default=None
+
+        Returns:
+        --------
+        request: bytes
+        '''
+        requests = self.get_move_requests(game)
+        if you not in requests:
+            raise ValueError("Snake {} is not alive".format(you))
+        return requests[you]
+
     def _get_ascii(self):
         '''
         Generate visualisation of the gym. Prints ascii representation of the gym.
@@ -655,7 +1172,7 @@ class BattlesnakeGym(gym.Env):
             
         return ascii_string
         
-    def render(self, mode="ascii"):
+    def render(self, mode="ascii", out=None):
         '''
         Inherited function from openAI gym to visualise the progression of the gym
         
@@ -664,10 +1181,13 @@ class BattlesnakeGym(gym.Env):
         mode: str, options=["human", "rgb_array"]
             mode == human will present the gym in a separate window
             mode == rgb_array will return the gym in np.arrays
+
+        out: np.array, optional, default=None
+            With mode == rgb_array, array to write the image into (e.g., video_buffer[frame_index])
         '''
         state = self._get_state()
         if mode == "rgb_array":
-            return self._get_board(state)
+            return self._get_board(state, out=out)
         elif mode == "ascii":
             ascii = self._get_ascii()
             print(ascii)
@@ -681,3 +1201,43 @@ class BattlesnakeGym(gym.Env):
         #         self.viewer = rendering.SimpleImageViewer()
         #     self.viewer.imshow(board)
         #     return self.viewer.isopen
+
+def get_move_requests_batch(envs, game=None):
+    '''
+    Batched version of BattlesnakeGym.get_move_requests for many environments, the "game" object
+    is serialised only once.
+
+    Parameters:
+    ----------
+    envs: [BattlesnakeGym]
+    game: dict, optional, default=None
+
+    Returns:
+    --------
+    requests: [{int: bytes}]
+        The requests of the snakes alive in each environment
+    '''
+    if game is None:
+        game = DEFAULT_API_GAME
+    game_json = json.dumps(game, separators=(",", ":"))
+    return [env._get_move_requests(game_json) for env in envs]
+
+def seed_envs(envs, seed=None):
+    '''
+    Seed many environments at once. Each environment is given an independent random stream
+    spawned from np.random.SeedSequence(seed), so the games can be replayed from the seed alone.
+
+    Parameters:
+    ----------
+    envs: [BattlesnakeGym]
+    seed: int, optional, default=None
+
+    Returns:
+    --------
+    seed_sequences: [np.random.SeedSequence]
+        The seed of each environment
+    '''
+    seed_sequences = np.random.SeedSequence(seed).spawn(len(envs))
+    for env, seed_sequence in zip(envs, seed_sequences):
+        env.seed(seed_sequence)
+    return seed_sequences
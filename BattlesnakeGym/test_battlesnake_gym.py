@@ -11,16 +11,28 @@
 # express or implied. See the License for the specific language governing 
 # permissions and limitations under the License.
 
+import json
 import os
+import tempfile
 import time
 import unittest
+from functools import partial
 
 import numpy as np
 
-from snake_gym import BattlesnakeGym
+from snake_gym import BattlesnakeGym, get_move_requests_batch, API_MOVE_TO_ACTION, seed_envs
 from snake import Snake
-
-from test_utils import grow_snake, grow_two_snakes, SHOULD_RENDER, VERBOSE, simulate_snake
+from vec_env import SubprocVecEnv
+from episode_recorder import EpisodeRecorder, EpisodeReader
+from data_pipeline import generate_transitions, write_shards, iterate_shards
+from game_state_parser import parse_batch
+from rewards import Rewards, SimpleRewards, EVENTS, EVENT_INDEX
+from packed_observation import unpack_observation, unpack_observations
+from replay_buffer import ReplayBuffer, ReplayBufferReader
+from board_tables import get_neighbours, get_wall_mask, get_manhattan_distances, OFF_BOARD
+
+from test_utils import grow_snake, grow_two_snakes, SHOULD_RENDER, VERBOSE, simulate_snake, \
+    render_board_reference
 
 class TestBattlesnakeGym(unittest.TestCase):
     '''
@@ -343,6 +355,607 @@ class TestBattlesnakeGym(unittest.TestCase):
         self.assertTrue(np.array_equal(observation[:, :, 0],  food_state))
         self.assertTrue(np.array_equal(observation[:, :, 1],  snake_state))
 
+    def test_bordered_observations(self):
+        '''
+        Test that the bordered observations hold the flat state surrounded by -1, including when
+        they are written into a caller provided array
+        '''
+        snake_location = [(0, 0)]
+        food_location = [(1, 0)]
+        flat_env = BattlesnakeGym(observation_type="flat-51s", map_size=(8, 8), number_of_snakes=1,
+                                  snake_spawn_locations=snake_location,
+                                  food_spawn_locations=food_location, verbose=VERBOSE, food_spawn_chance=0.0)
+        flat_env.reset()
+        flat_observation, _, _, _ = flat_env.step([Snake.RIGHT])
+
+        for observation_type, border in [("bordered-51s", 1), ("max-bordered-51s", 6)]:
+            env = BattlesnakeGym(observation_type=observation_type, map_size=(8, 8), number_of_snakes=1,
+                                 snake_spawn_locations=snake_location,
+                                 food_spawn_locations=food_location, verbose=VERBOSE, food_spawn_chance=0.0)
+            env.reset()
+            observation, _, _, _ = env.step([Snake.RIGHT])
+
+            self.assertEqual(observation.dtype, env.observation_space.dtype)
+            self.assertEqual(observation.shape, env.observation_space.shape)
+            self.assertTrue(np.array_equal(observation[border:border+8, border:border+8], flat_observation))
+            self.assertEqual(np.sum(observation == -1), observation.size - flat_observation.size)
+
+            out = np.zeros(env.observation_space.shape, dtype=env.observation_space.dtype)
+            returned = env.get_observation(out=out)
+            self.assertTrue(returned is out)
+            self.assertTrue(np.array_equal(out, observation))
+            env.close()
+        flat_env.close()
+
+    def test_free_cells(self):
+        '''
+        Test that the index of free cells is kept up to date with the snakes and food, and that
+        the minimum food is maintained
+        '''
+        rng = np.random.default_rng(0)
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=3, verbose=VERBOSE,
+                             food_spawn_chance=0.5, minimum_food=2, seed=0)
+        env.reset()
+
+        for _ in range(50):
+            occupied_map = env.snakes.get_snake_51_map() + env.food.get_food_map()
+            self.assertTrue(np.array_equal(env.free_cells.get_free_map(), occupied_map == 0))
+            self.assertTrue(env.food.get_food_map().sum() >= 2)
+
+            _, _, dones, _ = env.step(rng.integers(0, 4, size=3))
+            if all(dones.values()):
+                break
+        env.close()
+
+    def test_vec_env(self):
+        '''
+        Test that the subprocess vector environment returns the same observations, rewards and
+        dones as stepping the environments in this process
+        '''
+        env_fns = [partial(BattlesnakeGym, map_size=(7, 7), number_of_snakes=2,
+                           snake_spawn_locations=[(0, 0), (6, 6)], food_spawn_locations=[(3, 3)],
+                           verbose=VERBOSE, food_spawn_chance=0.0),
+                   partial(BattlesnakeGym, map_size=(7, 7), number_of_snakes=2,
+                           snake_spawn_locations=[(1, 1), (5, 5)], food_spawn_locations=[(3, 3)],
+                           verbose=VERBOSE, food_spawn_chance=0.0)]
+        envs = [env_fn() for env_fn in env_fns]
+        vec_env = SubprocVecEnv(env_fns)
+
+        observations, _ = vec_env.reset()
+        for e, env in enumerate(envs):
+            observation, _, _, _ = env.reset()
+            self.assertTrue(np.array_equal(observations[e], observation))
+
+        actions = np.array([[[Snake.DOWN, Snake.UP], [Snake.RIGHT, Snake.LEFT]],
+                            [[Snake.RIGHT, Snake.UP], [Snake.DOWN, Snake.LEFT]],
+                            [[Snake.RIGHT, Snake.LEFT], [Snake.DOWN, Snake.UP]]])
+        for step_actions in actions:
+            vec_env.step_async(step_actions)
+            observations, rewards, dones, infos = vec_env.step_wait()
+            for e, env in enumerate(envs):
+                observation, reward, done, info = env.step(step_actions[e])
+                self.assertTrue(np.array_equal(observations[e], observation))
+                self.assertEqual(rewards[e].tolist(), [reward[0], reward[1]])
+                self.assertEqual(dones[e].tolist(), [done[0], done[1]])
+                self.assertEqual(infos["current_turn"][e], info["current_turn"])
+                self.assertTrue(np.array_equal(infos["action_mask"][e], info["action_mask"]))
+
+        vec_env.close()
+        for env in envs:
+            env.close()
+
+    def test_get_set_state(self):
+        '''
+        Test that restoring a snapshot replays the game exactly, including the random food spawns
+        '''
+        rng = np.random.default_rng(0)
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE, food_spawn_chance=0.5,
+                             food_spawn_locations=[(3, 3)]*3, seed=0)
+        env.reset()
+        env.step([Snake.UP, Snake.UP])
+
+        actions = rng.integers(0, 4, size=(6, 2))
+        state = env.get_state()
+        trajectory = []
+        for action in actions:
+            observation, reward, dones, _ = env.step(action)
+            trajectory.append((observation, reward, dones, env.get_json()))
+
+        for restored_env in [env, BattlesnakeGym(map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE,
+                                                 food_spawn_chance=0.5)]:
+            restored_env.set_state(state)
+            self.assertTrue(np.array_equal(restored_env.get_state(), state))
+            for action, (observation, reward, dones, json) in zip(actions, trajectory):
+                restored_observation, restored_reward, restored_dones, _ = restored_env.step(action)
+                self.assertTrue(np.array_equal(restored_observation, observation))
+                self.assertEqual(restored_reward, reward)
+                self.assertEqual(restored_dones, dones)
+                self.assertEqual(str(restored_env.get_json()), str(json))
+        env.close()
+
+    def test_render_rgb_array(self):
+        '''
+        Test that the rgb_array rendering is pixel identical to painting each cell in a loop,
+        and that frames can be written into a preallocated video buffer
+        '''
+        for observation_type in ["flat-51s", "flat-num"]:
+            rng = np.random.default_rng(0)
+            env = BattlesnakeGym(observation_type=observation_type, map_size=(6, 8), number_of_snakes=3,
+                                 verbose=VERBOSE, food_spawn_chance=0.5, seed=0)
+            env.reset()
+            frame = env.render(mode="rgb_array")
+            video = np.zeros((10,) + frame.shape, dtype=np.uint8)
+            for t in range(10):
+                returned = env.render(mode="rgb_array", out=video[t])
+                self.assertTrue(returned is video[t] or np.shares_memory(returned, video))
+                expected = render_board_reference(env._get_state(), env.map_size, env.number_of_snakes,
+                                                  env.snakes.get_snake_colours())
+                self.assertTrue(np.array_equal(video[t], expected))
+                env.step(rng.integers(0, 4, size=3))
+            env.close()
+
+    def test_episode_recorder(self):
+        '''
+        Test that every turn of the recorded episodes can be rebuilt from the episode file
+        '''
+        rng = np.random.default_rng(0)
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=3, verbose=VERBOSE, food_spawn_chance=0.5,
+                             seed=0)
+        expected_turns = []
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "episodes.bin")
+            with EpisodeRecorder(path, env.map_size, env.number_of_snakes) as recorder:
+                for _ in range(2):
+                    env.reset()
+                    recorder.record_reset(env)
+                    expected_turns.append(env.get_json())
+                    for _ in range(20):
+                        env.step(rng.integers(0, 4, size=3))
+                        recorder.record_step(env)
+                        expected_turns.append(env.get_json())
+
+            with EpisodeReader(path) as reader:
+                self.assertEqual(len(reader), len(expected_turns))
+                self.assertEqual(reader.episode_starts, [0, 21])
+                for turn, expected_turn in zip(reader.iter_turns(), expected_turns):
+                    self.assertEqual(turn, expected_turn)
+                for index in [0, 5, 20, 21, 30]:
+                    self.assertEqual(reader.get_turn(index), expected_turns[index])
+        env.close()
+
+    def test_data_pipeline(self):
+        '''
+        Test that the transitions of self-play episodes are written into shards and that the
+        shuffled loader returns each transition once
+        '''
+        env_fn = partial(BattlesnakeGym, map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE, seed=0)
+        transitions = list(generate_transitions(env_fn, number_of_episodes=3, seed=0))
+        self.assertTrue(transitions[-1][3].all())
+        for observation, action, reward, done, legal_mask in transitions:
+            self.assertEqual(observation.shape, (7, 7, 3))
+            self.assertEqual(legal_mask.shape, (2, 4))
+            self.assertTrue(legal_mask.any(axis=1).all())
+
+        with tempfile.TemporaryDirectory() as directory:
+            number_of_transitions = write_shards(iter(transitions), directory, chunk_size=8)
+            self.assertEqual(number_of_transitions, len(transitions))
+            self.assertEqual(len(os.listdir(directory)), (len(transitions) + 7) // 8)
+
+            batches = list(iterate_shards(directory, batch_size=5, seed=0))
+            self.assertTrue(all(len(batch["action"]) == 5 for batch in batches[:-1]))
+            loaded_observations = np.concatenate([batch["observation"] for batch in batches])
+            self.assertEqual(len(loaded_observations), len(transitions))
+            expected_sums = sorted(int(transition[0].sum()) for transition in transitions)
+            self.assertEqual(sorted(loaded_observations.reshape(len(transitions), -1).sum(axis=1).tolist()),
+                             expected_sums)
+
+    def test_parse_batch(self):
+        '''
+        Test that a batch of game states parsed in bulk seeds gyms identical to the original ones
+        '''
+        rng = np.random.default_rng(0)
+        env = BattlesnakeGym(map_size=(7, 9), number_of_snakes=3, verbose=VERBOSE, food_spawn_chance=0.5,
+                             seed=0)
+        env.reset()
+        game_dicts, observations = [], []
+        for _ in range(10):
+            observation, _, _, _ = env.step(rng.integers(0, 4, size=3))
+            game_dicts.append(env.get_json())
+            observations.append(observation)
+
+        batch = parse_batch(iter(game_dicts))
+        self.assertEqual(len(batch), 10)
+        self.assertEqual(batch.food.shape, (10, 7, 9))
+
+        seeded_env = BattlesnakeGym(map_size=(7, 9), number_of_snakes=3, verbose=VERBOSE)
+        for index, (game_dict, observation) in enumerate(zip(game_dicts, observations)):
+            for k, snake_dict in enumerate(game_dict["board"]["snakes"]):
+                self.assertEqual(batch.lengths[index, k], len(snake_dict["body"]))
+                self.assertEqual(batch.health[index, k], snake_dict["health"])
+            seeded_observation, _, _, _ = seeded_env.load_game_state(*batch.parse(index))
+            self.assertTrue(np.array_equal(seeded_observation, observation))
+            self.assertEqual(seeded_env.turn_count, game_dict["turn"])
+            self.assertEqual(batch.to_game_dict(index)["board"]["food"], game_dict["board"]["food"])
+        env.close()
+
+    def test_move_requests(self):
+        '''
+        Test that the API requests exported as bytes match get_json and the API conventions
+        '''
+        rng = np.random.default_rng(0)
+        envs = [BattlesnakeGym(map_size=(7, 9), number_of_snakes=3, verbose=VERBOSE, food_spawn_chance=0.5,
+                               seed=seed) for seed in range(2)]
+        for env in envs:
+            env.reset()
+        for _ in range(15):
+            for env, requests in zip(envs, get_move_requests_batch(envs)):
+                # get_json holds native ints only
+                board = json.loads(json.dumps(env.get_json()))["board"]
+                alive = [i for i, snake in enumerate(env.snakes.get_snakes()) if snake.is_alive()]
+                self.assertEqual(sorted(requests.keys()), alive)
+                for i, request in requests.items():
+                    self.assertEqual(request, env.get_json_bytes(you=i))
+                    request = json.loads(request)
+                    self.assertEqual(request["turn"], env.turn_count)
+                    self.assertEqual(request["board"]["food"], board["food"])
+                    self.assertEqual([snake["id"] for snake in request["board"]["snakes"]],
+                                     [str(k) for k in alive])
+                    for snake in request["board"]["snakes"]:
+                        self.assertEqual(snake["body"], board["snakes"][int(snake["id"])]["body"])
+                        self.assertEqual(snake["head"], snake["body"][0])
+                        self.assertEqual(snake["length"], len(snake["body"]))
+                    self.assertEqual(request["you"]["id"], str(i))
+                env.step(rng.integers(0, 4, size=3))
+
+        for env in envs:
+            env.close()
+
+        # Moving "up" in the API increases y
+        env = BattlesnakeGym(map_size=(7, 9), number_of_snakes=1, snake_spawn_locations=[[3, 3]],
+                             verbose=VERBOSE, food_spawn_chance=0)
+        env.reset()
+        env.step([API_MOVE_TO_ACTION["up"]])
+        self.assertEqual(json.loads(env.get_json_bytes())["you"]["head"], {"x": 3, "y": 4})
+        env.step([API_MOVE_TO_ACTION["right"]])
+        self.assertEqual(json.loads(env.get_json_bytes())["you"]["head"], {"x": 4, "y": 4})
+        env.close()
+
+    def test_reward_events(self):
+        '''
+        Test that the rewards are computed from the event matrix for table-based and custom
+        reward schemes
+        '''
+        class PerSnakeRewards(Rewards):
+            def get_reward(self, name, snake_id, episode):
+                return (snake_id + 1) * (EVENTS.index(name) + 1)
+
+        simple_rewards = SimpleRewards({"ate_food": 5, "died": -10})
+        for rewards in [simple_rewards, PerSnakeRewards()]:
+            rng = np.random.default_rng(0)
+            env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=3, verbose=VERBOSE,
+                                 food_spawn_chance=0.5, rewards=rewards, seed=0)
+            env.reset()
+            done = False
+            while not done:
+                _, reward, dones, info = env.step(rng.integers(0, 4, size=3))
+                events = info["reward_events"]
+                self.assertEqual(events.shape, (3, len(EVENTS)))
+                for i in range(3):
+                    expected = sum(events[i, k] * rewards.get_reward(name, i, None)
+                                   for k, name in enumerate(EVENTS))
+                    self.assertEqual(reward[i], expected)
+                    self.assertEqual(events[i, EVENT_INDEX["another_turn"]], int(not dones[i]))
+                done = sum(dones.values()) >= 2
+            self.assertTrue(np.array_equal(env.reward_events, events))
+            self.assertEqual(events[:, EVENT_INDEX["won"]].sum() + events[:, EVENT_INDEX["died"]].sum(), 3)
+            env.close()
+
+        # The weights are only rebuilt when the number of snakes or the episode changes
+        class CountingRewards(Rewards):
+            calls = 0
+
+            def get_reward(self, name, snake_id, episode):
+                CountingRewards.calls += 1
+                return 1
+
+        rewards = CountingRewards()
+        events = np.ones((3, len(EVENTS)))
+        for episode in [None, None, 1, 1]:
+            self.assertEqual(rewards.compute_rewards(events, episode).tolist(), [len(EVENTS)] * 3)
+        self.assertEqual(CountingRewards.calls, 2 * 3 * len(EVENTS))
+
+    def test_seeding(self):
+        '''
+        Test that seeded gyms replay the same games regardless of the global random state
+        '''
+        def play(env, reset_seed=None):
+            observations = [env.reset(seed=reset_seed)[0]]
+            for actions in all_actions:
+                observations.append(env.step(actions)[0])
+                np.random.random() # The global random state must not change the games
+            return observations
+
+        all_actions = np.random.default_rng(0).integers(0, 4, size=(30, 3))
+        make_env = partial(BattlesnakeGym, map_size=(9, 9), number_of_snakes=3, verbose=VERBOSE,
+                           food_spawn_chance=0.5)
+
+        games = [play(make_env(seed=3)) for _ in range(2)]
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip(*games)))
+        env = make_env()
+        replayed_game = play(env, reset_seed=3)
+        self.assertTrue(all(np.array_equal(a, b) for a, b in zip(games[0], replayed_game)))
+        env.close()
+
+        # Environments seeded at once have independent streams and can be replayed
+        envs = [make_env() for _ in range(3)]
+        seed_envs(envs, seed=7)
+        games = [play(env) for env in envs]
+        self.assertFalse(np.array_equal(games[0][0], games[1][0]))
+        seed_envs(envs, seed=7)
+        for env, game in zip(envs, games):
+            self.assertTrue(all(np.array_equal(a, b) for a, b in zip(game, play(env))))
+
+        # The workers of SubprocVecEnv are seeded in the same way
+        vec_env = SubprocVecEnv([make_env] * 3, seed=7)
+        observations, _ = vec_env.reset()
+        for e, game in enumerate(games):
+            self.assertTrue(np.array_equal(observations[e], game[0]))
+        observations, _, _, _ = vec_env.step(np.stack([all_actions[0]] * 3))
+        for e, game in enumerate(games):
+            self.assertTrue(np.array_equal(observations[e], game[1]))
+        vec_env.close()
+        game_state = envs[0].get_json()
+        for env in envs:
+            env.close()
+
+        # Gyms starting from a game state draw the colours of the snakes from their generator
+        colours = []
+        for _ in range(2):
+            np.random.random()
+            env = make_env(initial_game_state=game_state, seed=5)
+            env.reset()
+            colours.append(env.snakes.get_snake_colours())
+            env.close()
+        self.assertEqual(colours[0], colours[1])
+
+    def test_profiling(self):
+        '''
+        Test that the phases of step and reset are profiled only when profiling is enabled
+        '''
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE, seed=0)
+        env.reset()
+        env.step([Snake.UP, Snake.UP])
+        self.assertIsNone(env.profiler)
+        with self.assertRaises(RuntimeError):
+            env.profile_report()
+
+        profiler = env.enable_profiling()
+        env.reset()
+        for _ in range(5):
+            env.step([Snake.UP, Snake.UP])
+        self.assertEqual(profiler.counts["step"], 5)
+        self.assertEqual(profiler.counts["reset"], 1)
+        self.assertEqual(profiler.counts["step;observation"], 5)
+        self.assertEqual(profiler.counts["step;debug_json"], 10)
+        for phase in ["step;collisions", "step;eat", "step;spawn_food"]:
+            self.assertEqual(profiler.counts[phase], 5)
+        self.assertIn("sanity_check", env.profile_report())
+
+        # The nested phases add up to at most the time of step
+        nested_time = sum(t for phase, t in profiler.times.items() if phase.startswith("step;"))
+        self.assertLessEqual(nested_time, profiler.times["step"])
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "profile.folded")
+            env.export_profile(path)
+            with open(path) as f:
+                stacks = dict(line.rsplit(" ", 1) for line in f.read().splitlines())
+        self.assertIn("step;move", stacks)
+        self.assertTrue(all(int(value) > 0 for value in stacks.values()))
+
+        env.disable_profiling()
+        env.step([Snake.UP, Snake.UP])
+        self.assertEqual(profiler.counts["step"], 5)
+        env.close()
+
+        # Resetting from an initial game state is profiled too
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE,
+                             initial_game_state=env.get_json(), seed=0)
+        profiler = env.enable_profiling()
+        env.reset()
+        self.assertEqual(profiler.counts["reset"], 1)
+        self.assertEqual(profiler.counts["reset;load_game_state"], 1)
+        env.close()
+
+    def test_action_mask(self):
+        '''
+        Test that the action mask only allows the actions not leading to a wall, the neck
+        or a body, by trying every action from snapshots of random games
+        '''
+        env = BattlesnakeGym(map_size=(5, 5), number_of_snakes=1, snake_spawn_locations=[[0, 0]],
+                             verbose=VERBOSE, food_spawn_chance=0)
+        _, _, _, info = env.reset()
+        self.assertEqual(info["action_mask"].tolist(), [[False, True, False, True]])
+        _, _, _, info = env.step([Snake.RIGHT])
+        self.assertEqual(info["action_mask"].tolist(), [[False, True, False, True]])
+        env.close()
+
+        # An action is safe if the snake does not hit a wall, its neck or a body whatever the
+        # other snake plays
+        body_deaths = ["Snake hit wall", "Forbidden move", "Snake hit body - hit itself",
+                       "Snake hit body - hit other"]
+        env = BattlesnakeGym(map_size=(6, 6), number_of_snakes=2, verbose=VERBOSE,
+                             food_spawn_chance=0.3, seed=0)
+        rng = np.random.default_rng(0)
+        for _ in range(4):
+            _, _, dones, info = env.reset()
+            while not all(dones.values()):
+                action_mask = info["action_mask"]
+                actions = np.argmax(rng.random(action_mask.shape) * action_mask, axis=1)
+                state = env.get_state()
+                snakes = env.snakes.get_snakes()
+                if all(snake.is_alive() and snake.health > 1 for snake in snakes):
+                    for k in range(2):
+                        safe, legal = [], []
+                        for action in range(4):
+                            outcomes = []
+                            for other_action in range(4):
+                                trial_actions = np.zeros(2, dtype=int)
+                                trial_actions[k], trial_actions[1 - k] = action, other_action
+                                _, _, _, trial_info = env.step(trial_actions)
+                                outcomes.append(trial_info["snake_info"][k])
+                                env.set_state(state)
+                            safe.append(not any(outcome in body_deaths for outcome in outcomes))
+                            legal.append(not any(outcome in body_deaths[:2] for outcome in outcomes))
+                        expected = safe if any(safe) else legal
+                        self.assertEqual(action_mask[k].tolist(), expected)
+                _, _, dones, info = env.step(actions)
+        self.assertTrue(info["action_mask"].all())
+        env.close()
+
+    def test_packed_observations(self):
+        '''
+        Test that the packed observations unpack to the flat-51s observations
+        '''
+        map_size, number_of_snakes = (11, 11), 4
+        make_env = partial(BattlesnakeGym, map_size=map_size, number_of_snakes=number_of_snakes,
+                           verbose=VERBOSE, food_spawn_chance=0.5, seed=5)
+        env = make_env(observation_type="flat-51s")
+        packed_env = make_env(observation_type="flat-packed-health")
+        all_actions = np.random.default_rng(0).integers(0, 4, size=(40, number_of_snakes))
+
+        observations, packed_observations, healths = [env.reset()[0]], [packed_env.reset()[0]], []
+        for actions in all_actions:
+            observations.append(env.step(actions)[0])
+            healths.append([snake.health if snake.is_alive() else 0 for snake in env.snakes.get_snakes()])
+            packed_observations.append(packed_env.step(actions)[0])
+
+        for observation, packed in zip(observations, packed_observations):
+            self.assertTrue(packed_env.observation_space.contains(packed))
+            self.assertTrue(np.array_equal(unpack_observation(packed, map_size, number_of_snakes, True)[0],
+                                           observation))
+        unpacked, health = unpack_observations(np.stack(packed_observations), map_size, number_of_snakes,
+                                               include_health=True)
+        self.assertTrue(np.array_equal(unpacked, np.stack(observations)))
+        self.assertTrue(np.array_equal(health[1:], np.array(healths)))
+
+        # 8 times smaller up to the head cells stored after the planes
+        packed_size = BattlesnakeGym(observation_type="flat-packed", map_size=map_size,
+                                     number_of_snakes=number_of_snakes).observation_space.shape[0]
+        self.assertLessEqual(packed_size, observations[0].nbytes // 8 + 1 + 2 * number_of_snakes)
+        env.close()
+        packed_env.close()
+
+    def test_replay_buffer(self):
+        '''
+        Test that the replay buffer stores the transitions written by the gym, wraps around,
+        can be reopened and samples proportionally to the priorities
+        '''
+        env = BattlesnakeGym(map_size=(7, 7), number_of_snakes=2, verbose=VERBOSE, seed=1)
+        capacity = 50
+        with tempfile.TemporaryDirectory() as directory:
+            buffer = ReplayBuffer(directory, capacity, env.observation_space, env.number_of_snakes,
+                                  prioritized=True, seed=0)
+            transitions = []
+            observation, _, _, info = env.reset()
+            for _ in range(80):
+                actions = np.argmax(info["action_mask"], axis=1)
+                next_observation, reward, dones, next_info = env.step(
+                    actions, out=buffer.get_next_observation_slot())
+                buffer.add(observation, actions, reward, dones, info["action_mask"])
+                transitions.append((observation.copy(), next_observation.copy(), actions))
+                observation, info = next_observation.copy(), next_info
+                if all(dones.values()):
+                    observation, _, _, info = env.reset()
+            self.assertEqual((len(buffer), buffer.index), (capacity, 80 % capacity))
+
+            batch = buffer.sample(16)
+            for index in batch["indexes"]:
+                # Slot index holds the last transition written there
+                observation, next_observation, actions = transitions[index if index >= 80 % capacity
+                                                                     else index + capacity]
+                self.assertTrue(np.array_equal(batch["observation"][batch["indexes"] == index][0], observation))
+                self.assertTrue(np.array_equal(batch["next_observation"][batch["indexes"] == index][0],
+                                               next_observation))
+                self.assertTrue(np.array_equal(batch["action"][batch["indexes"] == index][0], actions))
+
+            # Only the transitions with a priority are sampled
+            priorities = np.zeros(capacity)
+            priorities[[3, 17]] = [1.0, 3.0]
+            buffer.update_priorities(np.arange(capacity), priorities)
+            batch = buffer.sample(400)
+            self.assertTrue(set(batch["indexes"].tolist()) == {3, 17})
+            self.assertAlmostEqual(np.mean(batch["indexes"] == 17), 0.75, delta=0.1)
+            self.assertTrue(np.allclose(batch["weights"][batch["indexes"] == 17], 1 / 3 ** 0.4))
+            buffer.flush()
+
+            # A reader sees the flushed transitions, a reopened buffer resumes at the write index
+            with ReplayBufferReader(directory) as reader:
+                self.assertEqual(len(reader), capacity)
+                self.assertTrue(set(reader.sample(50)["indexes"].tolist()) <= {3, 17})
+                buffer.add(observation, actions, reward, dones, info["action_mask"], observation)
+                buffer.close()
+                reader.refresh()
+                self.assertEqual(reader.index, 80 % capacity + 1)
+            with self.assertRaises(ValueError):
+                ReplayBuffer(directory, capacity + 1, env.observation_space, env.number_of_snakes,
+                             prioritized=True)
+            buffer = ReplayBuffer(directory, capacity, env.observation_space, env.number_of_snakes,
+                                  prioritized=True)
+            self.assertEqual((len(buffer), buffer.index), (capacity, 80 % capacity + 1))
+            buffer.close()
+        env.close()
+
+    def test_board_tables(self):
+        '''
+        Test the neighbour, wall and distance tables against the moves of the snakes
+        '''
+        height, width = 7, 5
+        neighbours = get_neighbours(height, width)
+        wall_mask = get_wall_mask(height, width)
+        distances = get_manhattan_distances(height, width)
+        snake = Snake(np.array([0, 0]), (height, width))
+        for cell in range(height * width):
+            i, j = divmod(cell, width)
+            for action in (Snake.UP, Snake.DOWN, Snake.LEFT, Snake.RIGHT):
+                ni, nj = snake._translate_coordinate_in_direction(np.array([i, j]), action)
+                on_board = 0 <= ni < height and 0 <= nj < width
+                self.assertEqual(neighbours[cell, action], ni * width + nj if on_board else OFF_BOARD)
+                self.assertEqual(wall_mask[cell, action], not on_board)
+            for other_cell in range(height * width):
+                other_i, other_j = divmod(other_cell, width)
+                self.assertEqual(distances[cell, other_cell], abs(i - other_i) + abs(j - other_j))
+        self.assertIs(get_neighbours(height, width), neighbours)
+        self.assertFalse(neighbours.flags.writeable)
+
+    def test_snake_cells(self):
+        '''
+        Test the cell ids of the snakes against their coordinates, including a head that left the map
+        '''
+        map_size = (5, 6)
+        snake = Snake.make_from_list([(1, 2), (2, 2), (3, 2)], Snake.FULL_HEALTH, map_size)
+        self.assertEqual(snake.cells, [3*6 + 2, 2*6 + 2, 1*6 + 2])
+        self.assertEqual(snake.locations, [(3, 2), (2, 2), (1, 2)])
+        self.assertEqual(snake.facing_direction, Snake.UP)
+
+        snake._number_of_initial_body_stacking = 0
+        snake.move(Snake.UP)
+        self.assertEqual(snake.get_head(), (0, 2))
+        self.assertEqual(snake.get_previous_snake_head(), (1, 2))
+        self.assertFalse(snake.is_head_outside_map())
+        snake.move(Snake.UP)
+        self.assertTrue(snake.is_head_outside_map())
+        self.assertEqual(snake.get_head_cell(), OFF_BOARD)
+        self.assertEqual(snake.get_head(), (-1, 2))
+        self.assertEqual(snake.locations, [(1, 2), (0, 2), (-1, 2)])
+
+        env = BattlesnakeGym(map_size=map_size, number_of_snakes=1, snake_spawn_locations=[(0, 2)],
+                             food_spawn_chance=0.0, verbose=VERBOSE)
+        env.reset()
+        _, _, _, info = env.step(np.array([Snake.UP]))
+        self.assertEqual(info["snake_info"][0], "Snake hit wall")
+
+
 if __name__ == '__main__':
     unittest.main()
     
@@ -118,4 +118,48 @@ def grow_two_snakes(snake_starting_positions, food_spawn_chance, verbose):
         actions.append(np.array([action[0], action[1]]))
 
     simulate_snake(env, actions, render=SHOULD_RENDER, break_with_done=False)
-    return env
\ No newline at end of file
+    return env
+
+def render_board_reference(state, map_size, number_of_snakes, snake_colours):
+    '''
+    Reference implementation of BattlesnakeGym._get_board painting each cell in a loop.
+    Used to check that the vectorised renderer is pixel identical.
+    '''
+    FOOD_INDEX = 0
+    SNAKE_INDEXES = FOOD_INDEX + np.array(range(1, number_of_snakes + 1))
+
+    BOUNDARY = 20
+    BOX_SIZE = 40
+    SPACE_BETWEEN_BOXES = 10
+
+    board_size = (map_size[0]*(BOX_SIZE + SPACE_BETWEEN_BOXES) + 2*BOUNDARY,
+                  map_size[1]*(BOX_SIZE + SPACE_BETWEEN_BOXES) + 2*BOUNDARY)
+    board = np.ones((board_size[0], board_size[1], 3), dtype=np.uint8) * 255
+
+    for i in range(0, map_size[0]):
+        for j in range(0, map_size[1]):
+            state_value = state[i][j]
+
+            t_i1 = BOUNDARY + i * (BOX_SIZE + SPACE_BETWEEN_BOXES)
+            t_i2 = t_i1 + BOX_SIZE
+
+            t_j1 = BOUNDARY + j * (BOX_SIZE + SPACE_BETWEEN_BOXES)
+            t_j2 = t_j1 + BOX_SIZE
+
+            board[t_i1:t_i2, t_j1:t_j2] = 255 * 0.7
+
+            if state_value[FOOD_INDEX] >= 1:
+                box_margin = int(BOX_SIZE/5)
+                board[t_i1 + box_margin:t_i2 - box_margin,
+                      t_j1 + box_margin:t_j2 - box_margin] = [255, 0, 0]
+
+            if 1 in state_value[SNAKE_INDEXES]:
+                snake_present_in = np.argmax(state_value[SNAKE_INDEXES])
+                board[t_i1:t_i2, t_j1:t_j2] = snake_colours[snake_present_in]
+
+            if 5 in state_value[SNAKE_INDEXES]:
+                snake_present_in = np.argmax(state_value[SNAKE_INDEXES])
+                board[t_i1:t_i2, t_j1:t_j2] = snake_colours[snake_present_in]
+                board[(t_i1+10):(t_i2-10), (t_j1+10):(t_j2-10)] = [255, 255, 255]
+
+    return board
@@ -21,7 +21,7 @@ def is_coord_in(coord, array):
             return True
     return False
 
-def get_random_coordinates(map_size, n, excluding=[]):
+def get_random_coordinates(map_size, n, excluding=[], rng=None):
     '''
     Helper function to get n number of random coordinates based on the map
     Parameters:
@@ -34,6 +34,9 @@ def get_random_coordinates(map_size, n, excluding=[]):
 
     excluding: [(int, int)]
         A list of coordinates to not include in the randomly generated coordinates
+
+    rng, np.random.Generator, optional
+        Random number generator to use, np.random is used if None
     '''
     coordinates_indexes = []
     coordinates = []
@@ -46,7 +49,9 @@ def get_random_coordinates(map_size, n, excluding=[]):
             coordinates_indexes.append(count)
             count += 1
 
-    indexes = np.random.choice(coordinates_indexes, n, replace=False)
+    if rng is None:
+        rng = np.random
+    indexes = rng.choice(coordinates_indexes, n, replace=False)
     random_coordinates = np.array(coordinates)[indexes]
     return random_coordinates
 
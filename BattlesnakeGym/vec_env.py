@@ -0,0 +1,271 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# A copy of the License is located at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# or in the "license" file accompanying this file. This file is distributed
+# on an "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either
+# express or implied. See the License for the specific language governing
+# permissions and limitations under the License.
+
+import multiprocessing as mp
+import traceback
+
+import numpy as np
+
+# Commands sent from the parent to the workers and replies sent back.
+# Only these single bytes go through the pipes, the data is exchanged in shared memory.
+_STEP = b"s"
+_RESET = b"r"
+_CLOSE = b"c"
+_OK = b"k"
+_ERROR = b"e"
+
+def is_episode_over(dones):
+    '''
+    Helper function to check if a game is over given the dones returned by BattlesnakeGym.step.
+    A game is over when every snake is dead, or when there is at most 1 snake remaining in a
+    game with multiple snakes.
+
+    Parameters:
+    ----------
+    dones: {int: bool} or np.array(number_of_snakes)
+        dones[i] is True if snake i is dead
+    '''
+    if isinstance(dones, dict):
+        dones = list(dones.values())
+    number_of_snakes = len(dones)
+    number_of_snakes_alive = number_of_snakes - int(np.sum(dones))
+    if number_of_snakes_alive == 0:
+        return True
+    return number_of_snakes > 1 and number_of_snakes_alive <= 1
+
+class _SharedArrays:
+    '''
+    Arrays shared between the parent and the workers of SubprocVecEnv.
+    Each array is stored in a multiprocessing.RawArray and accessed through numpy views.
+    '''
+    def __init__(self, number_of_envs, number_of_snakes, observation_shape, observation_dtype):
+        self.layout = {
+            "observations": ((number_of_envs,) + tuple(observation_shape), np.dtype(observation_dtype)),
+            "actions": ((number_of_envs, number_of_snakes), np.dtype(np.int64)),
+            "rewards": ((number_of_envs, number_of_snakes), np.dtype(np.float64)),
+            "dones": ((number_of_envs, number_of_snakes), np.dtype(np.bool_)),
+            "episode_dones": ((number_of_envs,), np.dtype(np.bool_)),
+            "snake_health": ((number_of_envs, number_of_snakes), np.dtype(np.int16)),
+            "current_turn": ((number_of_envs,), np.dtype(np.int32)),
+            "action_masks": ((number_of_envs, number_of_snakes, 4), np.dtype(np.bool_)),
+        }
+        self.buffers = {}
+        for name, (shape, dtype) in self.layout.items():
+            self.buffers[name] = mp.RawArray("b", int(np.prod(shape)) * dtype.itemsize)
+        self._build_views()
+
+    def _build_views(self):
+        for name, (shape, dtype) in self.layout.items():
+            setattr(self, name, np.frombuffer(self.buffers[name], dtype=dtype).reshape(shape))
+
+    def __getstate__(self):
+        # Only the shared buffers are sent to the workers, the views are rebuilt on their side
+        return {"layout": self.layout, "buffers": self.buffers}
+
+    def __setstate__(self, state):
+        self.layout = state["layout"]
+        self.buffers = state["buffers"]
+        self._build_views()
+
+def _worker(index, env_fn, remote, parent_remote, shared, seed_sequence):
+    '''
+    Loop ran by each worker process of SubprocVecEnv. The environment is stepped on request
+    and its outputs are written straight into the shared arrays.
+    '''
+    parent_remote.close()
+    env = None
+    try:
+        env = env_fn()
+        if seed_sequence is not None:
+            env.seed(seed_sequence)
+        while True:
+            command = remote.recv_bytes()
+            if command == _STEP:
+                _, reward, dones, info = env.step(shared.actions[index], out=shared.observations[index])
+                for i in range(env.number_of_snakes):
+                    shared.rewards[index, i] = reward[i]
+                    shared.dones[index, i] = dones[i]
+                    shared.snake_health[index, i] = info["snake_health"][i]
+                shared.current_turn[index] = info["current_turn"]
+                shared.action_masks[index] = info["action_mask"]
+                shared.episode_dones[index] = is_episode_over(dones)
+                if shared.episode_dones[index]:
+                    # Automatically start a new game, the observation is the first of the new game
+                    _, _, _, info = env.reset(out=shared.observations[index])
+                    shared.action_masks[index] = info["action_mask"]
+            elif command == _RESET:
+                _, _, _, info = env.reset(out=shared.observations[index])
+                shared.rewards[index] = 0
+                shared.dones[index] = False
+                shared.episode_dones[index] = False
+                for i in range(env.number_of_snakes):
+                    shared.snake_health[index, i] = info["snake_health"][i]
+                shared.current_turn[index] = info["current_turn"]
+                shared.action_masks[index] = info["action_mask"]
+            elif command == _CLOSE:
+                remote.send_bytes(_OK)
+                break
+            remote.send_bytes(_OK)
+    except (KeyboardInterrupt, EOFError):
+        pass
+    except Exception:
+        remote.send_bytes(_ERROR + traceback.format_exc().encode())
+    finally:
+        if env is not None:
+            env.close()
+        remote.close()
+
+class SubprocVecEnv:
+    '''
+    Vector environment running each BattlesnakeGym in a separate process.
+
+    The observations, rewards and dones are written by the workers straight into shared memory,
+    the parent and the workers only exchange single byte commands. Nothing is pickled per step.
+    When a game is over, the worker automatically resets its environment: the returned
+    observation is the first observation of the next game and episode_dones is set.
+
+    The arrays returned by reset/step are views of the shared memory, they are overwritten by
+    the next call (copy them if they must be kept).
+
+    Parameters:
+    ----------
+    env_fns: [callable]
+        Functions creating each BattlesnakeGym. They must be picklable if the
+        multiprocessing start method is not fork.
+
+    start_method: str, optional, default=None
+        multiprocessing start method, by default the platform's default is used
+
+    seed: int, optional, default=None
+        If not None, each environment is seeded with an independent stream spawned from
+        np.random.SeedSequence(seed), so that the rollouts can be reproduced
+    '''
+    def __init__(self, env_fns, start_method=None, seed=None):
+        self.number_of_envs = len(env_fns)
+
+        env = env_fns[0]()
+        self.observation_space = env.observation_space
+        self.action_space = env.action_space
+        self.number_of_snakes = env.number_of_snakes
+        env.close()
+
+        self.shared = _SharedArrays(self.number_of_envs, self.number_of_snakes,
+                                    self.observation_space.shape, self.observation_space.dtype)
+
+        if seed is None:
+            seed_sequences = [None] * self.number_of_envs
+        else:
+            seed_sequences = np.random.SeedSequence(seed).spawn(self.number_of_envs)
+
+        context = mp.get_context(start_method)
+        self.remotes, self.processes = [], []
+        for index, (env_fn, seed_sequence) in enumerate(zip(env_fns, seed_sequences)):
+            remote, worker_remote = context.Pipe()
+            process = context.Process(target=_worker,
+                                      args=(index, env_fn, worker_remote, remote, self.shared,
+                                            seed_sequence),
+                                      daemon=True)
+            process.start()
+            worker_remote.close()
+            self.remotes.append(remote)
+            self.processes.append(process)
+
+        self.waiting = False
+        self.closed = False
+
+    def _send(self, command):
+        for remote in self.remotes:
+            remote.send_bytes(command)
+
+    def _wait(self):
+        errors = []
+        for index, remote in enumerate(self.remotes):
+            reply = remote.recv_bytes()
+            if reply != _OK:
+                errors.append("Worker {} failed:\n{}".format(index, reply[len(_ERROR):].decode()))
+        if len(errors) > 0:
+            raise RuntimeError("\n".join(errors))
+
+    def _get_infos(self):
+        return {"current_turn": self.shared.current_turn,
+                "snake_health": self.shared.snake_health,
+                "episode_dones": self.shared.episode_dones,
+                "action_mask": self.shared.action_masks}
+
+    def reset(self):
+        '''
+        Reset every environment.
+
+        Returns:
+        -------
+        observations: np.array(number_of_envs, *observation_space.shape)
+        infos: {str: np.array}
+        '''
+        self._send(_RESET)
+        self._wait()
+        return self.shared.observations, self._get_infos()
+
+    def step_async(self, actions):
+        '''
+        Start stepping every environment with actions, without waiting for the results.
+        Use step_wait to get the results.
+
+        Parameters:
+        ----------
+        actions: np.array(number_of_envs, number_of_snakes)
+        '''
+        self.shared.actions[:] = actions
+        self._send(_STEP)
+        self.waiting = True
+
+    def step_wait(self):
+        '''
+        Wait for the steps started by step_async.
+
+        Returns:
+        -------
+        observations: np.array(number_of_envs, *observation_space.shape)
+        rewards: np.array(number_of_envs, number_of_snakes)
+        dones: np.array(number_of_envs, number_of_snakes)
+            dones[e, i] is True if snake i of environment e is dead
+        infos: {str: np.array}
+            "current_turn", "snake_health" and "episode_dones" of each environment and
+            "action_mask" (number_of_envs, number_of_snakes, 4), the action masks of the
+            observations (see BattlesnakeGym.get_action_mask)
+        '''
+        self._wait()
+        self.waiting = False
+        return self.shared.observations, self.shared.rewards, self.shared.dones, self._get_infos()
+
+    def step(self, actions):
+        self.step_async(actions)
+        return self.step_wait()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.waiting:
+            self._wait()
+        for remote in self.remotes:
+            try:
+                remote.send_bytes(_CLOSE)
+                remote.recv_bytes()
+            except (BrokenPipeError, EOFError):
+                pass
+            remote.close()
+        for process in self.processes:
+            process.join()
+        self.closed = True
+
+    def __len__(self):
+        return self.number_of_envs
@@ -0,0 +1,186 @@
+"""
+Benchmark of the search engines on a corpus of positions.
+
+Runs the best-reply search of main.move and the simultaneous-move search of
+simultaneous_search.choose_move on the same positions, and reports the nodes searched per
+second by each engine and how often the simultaneous-move search agrees with main.move.
+Both engines search the safe moves of main.get_safe_moves with the same opponent models, and
+the positions where main.move does not search (no safe move, or cut off from the opponents)
+are skipped.
+
+Positions are /move requests, read from a JSONL file (one request per line) or generated by
+playing games in the BattlesnakeGym with random safe moves.
+
+Example:
+    python benchmark_search.py --positions 200 --snakes 2 --brs-depth 3 --depth 2
+    python benchmark_search.py --corpus positions.jsonl --save-corpus positions.jsonl
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from typing import Callable, List
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "BattlesnakeGym"))
+
+import main  # noqa: E402
+from brs import EVALUATION_CACHE, SearchStats  # noqa: E402
+from endgame import get_separation  # noqa: E402
+from opponent_model import OpponentModel  # noqa: E402
+from simultaneous_search import choose_move  # noqa: E402
+from snake_gym import BattlesnakeGym, API_MOVE_TO_ACTION, DEFAULT_API_GAME  # noqa: E402
+from vec_env import is_episode_over  # noqa: E402
+
+
+def generate_positions(number_of_positions: int, number_of_snakes: int, map_size: tuple,
+                       seed: int = 0, max_turns: int = 300) -> List[dict]:
+    """
+    Collect the /move requests of the snakes in games where every snake plays a random safe move.
+
+    Args:
+    number_of_positions (int): Number of requests to collect.
+    number_of_snakes (int): Number of snakes in each game.
+    map_size (tuple): (height, width) of the board.
+    seed (int): Seed of the games and of the moves.
+    max_turns (int): Games are stopped after max_turns turns.
+
+    Returns:
+    list[dict]: The requests.
+    """
+    rng = random.Random(seed)
+    positions = []
+    game_index = 0
+    while len(positions) < number_of_positions:
+        env = BattlesnakeGym(map_size=map_size, number_of_snakes=number_of_snakes,
+                             seed=seed + game_index, minimum_food=1)
+        env.reset()
+        game = dict(DEFAULT_API_GAME, id="benchmark-{}-{}".format(seed, game_index))
+        dones = {i: False for i in range(number_of_snakes)}
+        while not is_episode_over(dones) and env.turn_count < max_turns:
+            actions = np.zeros(number_of_snakes, dtype=np.int64)
+            for i, request in env.get_move_requests(game).items():
+                game_state = json.loads(request)
+                if len(positions) < number_of_positions:
+                    positions.append(game_state)
+                safe_moves = main.get_safe_moves(game_state)
+                actions[i] = API_MOVE_TO_ACTION[rng.choice(safe_moves) if len(safe_moves) > 0 else "up"]
+            _, _, dones, _ = env.step(actions)
+        env.close()
+        game_index += 1
+    return positions
+
+
+def load_positions(path: str) -> List[dict]:
+    """Read the /move requests of a JSONL file."""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_searched_positions(positions: List[dict]) -> List[dict]:
+    """
+    Positions where main.move searches: "you" has a safe move and is not cut off from the
+    opponents (main.move then fills its region with the endgame solver instead).
+    """
+    return [game_state for game_state in positions
+            if len(main.get_safe_moves(game_state)) > 0 and
+            (len(game_state["board"]["snakes"]) < 2 or not get_separation(game_state)[1])]
+
+
+def run_engine(positions: List[dict], depth: int, search: Callable) -> tuple:
+    """
+    Run a search engine on the positions, from the safe moves of main.get_safe_moves.
+
+    Each snake of each game has its own OpponentModel observing its positions in order, as in
+    main.move, so both engines trim the replies of the opponents with the same models.
+
+    Args:
+    positions (list[dict]): The /move requests, see get_searched_positions.
+    depth (int): Depth of the search.
+    search (Callable): search(game_state, moves, depth, opponent_model, stats) returns the move.
+
+    Returns:
+    tuple: The moves chosen and the SearchStats summed over the positions.
+    """
+    EVALUATION_CACHE.clear()
+    opponent_models = {}
+    total = SearchStats(depth)
+    moves = []
+    for game_state in positions:
+        key = (game_state["game"]["id"], game_state["you"]["id"])
+        opponent_model = opponent_models.setdefault(key, OpponentModel())
+        opponent_model.observe(game_state)
+        random.seed(0)
+        start_time = time.perf_counter()
+        moves.append(search(game_state, main.get_safe_moves(game_state), depth, opponent_model, total))
+        total.seconds += time.perf_counter() - start_time
+    return moves, total
+
+
+def run_brs(positions: List[dict], depth: int) -> tuple:
+    """Run the best-reply search of main.move (see run_engine)."""
+    return run_engine(positions, depth, main.search_moves)
+
+
+def run_simultaneous(positions: List[dict], depth: int) -> tuple:
+    """Run the simultaneous-move search (see run_engine)."""
+    def search(game_state, moves, depth, opponent_model, stats):
+        return choose_move(game_state, depth, moves, opponent_model, stats)
+
+    return run_engine(positions, depth, search)
+
+
+def main_benchmark(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark of the search engines",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__)
+    parser.add_argument("--corpus", help="JSONL file of /move requests, generated if not given")
+    parser.add_argument("--save-corpus", help="Path of a JSONL file to write the positions to")
+    parser.add_argument("--positions", type=int, default=200)
+    parser.add_argument("--snakes", type=int, default=2)
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--brs-depth", type=int, default=3, help="Depth of the best-reply search in plies")
+    parser.add_argument("--depth", type=int, default=2, help="Depth of the simultaneous search in turns")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of a JSON file to write the results to")
+    args = parser.parse_args(argv)
+
+    if args.corpus is not None:
+        positions = load_positions(args.corpus)
+    else:
+        positions = generate_positions(args.positions, args.snakes, (args.height, args.width), args.seed)
+    if args.save_corpus is not None:
+        with open(args.save_corpus, "w") as f:
+            for game_state in positions:
+                f.write(json.dumps(game_state) + "\n")
+
+    searched_positions = get_searched_positions(positions)
+    print("{} of {} positions searched".format(len(searched_positions), len(positions)))
+    brs_moves, brs_stats = run_brs(searched_positions, args.brs_depth)
+    simultaneous_moves, simultaneous_stats = run_simultaneous(searched_positions, args.depth)
+    agreement = np.mean([a == b for a, b in zip(brs_moves, simultaneous_moves)])
+
+    results = {}
+    print("{:<14} {:>6} {:>10} {:>12} {:>10} {:>14} {:>14}".format(
+        "engine", "depth", "positions", "nodes", "seconds", "nodes/s", "nodes/position"))
+    for engine, stats in (("brs", brs_stats), ("simultaneous", simultaneous_stats)):
+        print("{:<14} {:>6} {:>10} {:>12} {:>10.2f} {:>14.0f} {:>14.1f}".format(
+            engine, stats.depth, len(searched_positions), stats.nodes, stats.seconds,
+            stats.nodes_per_second(), stats.nodes / max(1, len(searched_positions))))
+        results[engine] = dict(stats.as_dict(), nodes_per_second=stats.nodes_per_second())
+    print("decision agreement: {:.1%}".format(agreement))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"positions": len(searched_positions), "agreement": float(agreement), **results},
+                      f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_benchmark())
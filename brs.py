@@ -1,7 +1,159 @@
+import zlib
+from collections import OrderedDict
 from copy import deepcopy
+from functools import lru_cache
+
+import numpy as np
+
+from BattlesnakeGym.board_tables import get_neighbours, get_wall_mask, API_MOVES, API_MOVE_INDEX
+
+# key of the position hash stored in the game states of the search
+HASH_KEY = "position_hash"
+
+
+@lru_cache(maxsize=None)
+def get_snake_keys(snake_id: str, number_of_cells: int) -> tuple:
+    """
+    Zobrist keys of a snake, derived from its id so they are stable for the whole game.
+
+    Args:
+    snake_id (str): Id of the snake.
+    number_of_cells (int): Number of cells of the board.
+
+    Returns:
+    tuple: The keys of the body cells, of the head cell and of the length of the snake.
+    """
+    rng = np.random.default_rng(zlib.crc32(snake_id.encode()))
+    keys = rng.integers(0, 2**63, size=(3, number_of_cells + 1), dtype=np.int64).tolist()
+    return tuple(keys)
+
+
+@lru_cache(maxsize=None)
+def get_food_keys(number_of_cells: int) -> list[int]:
+    """Zobrist keys of the food on each cell."""
+    rng = np.random.default_rng(number_of_cells)
+    return rng.integers(0, 2**63, size=number_of_cells, dtype=np.int64).tolist()
+
+
+def get_position_hash(game_state: dict) -> int:
+    """
+    Zobrist hash of the food and of the body cells, heads and lengths of the snakes.
+    States created by get_state_from_move carry their hash, updated incrementally.
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API or state of the search.
+
+    Returns:
+    int: The position hash.
+    """
+    if HASH_KEY in game_state:
+        return game_state[HASH_KEY]
+    board = game_state["board"]
+    board_width = board["width"]
+    number_of_cells = board_width * board["height"]
+    food_keys = get_food_keys(number_of_cells)
+    position_hash = 0
+    for food in board["food"]:
+        position_hash ^= food_keys[food["y"] * board_width + food["x"]]
+    for snake in board["snakes"]:
+        body_keys, head_keys, length_keys = get_snake_keys(snake["id"], number_of_cells)
+        body = snake["body"]
+        for part in body:
+            position_hash ^= body_keys[part["y"] * board_width + part["x"]]
+        position_hash ^= head_keys[body[0]["y"] * board_width + body[0]["x"]]
+        position_hash ^= length_keys[min(len(body), number_of_cells)]
+    return position_hash
+
+
+class EvaluationCache:
+    """
+    Bounded LRU cache of the evaluations of the search, keyed by (position hash, player).
+    It is shared by the root moves of a turn and cleared when a new game starts.
+
+    Args:
+    max_bytes (int): Approximate memory budget of the cache.
+    """
+    # approximate memory of an entry: the key tuple, the value and the ordered dict node
+    ENTRY_BYTES = 220
+
+    def __init__(self, max_bytes: int = 64 * 2**20):
+        self.max_entries = max(1, max_bytes // self.ENTRY_BYTES)
+        self.entries = OrderedDict()
+        self.game_id = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def start_game(self, game_id: str):
+        """Clear the cache if game_id is not the game of the cached evaluations."""
+        if game_id != self.game_id:
+            self.clear()
+            self.game_id = game_id
+
+    def get(self, key: tuple):
+        """Return the cached evaluation of key, None if it is not cached."""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key: tuple, value: int):
+        self.entries[key] = value
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        """Hits, misses, hit rate and size of the cache."""
+        lookups = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "entries": len(self.entries), "bytes": len(self.entries) * self.ENTRY_BYTES}
+
+
+EVALUATION_CACHE = EvaluationCache()
+
+
+class SearchStats:
+    """
+    Counters of a search: the nodes visited, the leaves evaluated, the alpha-beta cutoffs,
+    the depth searched and the time taken.
+    """
+
+    def __init__(self, depth: int = 0):
+        self.depth = depth
+        self.nodes = 0
+        self.evaluations = 0
+        self.cutoffs = 0
+        self.seconds = 0.0
+
+    def nodes_per_second(self) -> float:
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {"depth": self.depth, "nodes": self.nodes, "evaluations": self.evaluations,
+                "cutoffs": self.cutoffs, "seconds": self.seconds}
+
+
+def cached_evaluate(game_state: dict, player: str) -> int:
+    """evaluate through EVALUATION_CACHE."""
+    key = (get_position_hash(game_state), player)
+    value = EVALUATION_CACHE.get(key)
+    if value is None:
+        value = evaluate(game_state, player)
+        EVALUATION_CACHE.put(key, value)
+    return value
+
 
 def brs(alpha: int, beta: int, depth: int, turn: str, game_state: dict,
-        player_name: str, opponents: list[str]) -> int:
+        player_id: str, opponents: list[str], opponent_model=None,
+        stats: SearchStats = None) -> int:
     """
     Implements the Best-Reply Search (BRS) algorithm.
     
@@ -10,50 +162,60 @@ def brs(alpha: int, beta: int, depth: int, turn: str, game_state: dict,
     beta (int): Beta value for alpha-beta pruning.
     depth (int): Current depth in the search tree.
     turn (str): Current turn, either 'MAX' or 'MIN'.
+    player_id (str): Id of our snake, the nodes are evaluated for it.
+    opponents (list[str]): Ids of the opponents.
+    opponent_model (OpponentModel): Optional model trimming the replies of the opponents at MIN nodes.
+    stats (SearchStats): Optional counters of the search.
     
     Returns:
     int: The heuristic value of the node.
     """
+    if stats is not None:
+        stats.nodes += 1
 
     # if depth is 0, return the evaluation of the board
     if depth <= 0:
-        return evaluate(game_state, player_name)
+        if stats is not None:
+            stats.evaluations += 1
+        return cached_evaluate(game_state, player_id)
 
     # Determine the moves based on the turn
     # MAX is us
     if turn == 'MAX':
-        moves = get_possible_moves(game_state, player_name)
+        moves = get_possible_moves(game_state, player_id)
         next_turn = 'MIN'
-    # MIN are the enemies
+    # MIN are the enemies, only one of them replies (best reply)
     else:
-        moves = []  # Extend this list based on the number of players
-        for opponent in opponents:
-            moves.extend(get_possible_moves(game_state, opponent))
+        moves = get_opponent_replies(game_state, player_id, opponents, opponent_model)
         next_turn = 'MAX'
 
+    if len(moves) == 0:
+        if stats is not None:
+            stats.evaluations += 1
+        return cached_evaluate(game_state, player_id)
+
     best_value = float('-inf') if turn == 'MAX' else float('inf')
 
     # Explore each move
-    for agent_name, move in moves:
+    for agent_id, move in moves:
         # get the new state and evaluate it
-        new_state = get_state_from_move(game_state, agent_name, move)
-        value = -brs(
-            -beta, -alpha, depth - 1, next_turn, new_state, agent_name, [
-                player_name, *[
-                    opponent
-                    for opponent in opponents if opponent != agent_name
-                ]
-            ])
+        new_state = get_state_from_move(game_state, agent_id, move)
+        value = brs(alpha, beta, depth - 1, next_turn, new_state, player_id, opponents,
+                    opponent_model, stats)
 
         # set alpha or beta depending
         if turn == 'MAX':
             if value >= beta:
+                if stats is not None:
+                    stats.cutoffs += 1
                 return value
             if value > best_value:
                 best_value = value
                 alpha = max(alpha, value)
         else:
             if value <= alpha:
+                if stats is not None:
+                    stats.cutoffs += 1
                 return value
             if value < best_value:
                 best_value = value
@@ -62,11 +224,47 @@ def brs(alpha: int, beta: int, depth: int, turn: str, game_state: dict,
     return best_value
 
 
+def get_opponent_replies(game_state: dict, player_id: str, opponents: list[str],
+                         opponent_model=None) -> list:
+    """
+    Moves of the opponents searched at a MIN node.
+
+    Args:
+    game_state (dict): State of the search.
+    player_id (str): Id of our snake.
+    opponents (list[str]): Ids of the opponents.
+    opponent_model (OpponentModel): Optional model keeping the most likely replies of each opponent.
+
+    Returns:
+    list: [id, move] pairs.
+    """
+    moves = []
+    for opponent in opponents:
+        opponent_moves = get_possible_moves(game_state, opponent)
+        if opponent_model is not None:
+            opponent_moves = opponent_model.select_replies(game_state, player_id, opponent,
+                                                           opponent_moves, len(opponents))
+        moves.extend(opponent_moves)
+    return moves
+
+
 def get_possible_moves(game_state: dict, player: str) -> list[str]:
-    # This function should return a list of all possible moves for the given player.
-    # returns a list like [[name, move], [name, move], etc.]
-    return [[player, "up"], [player, "down"], [player, "left"],
-            [player, "right"]]
+    # This function should return a list of all possible moves for the given player (its id).
+    # returns a list like [[id, move], [id, move], etc.]
+    # moves leaving the board are skipped using the wall mask of the board
+    board = game_state["board"]
+    for snake in board["snakes"]:
+        if snake["id"] == player:
+            head = snake["body"][0]
+            break
+    else:
+        return []
+    if not (0 <= head["x"] < board["width"] and 0 <= head["y"] < board["height"]):
+        return []
+    wall_mask = get_wall_mask(board["height"], board["width"])
+    head_cell = head["y"] * board["width"] + head["x"]
+    return [[player, move] for move, is_wall in zip(API_MOVES, wall_mask[head_cell].tolist())
+            if not is_wall]
 
 
 def get_state_from_move(game_state: dict, player: str,
@@ -74,40 +272,53 @@ def get_state_from_move(game_state: dict, player: str,
     # This function should modify the game state by making the specified move.
     # make sure we get a deepcopy to not modify the original
     new_game_state = deepcopy(game_state)
+    apply_move(new_game_state, player, move)
+    return new_game_state
+
 
+def apply_move(game_state: dict, player: str, move: str):
+    """
+    Move a snake in place: the head enters the cell of the move and the tail leaves its cell.
+
+    Args:
+    game_state (dict): State of the search, modified.
+    player (str): Id of the snake.
+    move (str): Move of the Battlesnake API.
+    """
     # get this snakes bodyparts
-    this_index = -1
-    for snake in new_game_state["board"]["snakes"]:
-        this_index += 1
-        if snake["name"] == player:
+    for snake in game_state["board"]["snakes"]:
+        if snake["id"] == player:
             break
-        else:
-            continue
-    bodyparts = new_game_state["board"]["snakes"][this_index]["body"]
-    # move them all up, simulate the game moving forward
-    new_bodyparts = []
-    for bodypart in bodyparts[0::-1]:
-        new_bodyparts.insert(0, bodypart)
-
-    # move the head according to the action
-    moves_to_coord_change_x = {"up": 0, "down": 0, "left": -1, "right": 1}
-    moves_to_coord_change_y = {"up": 1, "down": -1, "left": 0, "right": 0}
-    next_x = bodyparts[0]["x"] + moves_to_coord_change_x[move]
-    next_y = bodyparts[0]["y"] + moves_to_coord_change_y[move]
+    bodyparts = snake["body"]
+    # move them all up, simulate the game moving forward: the tail leaves its cell
+    new_bodyparts = bodyparts[:-1]
+
+    # move the head according to the action, using the neighbour table of the board
+    board_width = game_state["board"]["width"]
+    neighbours = get_neighbours(game_state["board"]["height"], board_width)
+    head_cell = bodyparts[0]["y"] * board_width + bodyparts[0]["x"]
+    next_y, next_x = divmod(int(neighbours[head_cell, API_MOVE_INDEX[move]]), board_width)
     new_bodyparts.insert(0, {"x": next_x, "y": next_y})
 
-    # set this in the new game state
-    new_game_state["board"]["snakes"][this_index]["body"] = new_bodyparts
-    return new_game_state
+    # update the position hash: the new head enters, the tail leaves and the head key moves
+    body_keys, head_keys, _ = get_snake_keys(snake["id"], len(neighbours))
+    tail_cell = bodyparts[-1]["y"] * board_width + bodyparts[-1]["x"]
+    next_cell = next_y * board_width + next_x
+    game_state[HASH_KEY] = get_position_hash(game_state) ^ body_keys[next_cell] ^ \
+        body_keys[tail_cell] ^ head_keys[head_cell] ^ head_keys[next_cell]
+
+    # set this in the game state
+    snake["body"] = new_bodyparts
+    snake["head"] = new_bodyparts[0]
 
 
 def evaluate(game_state: dict, player: str) -> int:
-    """A simple evaluation function that could prioritize staying alive"""
+    """A simple evaluation function that could prioritize staying alive, player is the id of the snake"""
     # get the current snake
     this_index = -1
     for snake in game_state["board"]["snakes"]:
         this_index += 1
-        if snake["name"] == player:
+        if snake["id"] == player:
             break
         else:
             continue
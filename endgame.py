@@ -0,0 +1,315 @@
+"""
+Space-filling endgame solver.
+
+When our snake is cut off from every opponent (no opponent head can reach the cells reachable
+from our head), the moves of the opponents no longer matter: the best we can do is to survive as
+long as possible in our region. This is a longest-path problem, solved with a depth-first search
+bounded by:
+
+- the number of cells reachable from the current cell (flood fill),
+- the checkerboard parity of these cells: a path alternates between the two colours of the
+  board, so it cannot use more than one cell of the majority colour per cell of the minority,
+- the articulation points of the region: once a path leaves a biconnected block through an
+  articulation point, it cannot come back (block-cut tree bound, computed at the root).
+
+The best path found is kept and followed in the next turns while its cells are still free: the
+region only grows as our tail moves, so a path found in the region stays a valid path.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set
+
+from BattlesnakeGym.board_tables import get_neighbour_lists, get_neighbours, API_MOVE_INDEX, OFF_BOARD
+
+# rest of the path followed by each of our snakes, keyed by (game id, snake id)
+PATH_CACHE = OrderedDict()
+PATH_CACHE_SIZE = 256
+
+# the solver stops after this fraction of the move timeout left once the latency margin, for the
+# network round trip, is taken off
+TIME_FRACTION = 0.5
+LATENCY_MARGIN_MS = 150
+
+
+def get_obstacles(game_state: dict) -> Set[int]:
+    """
+    Cells occupied next turn by the bodies of the snakes (tails that vacate are free).
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+
+    Returns:
+    set[int]: The cells (y * width + x).
+    """
+    board_width = game_state["board"]["width"]
+    obstacles = set()
+    for snake in game_state["board"]["snakes"]:
+        body = snake["body"]
+        tail_vacates = len(body) > 1 and body[-1] != body[-2]
+        for part in (body[:-1] if tail_vacates else body):
+            obstacles.add(part["y"] * board_width + part["x"])
+    return obstacles
+
+
+def flood_fill(start_cells: List[int], free: Set[int], neighbour_lists: tuple) -> Set[int]:
+    """
+    Cells of free connected to start_cells (the start cells are included if they are free).
+    """
+    region = {cell for cell in start_cells if cell in free}
+    stack = list(region)
+    while stack:
+        cell = stack.pop()
+        for neighbour in neighbour_lists[cell]:
+            if neighbour in free and neighbour not in region:
+                region.add(neighbour)
+                stack.append(neighbour)
+    return region
+
+
+def get_regions(game_state: dict) -> List[Set[int]]:
+    """
+    Partition of the free cells of the board into connected regions.
+
+    Returns:
+    list[set[int]]: The regions, largest first.
+    """
+    board = game_state["board"]
+    neighbour_lists = get_neighbour_lists(board["height"], board["width"])
+    free = set(range(board["height"] * board["width"])) - get_obstacles(game_state)
+    regions = []
+    while free:
+        region = flood_fill([next(iter(free))], free, neighbour_lists)
+        free -= region
+        regions.append(region)
+    return sorted(regions, key=len, reverse=True)
+
+
+def get_separation(game_state: dict) -> tuple:
+    """
+    Region reachable from our head and whether an opponent can reach it.
+
+    Returns:
+    tuple: The set of cells reachable from our head and True if no opponent head can enter it.
+    """
+    board = game_state["board"]
+    board_width = board["width"]
+    neighbour_lists = get_neighbour_lists(board["height"], board_width)
+    free = set(range(board["height"] * board_width)) - get_obstacles(game_state)
+    head = game_state["you"]["head"]
+    region = flood_fill(list(neighbour_lists[head["y"] * board_width + head["x"]]), free, neighbour_lists)
+    for snake in board["snakes"]:
+        if snake["id"] == game_state["you"]["id"]:
+            continue
+        opponent_head = snake["head"]
+        if any(cell in region for cell in neighbour_lists[opponent_head["y"] * board_width + opponent_head["x"]]):
+            return region, False
+    return region, True
+
+
+def get_parity_bound(cell: int, cells: Set[int], width: int) -> int:
+    """
+    Longest path starting from cell through cells (excluding cell) allowed by the checkerboard
+    colouring: the path alternates between the colours, starting with the colour opposite to cell.
+    """
+    colour = (cell // width + cell % width) % 2
+    same = sum(1 for other in cells if (other // width + other % width) % 2 == colour)
+    opposite = len(cells) - same
+    return 2 * min(same, opposite) + (1 if opposite > same else 0)
+
+
+def get_blocks(start: int, cells: Set[int], neighbour_lists: tuple) -> tuple:
+    """
+    Biconnected blocks of the graph of cells and start, and its articulation points
+    (iterative Hopcroft-Tarjan).
+
+    Returns:
+    tuple: The blocks (list of sets of cells) and the set of articulation points.
+    """
+    vertices = cells | {start}
+    discovery = {start: 0}
+    low = {start: 0}
+    blocks = []
+    articulation_points = set()
+    edge_stack = []
+    stack = [(start, None, iter(neighbour_lists[start]))]
+    root_children = 0
+    while stack:
+        cell, parent, neighbours = stack[-1]
+        advanced = False
+        for neighbour in neighbours:
+            if neighbour not in vertices or neighbour == parent:
+                continue
+            if neighbour not in discovery:
+                discovery[neighbour] = low[neighbour] = len(discovery)
+                edge_stack.append((cell, neighbour))
+                stack.append((neighbour, cell, iter(neighbour_lists[neighbour])))
+                if cell == start:
+                    root_children += 1
+                advanced = True
+                break
+            if discovery[neighbour] < discovery[cell]:
+                edge_stack.append((cell, neighbour))
+                low[cell] = min(low[cell], discovery[neighbour])
+        if advanced:
+            continue
+        stack.pop()
+        if parent is None:
+            continue
+        low[parent] = min(low[parent], low[cell])
+        if low[cell] >= discovery[parent]:
+            # parent separates the subtree of cell: pop its block
+            if parent != start:
+                articulation_points.add(parent)
+            block = set()
+            while True:
+                edge = edge_stack.pop()
+                block.update(edge)
+                if edge == (parent, cell):
+                    break
+            blocks.append(block)
+    if root_children > 1:
+        articulation_points.add(start)
+    if not blocks:
+        blocks.append({start})
+    return blocks, articulation_points
+
+
+def get_block_bound(start: int, cells: Set[int], neighbour_lists: tuple) -> int:
+    """
+    Longest path starting from start through cells allowed by the block-cut tree: a path only
+    goes through the blocks of one branch of the tree, as it cannot come back through an
+    articulation point.
+    """
+    blocks, articulation_points = get_blocks(start, cells, neighbour_lists)
+    blocks_of = {}
+    for index, block in enumerate(blocks):
+        for cell in block & (articulation_points | {start}):
+            blocks_of.setdefault(cell, []).append(index)
+
+    def bound(block_index: int, entry: int, visited_blocks: set) -> int:
+        block = blocks[block_index]
+        best_exit = 0
+        for exit_cell in block & articulation_points:
+            if exit_cell == entry:
+                continue
+            for child in blocks_of[exit_cell]:
+                if child not in visited_blocks:
+                    visited_blocks.add(child)
+                    best_exit = max(best_exit, bound(child, exit_cell, visited_blocks))
+        return len(block) - 1 + best_exit
+
+    visited_blocks = set(blocks_of.get(start, []))
+    return max(bound(index, start, visited_blocks) for index in blocks_of.get(start, [0]))
+
+
+def find_longest_path(start: int, cells: Set[int], width: int, neighbour_lists: tuple,
+                      node_limit: int = 20000, deadline: float = None) -> tuple:
+    """
+    Longest path from start through cells found by a bounded depth-first search.
+
+    Args:
+    start (int): First cell of the path.
+    cells (set[int]): Cells the path can go through (start excluded).
+    width (int): Width of the board.
+    neighbour_lists (tuple): See board_tables.get_neighbour_lists.
+    node_limit (int): Maximum number of nodes searched.
+    deadline (float): Optional time.perf_counter() value when the search stops.
+
+    Returns:
+    tuple: The path (list of cells starting with start) and the number of nodes searched.
+    """
+    free = set(cells)
+    reachable = flood_fill(list(neighbour_lists[start]), free, neighbour_lists)
+    upper_bound = min(len(reachable), get_parity_bound(start, reachable, width),
+                      get_block_bound(start, reachable, neighbour_lists))
+    path = [start]
+    best_path = [start]
+    nodes = 0
+
+    def onward_moves(cell):
+        return sum(1 for neighbour in neighbour_lists[cell] if neighbour in free)
+
+    def search(cell) -> bool:
+        nonlocal nodes, best_path
+        nodes += 1
+        if len(path) > len(best_path):
+            best_path = list(path)
+        if len(best_path) - 1 >= upper_bound or nodes >= node_limit or \
+                (deadline is not None and nodes % 256 == 0 and time.perf_counter() > deadline):
+            return True
+        # Warnsdorff ordering: cells with the fewest onward moves first hug the walls
+        candidates = sorted((neighbour for neighbour in neighbour_lists[cell] if neighbour in free),
+                            key=onward_moves)
+        for neighbour in candidates:
+            free.remove(neighbour)
+            path.append(neighbour)
+            reachable = flood_fill(list(neighbour_lists[neighbour]), free, neighbour_lists)
+            bound = len(path) - 1 + min(len(reachable), get_parity_bound(neighbour, reachable, width))
+            stop = bound > len(best_path) - 1 and search(neighbour)
+            path.pop()
+            free.add(neighbour)
+            if stop:
+                return True
+        return False
+
+    search(start)
+    return best_path, nodes
+
+
+def solve_endgame(game_state: dict, moves: List[str], stats=None, node_limit: int = 20000) -> Optional[str]:
+    """
+    Move filling our region for as long as possible when we are cut off from the opponents.
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+    moves (list[str]): Candidate moves, e.g., main.get_safe_moves(game_state).
+    stats (SearchStats): Optional counters, the nodes of the solver are added to them.
+    node_limit (int): Maximum number of nodes searched for each move.
+
+    Returns:
+    str: The move, None if an opponent can reach our region (or there are no opponents).
+    """
+    if len(game_state["board"]["snakes"]) < 2 or len(moves) == 0:
+        return None
+    region, is_isolated = get_separation(game_state)
+    if not is_isolated:
+        return None
+
+    board = game_state["board"]
+    board_width = board["width"]
+    neighbour_lists = get_neighbour_lists(board["height"], board_width)
+    head = game_state["you"]["head"]
+    head_cell = head["y"] * board_width + head["x"]
+    head_neighbours = get_neighbours(board["height"], board_width)[head_cell].tolist()
+    timeout = game_state.get("game", {}).get("timeout", 500)
+    deadline = time.perf_counter() + max(0, timeout - LATENCY_MARGIN_MS) * TIME_FRACTION / 1000
+
+    # the path of the previous turn is followed if we are on it and its next cells are still free
+    key = (game_state.get("game", {}).get("id"), game_state["you"]["id"])
+    path = PATH_CACHE.get(key)
+    if path is None or len(path) < 2 or path[0] != head_cell or \
+            any(cell not in region for cell in path[1:]):
+        path = [head_cell]
+        for move in moves:
+            cell = head_neighbours[API_MOVE_INDEX[move]]
+            if cell == OFF_BOARD or cell not in region:
+                continue
+            move_path, nodes = find_longest_path(cell, region - {cell}, board_width, neighbour_lists,
+                                                 node_limit, deadline)
+            if stats is not None:
+                stats.nodes += nodes
+            if len(move_path) + 1 > len(path):
+                path = [head_cell] + move_path
+
+    if len(path) >= 2:
+        for move in moves:
+            if head_neighbours[API_MOVE_INDEX[move]] == path[1]:
+                # the rest of the path is followed in the next turns
+                PATH_CACHE[key] = path[1:]
+                PATH_CACHE.move_to_end(key)
+                if len(PATH_CACHE) > PATH_CACHE_SIZE:
+                    PATH_CACHE.popitem(last=False)
+                return move
+    PATH_CACHE.pop(key, None)
+    return None
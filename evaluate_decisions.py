@@ -0,0 +1,234 @@
+"""
+Offline evaluation of the decisions of main.move on a corpus of recorded positions.
+
+Runs main.move on every /move request of a JSONL corpus (one request per line, e.g., written by
+benchmark_search.py --save-corpus) across a process pool, and records for each position the move
+chosen, the search depth, the nodes searched and the latency. The positions of the same snake in
+the same game are played in turn order by one worker, so the opponent model and the caches see
+the game as they would in a live game.
+
+The run can be saved as JSON and compared with a baseline run, e.g., before and after a change
+to the search: the report lists the latency percentiles of both runs and the decisions that
+changed. A changed decision is classified with main.get_move_dangers as better (a less dangerous
+move), worse (a more dangerous move) or neutral.
+
+Example:
+    python evaluate_decisions.py positions.jsonl --depth 3 --output before.json
+    python evaluate_decisions.py positions.jsonl --depth 3 --output after.json --baseline before.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "BattlesnakeGym"))
+
+import main  # noqa: E402
+from brs import EVALUATION_CACHE  # noqa: E402
+from endgame import PATH_CACHE  # noqa: E402
+from benchmark_search import generate_positions, load_positions  # noqa: E402
+
+RESULTS_VERSION = 1
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+def get_position_key(game_state: dict) -> str:
+    """Identifies a position in the results of the runs: game id, snake id and turn."""
+    return "{}/{}/{}".format(game_state["game"]["id"], game_state["you"]["id"], game_state["turn"])
+
+
+def group_positions(positions: List[dict]) -> List[List[tuple]]:
+    """
+    Group the positions by game and snake, in turn order.
+
+    Returns:
+    list[list[tuple]]: (index in positions, request) pairs of each group.
+    """
+    groups = defaultdict(list)
+    for index, game_state in enumerate(positions):
+        groups[(game_state["game"]["id"], game_state["you"]["id"])].append((index, game_state))
+    return [sorted(group, key=lambda item: item[1]["turn"]) for group in groups.values()]
+
+
+def evaluate_group(group: List[tuple], depth: int) -> List[dict]:
+    """
+    Run main.move on the positions of a group, starting from empty caches and opponent model.
+
+    Args:
+    group (list[tuple]): (index, request) pairs, see group_positions.
+    depth (int): Depth of the search of main.move.
+
+    Returns:
+    list[dict]: The decision of each position.
+    """
+    EVALUATION_CACHE.clear()
+    PATH_CACHE.clear()
+    main.OPPONENT_MODELS.clear()
+    decisions = []
+    for index, game_state in group:
+        # the default move of main.move is random
+        random.seed(index)
+        start_time = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            move = main.move(game_state, depth)["move"]
+        latency = time.perf_counter() - start_time
+        stats = main.LAST_SEARCH_STATS
+        decisions.append({"index": index, "key": get_position_key(game_state), "move": move,
+                          "depth": stats.depth, "nodes": stats.nodes,
+                          "evaluations": stats.evaluations, "latency_ms": 1000 * latency})
+    return decisions
+
+
+def _evaluate_group(arguments: tuple) -> List[dict]:
+    return evaluate_group(*arguments)
+
+
+def run_decisions(positions: List[dict], depth: int, processes: Optional[int] = None) -> List[dict]:
+    """
+    Evaluate the positions across a process pool.
+
+    Returns:
+    list[dict]: The decisions, in the order of positions.
+    """
+    groups = group_positions(positions)
+    decisions = []
+    with mp.Pool(processes) as pool:
+        for group_decisions in pool.imap_unordered(_evaluate_group, [(group, depth) for group in groups]):
+            decisions.extend(group_decisions)
+    return sorted(decisions, key=lambda decision: decision["index"])
+
+
+def get_latency_summary(decisions: List[dict]) -> Dict[str, float]:
+    """Latency percentiles, mean and maximum in milliseconds, and the nodes searched per second."""
+    latencies = np.array([decision["latency_ms"] for decision in decisions])
+    summary = {"p{}".format(q): float(value)
+               for q, value in zip(LATENCY_PERCENTILES, np.percentile(latencies, LATENCY_PERCENTILES))}
+    summary["mean"] = float(latencies.mean())
+    summary["max"] = float(latencies.max())
+    nodes = sum(decision["nodes"] for decision in decisions)
+    summary["nodes_per_second"] = 1000 * nodes / max(1e-9, latencies.sum())
+    return summary
+
+
+def compare_decisions(positions: List[dict], decisions: List[dict], baseline: List[dict]) -> List[dict]:
+    """
+    Decisions that differ from the baseline run, on the positions found in both runs.
+
+    Returns:
+    list[dict]: "key", "baseline" and "move" of each changed decision, and its "verdict":
+        "better" or "worse" if the danger of the move (see main.get_move_dangers) decreased or
+        increased, "neutral" otherwise.
+    """
+    baseline_moves = {decision["key"]: decision["move"] for decision in baseline}
+    changes = []
+    for decision in decisions:
+        baseline_move = baseline_moves.get(decision["key"])
+        if baseline_move is None or baseline_move == decision["move"]:
+            continue
+        dangers = main.get_move_dangers(positions[decision["index"]])
+        baseline_danger = dangers.get(baseline_move, float("inf"))
+        danger = dangers.get(decision["move"], float("inf"))
+        if danger < baseline_danger:
+            verdict = "better"
+        elif danger > baseline_danger:
+            verdict = "worse"
+        else:
+            verdict = "neutral"
+        changes.append({"key": decision["key"], "baseline": baseline_move, "move": decision["move"],
+                        "verdict": verdict})
+    return changes
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_latency(name: str, summary: Dict[str, float]):
+    print("{:<10} ".format(name) + "  ".join("{} {:>8.2f} ms".format(key, summary[key])
+                                             for key in ["p{}".format(q) for q in LATENCY_PERCENTILES] + ["max"])
+          + "  nodes/s {:>10.0f}".format(summary["nodes_per_second"]))
+
+
+def main_evaluate(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Offline evaluation of the decisions of main.move",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__)
+    parser.add_argument("corpus", nargs="?", help="JSONL file of /move requests, generated if not given")
+    parser.add_argument("--save-corpus", help="Path of a JSONL file to write the positions to")
+    parser.add_argument("--positions", type=int, default=500, help="Positions generated without a corpus")
+    parser.add_argument("--snakes", type=int, default=4)
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--depth", type=int, default=1, help="Depth of the search of main.move")
+    parser.add_argument("--processes", type=int, default=None, help="Default: number of cpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of a JSON file to write the decisions to")
+    parser.add_argument("--baseline", help="JSON decisions of another run to compare with")
+    parser.add_argument("--show", type=int, default=20, help="Number of changed decisions printed")
+    parser.add_argument("--fail-on-worse", action="store_true",
+                        help="Exit with 1 if a decision became more dangerous than in the baseline")
+    args = parser.parse_args(argv)
+
+    if args.corpus is not None:
+        positions = load_positions(args.corpus)
+    else:
+        positions = generate_positions(args.positions, args.snakes, (args.height, args.width), args.seed)
+    if args.save_corpus is not None:
+        with open(args.save_corpus, "w") as f:
+            for game_state in positions:
+                f.write(json.dumps(game_state) + "\n")
+
+    tic = time.perf_counter()
+    decisions = run_decisions(positions, args.depth, args.processes)
+    elapsed = time.perf_counter() - tic
+    summary = get_latency_summary(decisions)
+    print("{} positions in {:.1f}s, depth {}".format(len(decisions), elapsed, args.depth))
+    print_latency("run", summary)
+
+    results = {"metadata": {"version": RESULTS_VERSION, "commit": get_commit(), "corpus": args.corpus,
+                            "depth": args.depth},
+               "latency": summary, "decisions": decisions}
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline is None:
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    print_latency("baseline", baseline["latency"])
+    for key in ["p{}".format(q) for q in LATENCY_PERCENTILES]:
+        print("{} latency {:+.1%}".format(key, summary[key] / max(1e-9, baseline["latency"][key]) - 1))
+
+    changes = compare_decisions(positions, decisions, baseline["decisions"])
+    compared = len({decision["key"] for decision in baseline["decisions"]} &
+                   {decision["key"] for decision in decisions})
+    verdicts = {verdict: sum(1 for change in changes if change["verdict"] == verdict)
+                for verdict in ("better", "neutral", "worse")}
+    print("{} of {} decisions changed ({} better, {} neutral, {} worse)".format(
+        len(changes), compared, verdicts["better"], verdicts["neutral"], verdicts["worse"]))
+    for change in changes[:args.show]:
+        print("  {:<60} {:>5} -> {:<5} {}".format(change["key"], change["baseline"], change["move"],
+                                                 change["verdict"]))
+    if args.fail_on_worse and verdicts["worse"] > 0:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_evaluate())
@@ -11,10 +11,24 @@
 # For more info see docs.battlesnake.com
 
 import random
+import time
 import typing
 import math
+from collections import OrderedDict
 
 from brs import *
+from endgame import solve_endgame
+from opponent_model import OpponentModel
+from BattlesnakeGym.board_tables import get_neighbours, API_MOVE_INDEX, OFF_BOARD
+
+
+# models of the opponents of each of our snakes, keyed by (game id, snake id), trimming the
+# replies of the opponents in the search; the least recently used models are dropped
+OPPONENT_MODELS = OrderedDict()
+MAX_OPPONENT_MODELS = 64
+
+# counters of the search of the last call of move
+LAST_SEARCH_STATS = SearchStats()
 
 
 # info is called when you create your Battlesnake on play.battlesnake.com
@@ -35,111 +49,180 @@ def info() -> typing.Dict:
 # start is called when your Battlesnake begins a game
 def start(game_state: typing.Dict):
     print("GAME START")
+    EVALUATION_CACHE.start_game(game_state["game"]["id"])
+    get_opponent_model(game_state)
 
 
 # end is called when your Battlesnake finishes a game
 def end(game_state: typing.Dict):
     print("GAME OVER\n")
-
-
-# move is called on every turn and returns your next move
-# Valid moves are "up", "down", "left", or "right"
-# See https://docs.battlesnake.com/api/example-move for available data
-def move(game_state: typing.Dict) -> typing.Dict:
-    # assume all moves are valid at the start
-    is_move_safe = {"up": True, "down": True, "left": True, "right": True}
-
-    # get our head and body
-    head = game_state["you"]["body"][0]  # Coordinates of your head
-    body = game_state["you"]["body"][
-        1:]  # Coordinates of each "bodypart" (bodypart after head)
-
-    # Prevent the Battlesnake from moving out of bounds
-    # if width is 11, then maximum x coordinate is 10
-    # i.e bottomleft corner is (0, 0), topright is (width-1, height-1)
-    board_width = game_state['board']['width']
-    board_height = game_state['board']['height']
-    if head["x"] + 1 == board_width:
-        is_move_safe["right"] = False
-    if head["x"] == 0:
-        is_move_safe["left"] = False
-    if head["y"] == 0:
-        is_move_safe["down"] = False
-    if head["y"] + 1 == board_height:
-        is_move_safe["up"] = False
-
-    # Prevent the Battlesnake from colliding with itself
-    # check each bodypart and make sure we will not collide with it in the next move
-    for bodypart in body:
-        if bodypart["x"] == head["x"] - 1 and bodypart["y"] == head[
-                "y"]:  # bodypart is directly left of head, don't move left
-            is_move_safe["left"] = False
-        if bodypart["x"] == head["x"] + 1 and bodypart["y"] == head[
-                "y"]:  # bodypart is directly right of head, don't move right
-            is_move_safe["right"] = False
-        if bodypart["y"] == head["y"] - 1 and bodypart["x"] == head[
-                "x"]:  # bodypart is directly below head, don't move down
-            is_move_safe["down"] = False
-        if bodypart["y"] == head["y"] + 1 and bodypart["x"] == head[
-                "x"]:  # bodypart is directly above head, don't move up
-            is_move_safe["up"] = False
-
-    # Prevent the Battlesnake from colliding with other Battlesnakes
-    # check every opponent and make sure we do not collide with any of their bodyparts in the next move
-    opponents = game_state['board']['snakes']
-    for opponent in opponents:
-        # dont do anything if it is us
-        if opponent["name"] == "SORZWE":
-            continue
-        # check each opponents bodyparts (including their head)
-        for bodypart in opponent["body"]:
-            if bodypart["x"] == head["x"] - 1 and bodypart["y"] == head[
-                    "y"]:  # bodypart is directly left of head, don't move left
-                is_move_safe["left"] = False
-            if bodypart["x"] == head["x"] + 1 and bodypart["y"] == head[
-                    "y"]:  # bodypart is directly right of head, don't move right
-                is_move_safe["right"] = False
-            if bodypart["y"] == head["y"] - 1 and bodypart["x"] == head[
-                    "x"]:  # bodypart is directly below head, don't move down
-                is_move_safe["down"] = False
-            if bodypart["y"] == head["y"] + 1 and bodypart["x"] == head[
-                    "x"]:  # bodypart is directly above head, don't move up
-                is_move_safe["up"] = False
-
-    # Are there any safe moves left?
-    safe_moves = []
-    for move, isSafe in is_move_safe.items():
-        if isSafe:
-            safe_moves.append(move)
-
+    OPPONENT_MODELS.pop((game_state["game"]["id"], game_state["you"]["id"]), None)
+
+
+def get_opponent_model(game_state: typing.Dict) -> OpponentModel:
+    """
+    Model of the opponents of "you" in its game, created on the first request of the game.
+    Each of our snakes has its own model, so that several of our snakes can play the same game.
+
+    Args:
+    game_state (dict): Request of the Battlesnake API.
+
+    Returns:
+    OpponentModel: The model of (game id, you id).
+    """
+    key = (game_state["game"]["id"], game_state["you"]["id"])
+    opponent_model = OPPONENT_MODELS.get(key)
+    if opponent_model is None:
+        opponent_model = OPPONENT_MODELS[key] = OpponentModel()
+        opponent_model.start_game(key[0])
+        if len(OPPONENT_MODELS) > MAX_OPPONENT_MODELS:
+            OPPONENT_MODELS.popitem(last=False)
+    else:
+        OPPONENT_MODELS.move_to_end(key)
+    return opponent_model
+
+
+def get_move_dangers(game_state: typing.Dict) -> typing.Dict[str, float]:
+    """
+    Danger of each move of "you", computed in one pass over the bodies of the snakes.
+
+    A move is deadly if it leaves the board or enters a cell that is still occupied next turn.
+    Tails vacate their cell when the snake moves, unless the snake has just eaten (its last two
+    segments are stacked). A cell next to the head of an opponent of equal or greater length is
+    contested: the danger of a move into it is the number of such heads.
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+
+    Returns:
+    dict: Danger of each move, float("inf") if the move is deadly.
+    """
+    board = game_state["board"]
+    you = game_state["you"]
+    board_width = board["width"]
+    neighbours = get_neighbours(board["height"], board_width)
+
+    occupied = set()
+    contested = {}
+    for snake in board["snakes"]:
+        body = snake["body"]
+        tail_vacates = len(body) > 1 and body[-1] != body[-2]
+        for part in (body[:-1] if tail_vacates else body):
+            occupied.add(part["y"] * board_width + part["x"])
+        if snake["id"] != you["id"] and snake["length"] >= you["length"]:
+            head = snake["head"]
+            for neighbour in neighbours[head["y"] * board_width + head["x"]].tolist():
+                contested[neighbour] = contested.get(neighbour, 0) + 1
+
+    head = you["head"]
+    head_neighbours = neighbours[head["y"] * board_width + head["x"]].tolist()
+    dangers = {}
+    for move in ("up", "down", "left", "right"):
+        neighbour = head_neighbours[API_MOVE_INDEX[move]]
+        if neighbour == OFF_BOARD or neighbour in occupied:
+            dangers[move] = float("inf")
+        else:
+            dangers[move] = contested.get(neighbour, 0)
+    return dangers
+
+
+def get_safe_moves(game_state: typing.Dict) -> typing.List[str]:
+    """
+    Moves of "you" that do not hit a wall or a body, avoiding the head-to-heads we would lose
+    when possible (see get_move_dangers).
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+
+    Returns:
+    list[str]: The safe moves, empty if every move is deadly.
+    """
+    dangers = get_move_dangers(game_state)
+    safe_moves = [move for move, danger in dangers.items() if danger == 0]
     if len(safe_moves) == 0:
-        print(
-            f"MOVE {game_state['turn']}: No safe moves detected! Moving down")
-        return {"move": "down"}
+        lowest_danger = min(dangers.values())
+        safe_moves = [move for move, danger in dangers.items()
+                      if danger == lowest_danger and danger != float("inf")]
+    return safe_moves
+
+
+def search_moves(game_state: typing.Dict, moves: typing.List[str], depth: int,
+                 opponent_model: OpponentModel = None, stats: SearchStats = None) -> str:
+    """
+    Move of "you" with the highest value of the best-reply search (see brs.py).
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+    moves (list[str]): Moves to search, e.g., get_safe_moves(game_state), at least one.
+    depth (int): Depth of the search after each move, the opponents reply first.
+    opponent_model (OpponentModel): Optional model trimming the replies of the opponents.
+    stats (SearchStats): Optional counters of the search.
+
+    Returns:
+    str: The chosen move.
+    """
+    # our snake is identified by its id in the search
+    you_id = game_state["you"]["id"]
 
     # get all other snakes
     opponents = [
-        snake["name"] for snake in game_state["board"]["snakes"]
-        if snake["name"] != "SORZWE"
+        snake["id"] for snake in game_state["board"]["snakes"]
+        if snake["id"] != you_id
     ]
 
     # want to get the best move
-    best_move = random.choice(safe_moves)  # by default make random move
+    best_move = random.choice(moves)  # by default make random move
     best_score = float('-inf')
-    depth = 1  # Depth can be adjusted based on performance needs
     alpha = float('-inf')
     beta = float('inf')
 
-    # advance the game state using each safe move
-    # check the value of that new state
+    # advance the game state using each move
+    # check the value of that new state (the opponents reply first)
     # pick the one with the highest score
-    for move in safe_moves:
-        new_state = get_state_from_move(game_state, "SORZWE", move)
-        score = brs(alpha, beta, depth, 'MAX', new_state, "SORZWE", opponents)
+    for move in moves:
+        new_state = get_state_from_move(game_state, you_id, move)
+        score = brs(alpha, beta, depth, 'MIN', new_state, you_id, opponents, opponent_model, stats)
 
         if score > best_score:
             best_score = score
             best_move = move
+            alpha = max(alpha, score)
+    return best_move
+
+
+# move is called on every turn and returns your next move
+# Valid moves are "up", "down", "left", or "right"
+# See https://docs.battlesnake.com/api/example-move for available data
+# depth is the depth of the best-reply search (see brs.py)
+def move(game_state: typing.Dict, depth: int = 1) -> typing.Dict:
+    global LAST_SEARCH_STATS
+    LAST_SEARCH_STATS = stats = SearchStats(depth)
+    start_time = time.perf_counter()
+
+    # the evaluations cached and the moves of the opponents seen during the previous turns
+    # of this game are reused
+    EVALUATION_CACHE.start_game(game_state["game"]["id"])
+    opponent_model = get_opponent_model(game_state)
+    opponent_model.observe(game_state)
+
+    # keep the moves that do not hit a wall or a body, avoiding head-to-heads we would lose
+    # when possible
+    safe_moves = get_safe_moves(game_state)
+
+    if len(safe_moves) == 0:
+        print(
+            f"MOVE {game_state['turn']}: No safe moves detected! Moving down")
+        return {"move": "down"}
+
+    # when we are cut off from the opponents, fill our region instead of searching their moves
+    endgame_move = solve_endgame(game_state, safe_moves, stats)
+    if endgame_move is not None:
+        stats.seconds = time.perf_counter() - start_time
+        print(f"MOVE {game_state['turn']}: {endgame_move} (endgame)")
+        return {"move": endgame_move}
+
+    best_move = search_moves(game_state, safe_moves, depth, opponent_model, stats)
+    stats.seconds = time.perf_counter() - start_time
 
     print(f"MOVE {game_state['turn']}: {best_move}")
 
@@ -0,0 +1,178 @@
+from BattlesnakeGym.board_tables import get_neighbours, get_manhattan_distances, API_MOVE_INDEX, OFF_BOARD
+
+# styles of play recognised in the moves of the opponents
+STYLES = ("food", "tail", "aggressive")
+
+
+def get_style_moves(game_state: dict, snake: dict) -> dict:
+    """
+    Moves of a snake that follow each style of play.
+
+    - "food": the moves getting the closest to the closest food.
+    - "tail": the moves getting the closest to its own tail.
+    - "aggressive": the moves getting the closest to the closest head of another snake.
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API or state of the search.
+    snake (dict): The snake, one of game_state["board"]["snakes"].
+
+    Returns:
+    dict: The set of moves of each style, empty if the style does not apply
+    (e.g., there is no food).
+    """
+    board = game_state["board"]
+    board_width = board["width"]
+    neighbours = get_neighbours(board["height"], board_width)
+    distances = get_manhattan_distances(board["height"], board_width)
+
+    def cell(part):
+        return part["y"] * board_width + part["x"]
+
+    head = snake["body"][0]
+    if not (0 <= head["x"] < board_width and 0 <= head["y"] < board["height"]):
+        return {style: set() for style in STYLES}
+    head_cell = cell(head)
+    targets = {
+        "food": [cell(food) for food in board["food"]],
+        "tail": [cell(snake["body"][-1])] if len(snake["body"]) > 1 else [],
+        "aggressive": [cell(other["body"][0]) for other in board["snakes"]
+                       if other["id"] != snake["id"]],
+    }
+    head_neighbours = neighbours[head_cell].tolist()
+    style_moves = {}
+    for style, target_cells in targets.items():
+        style_moves[style] = set()
+        if len(target_cells) == 0:
+            continue
+        move_distances = {}
+        for move, k in API_MOVE_INDEX.items():
+            neighbour = head_neighbours[k]
+            if neighbour != OFF_BOARD:
+                move_distances[move] = int(distances[neighbour, target_cells].min())
+        closest = min(move_distances.values())
+        style_moves[style] = {move for move, distance in move_distances.items() if distance == closest}
+    return style_moves
+
+
+class OpponentModel:
+    """
+    Per-game model of the opponents learning how often each opponent follows each style of play
+    (see get_style_moves) from the moves it played in the previous turns.
+
+    At the MIN nodes of the search, select_replies keeps the most likely replies of each opponent.
+    To bound the loss, the replies that can meet our head are always kept and opponents are only
+    trimmed once min_observations of their moves have been observed.
+
+    Args:
+    max_replies (int): Number of replies kept at a MIN node, shared by the opponents.
+    min_observations (int): Number of moves of an opponent observed before trimming its replies.
+    """
+
+    def __init__(self, max_replies: int = 4, min_observations: int = 3):
+        self.max_replies = max_replies
+        self.min_observations = min_observations
+        self.game_id = None
+        self.start_game(None)
+
+    def start_game(self, game_id: str):
+        """Forget the observed moves if game_id is not the game being modelled."""
+        if game_id == self.game_id and game_id is not None:
+            return
+        self.game_id = game_id
+        self.previous_state = None
+        self.observations = {}
+        self.style_counts = {}
+
+    def observe(self, game_state: dict):
+        """
+        Learn from the moves played by the opponents since the previous call.
+
+        Args:
+        game_state (dict): /move request of the Battlesnake API of the current turn.
+        """
+        previous_state = self.previous_state
+        self.previous_state = game_state
+        if previous_state is None or game_state["turn"] != previous_state["turn"] + 1:
+            return
+        board_width = game_state["board"]["width"]
+        neighbours = get_neighbours(game_state["board"]["height"], board_width)
+        heads = {snake["id"]: snake["body"][0] for snake in game_state["board"]["snakes"]}
+        for snake in previous_state["board"]["snakes"]:
+            if snake["id"] == previous_state["you"]["id"] or snake["id"] not in heads:
+                continue
+            previous_head = snake["body"][0]
+            head = heads[snake["id"]]
+            head_neighbours = neighbours[previous_head["y"] * board_width + previous_head["x"]].tolist()
+            moves = [move for move, k in API_MOVE_INDEX.items()
+                     if head_neighbours[k] == head["y"] * board_width + head["x"]]
+            if len(moves) == 0:
+                continue
+            self.observations[snake["id"]] = self.observations.get(snake["id"], 0) + 1
+            style_counts = self.style_counts.setdefault(snake["id"], dict.fromkeys(STYLES, 0))
+            for style, style_moves in get_style_moves(previous_state, snake).items():
+                if moves[0] in style_moves:
+                    style_counts[style] += 1
+
+    def get_style_probabilities(self, snake_id: str) -> dict:
+        """Smoothed frequency of the moves of an opponent following each style."""
+        observations = self.observations.get(snake_id, 0)
+        style_counts = self.style_counts.get(snake_id, dict.fromkeys(STYLES, 0))
+        return {style: (count + 1) / (observations + 2) for style, count in style_counts.items()}
+
+    def rank_moves(self, game_state: dict, snake: dict, moves: list) -> list:
+        """
+        Sort the moves of an opponent from the most to the least likely.
+
+        Args:
+        game_state (dict): State of the search.
+        snake (dict): The opponent.
+        moves (list): [id, move] pairs of the opponent (see brs.get_possible_moves).
+
+        Returns:
+        list: The moves sorted by decreasing likelihood, in their original order on ties.
+        """
+        probabilities = self.get_style_probabilities(snake["id"])
+        style_moves = get_style_moves(game_state, snake)
+
+        def likelihood(move):
+            return sum(probabilities[style] for style in STYLES if move[1] in style_moves[style])
+
+        return sorted(moves, key=likelihood, reverse=True)
+
+    def select_replies(self, game_state: dict, player: str, opponent: str, moves: list,
+                       number_of_opponents: int) -> list:
+        """
+        Replies of an opponent searched at a MIN node.
+
+        Args:
+        game_state (dict): State of the search.
+        player (str): Id of our snake.
+        opponent (str): Id of the opponent.
+        moves (list): [id, move] pairs of the opponent (see brs.get_possible_moves).
+        number_of_opponents (int): Number of opponents replying at the MIN node.
+
+        Returns:
+        list: The most likely moves of the opponent and the moves that can meet our head.
+        """
+        snakes = {snake["id"]: snake for snake in game_state["board"]["snakes"]}
+        snake = snakes.get(opponent)
+        number_of_replies = max(1, self.max_replies // max(1, number_of_opponents))
+        if snake is None or player not in snakes or len(moves) <= number_of_replies or \
+                self.observations.get(snake["id"], 0) < self.min_observations:
+            return moves
+
+        board_width = game_state["board"]["width"]
+        neighbours = get_neighbours(game_state["board"]["height"], board_width)
+        distances = get_manhattan_distances(game_state["board"]["height"], board_width)
+        our_head = snakes[player]["body"][0]
+        our_head_cell = our_head["y"] * board_width + our_head["x"]
+        head = snake["body"][0]
+        head_neighbours = neighbours[head["y"] * board_width + head["x"]].tolist()
+
+        ranked_moves = self.rank_moves(game_state, snake, moves)
+        replies = ranked_moves[:number_of_replies]
+        for move in ranked_moves[number_of_replies:]:
+            # safety fallback: a reply entering our head or a cell we can enter is always searched
+            if distances[head_neighbours[API_MOVE_INDEX[move[1]]], our_head_cell] <= 1:
+                replies.append(move)
+        return replies
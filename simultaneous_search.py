@@ -0,0 +1,159 @@
+from copy import deepcopy
+from itertools import product
+
+from brs import get_possible_moves, apply_move, cached_evaluate, SearchStats
+
+
+def get_joint_replies(game_state: dict, player_id: str, opponents: list[str],
+                      opponent_model=None) -> list:
+    """
+    Joint moves of the opponents: every combination of one move of each opponent.
+
+    Args:
+    game_state (dict): State of the search.
+    player_id (str): Id of our snake.
+    opponents (list[str]): Ids of the opponents.
+    opponent_model (OpponentModel): Optional model keeping the most likely replies of each opponent.
+
+    Returns:
+    list: Tuples of [id, move] pairs, one per opponent still on the board.
+    """
+    opponent_moves = []
+    for opponent in opponents:
+        moves = get_possible_moves(game_state, opponent)
+        if opponent_model is not None:
+            moves = opponent_model.select_replies(game_state, player_id, opponent, moves,
+                                                  len(opponents))
+        if len(moves) > 0:
+            opponent_moves.append(moves)
+    return list(product(*opponent_moves))
+
+
+def apply_joint_move(game_state: dict, joint_move: tuple) -> dict:
+    """
+    State reached when the snakes play their moves simultaneously.
+
+    Args:
+    game_state (dict): State of the search.
+    joint_move (tuple): [id, move] pairs.
+
+    Returns:
+    dict: The new state, game_state is not modified.
+    """
+    new_game_state = deepcopy(game_state)
+    for player, move in joint_move:
+        apply_move(new_game_state, player, move)
+    return new_game_state
+
+
+def simultaneous_search(alpha: float, beta: float, depth: int, game_state: dict, player_id: str,
+                        opponents: list[str], opponent_model=None,
+                        stats: SearchStats = None) -> float:
+    """
+    Searches the turns as simultaneous moves: each turn, we pick a move and the opponents answer
+    with the joint move that is the worst for us, without seeing our move. With several opponents
+    this is the paranoid search, in duels it is the pessimistic (pure strategy) bound of
+    simultaneous-move alpha-beta. Alpha-beta pruning applies to the joint replies.
+
+    Args:
+    alpha (float): Alpha value for alpha-beta pruning.
+    beta (float): Beta value for alpha-beta pruning.
+    depth (int): Number of turns to search.
+    game_state (dict): State of the search.
+    player_id (str): Id of our snake, the nodes are evaluated for it.
+    opponents (list[str]): Ids of the opponents.
+    opponent_model (OpponentModel): Optional model trimming the replies of the opponents.
+    stats (SearchStats): Optional counters of the search.
+
+    Returns:
+    float: The heuristic value of the node.
+    """
+    if stats is not None:
+        stats.nodes += 1
+
+    our_moves = get_possible_moves(game_state, player_id)
+    if depth <= 0 or len(our_moves) == 0:
+        if stats is not None:
+            stats.evaluations += 1
+        return cached_evaluate(game_state, player_id)
+
+    joint_replies = get_joint_replies(game_state, player_id, opponents, opponent_model)
+    best_value = float('-inf')
+    for our_move in our_moves:
+        value = get_worst_reply_value(alpha, beta, depth, game_state, our_move, joint_replies,
+                                      player_id, opponents, opponent_model, stats)
+        if value > best_value:
+            best_value = value
+            alpha = max(alpha, value)
+        if alpha >= beta:
+            if stats is not None:
+                stats.cutoffs += 1
+            break
+    return best_value
+
+
+def get_worst_reply_value(alpha: float, beta: float, depth: int, game_state: dict, our_move: list,
+                          joint_replies: list, player_id: str, opponents: list[str],
+                          opponent_model=None, stats: SearchStats = None) -> float:
+    """
+    Value of our move against the joint reply of the opponents that is the worst for us.
+
+    Args:
+    our_move (list): [id, move] pair of our snake.
+    joint_replies (list): Joint moves of the opponents (see get_joint_replies).
+    See simultaneous_search for the other arguments.
+
+    Returns:
+    float: The value of the move.
+    """
+    worst_value = float('inf')
+    for joint_reply in joint_replies:
+        new_state = apply_joint_move(game_state, (our_move, *joint_reply))
+        value = simultaneous_search(alpha, beta, depth - 1, new_state, player_id, opponents,
+                                    opponent_model, stats)
+        if value < worst_value:
+            worst_value = value
+            beta = min(beta, value)
+        if worst_value <= alpha:
+            if stats is not None:
+                stats.cutoffs += 1
+            break
+    return worst_value
+
+
+def choose_move(game_state: dict, depth: int = 1, root_moves: list[str] = None,
+                opponent_model=None, stats: SearchStats = None) -> str:
+    """
+    Move of "you" with the highest value of the simultaneous-move search.
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+    depth (int): Number of turns to search, 1 evaluates the states after one joint move.
+    root_moves (list[str]): Moves to consider, e.g., main.get_safe_moves(game_state).
+        Every move on the board if None.
+    opponent_model (OpponentModel): Optional model trimming the replies of the opponents.
+    stats (SearchStats): Optional counters of the search.
+
+    Returns:
+    str: The chosen move.
+    """
+    you = game_state["you"]
+    player_id = you["id"]
+    opponents = [snake["id"] for snake in game_state["board"]["snakes"] if snake["id"] != you["id"]]
+    if root_moves is None:
+        root_moves = [move for _, move in get_possible_moves(game_state, player_id)]
+    if len(root_moves) == 0:
+        return "down"
+
+    joint_replies = get_joint_replies(game_state, player_id, opponents, opponent_model)
+    best_move = root_moves[0]
+    best_value = float('-inf')
+    alpha = float('-inf')
+    for move in root_moves:
+        value = get_worst_reply_value(alpha, float('inf'), depth, game_state, [player_id, move],
+                                      joint_replies, player_id, opponents, opponent_model, stats)
+        if value > best_value:
+            best_value = value
+            best_move = move
+            alpha = max(alpha, value)
+    return best_move
@@ -0,0 +1,376 @@
+import random
+import unittest
+from unittest import mock
+
+import numpy as np
+
+import main
+from brs import EVALUATION_CACHE, EvaluationCache, SearchStats, get_position_hash, get_possible_moves, \
+    get_state_from_move, HASH_KEY
+from endgame import PATH_CACHE, find_longest_path, flood_fill, get_block_bound, get_parity_bound, \
+    solve_endgame
+from evaluate_decisions import compare_decisions, get_position_key, group_positions
+from opponent_model import OpponentModel, STYLES, get_style_moves
+from BattlesnakeGym.board_tables import get_neighbour_lists
+from simultaneous_search import apply_joint_move, choose_move, get_joint_replies, simultaneous_search
+from tournament import fit_elo, get_pairwise_scores, get_ratings, play_game
+
+
+def make_game_state(bodies: list, width: int = 7, height: int = 7, food: tuple = (),
+                    game_id: str = "game", turn: int = 0) -> dict:
+    """
+    /move request of the Battlesnake API for snakes[0], the snakes are given as lists of (x, y)
+    from the head to the tail. Every snake has the same name, they are told apart by their ids.
+    """
+    snakes = []
+    for index, body in enumerate(bodies):
+        parts = [{"x": x, "y": y} for x, y in body]
+        snakes.append({"id": str(index), "name": "snake", "health": 100, "body": parts,
+                       "head": parts[0], "length": len(parts)})
+    return {"game": {"id": game_id, "timeout": 500}, "turn": turn,
+            "board": {"width": width, "height": height, "food": [{"x": x, "y": y} for x, y in food],
+                      "snakes": snakes},
+            "you": snakes[0]}
+
+
+class TestMoveDangers(unittest.TestCase):
+    """Test the single-pass danger of the moves and the safe moves of main.move"""
+
+    def test_walls_and_bodies(self):
+        # the neck is above the head and the head is in the bottom left corner
+        game_state = make_game_state([[(0, 0), (0, 1), (0, 2)]])
+        dangers = main.get_move_dangers(game_state)
+        self.assertEqual(dangers, {"up": float("inf"), "down": float("inf"),
+                                   "left": float("inf"), "right": 0})
+        self.assertEqual(main.get_safe_moves(game_state), ["right"])
+
+    def test_tails(self):
+        # our tail vacates its cell, unless we have just eaten (the last two segments are stacked)
+        body = [(1, 1), (2, 1), (2, 2), (1, 2)]
+        self.assertEqual(main.get_move_dangers(make_game_state([body]))["up"], 0)
+        self.assertEqual(main.get_move_dangers(make_game_state([body + [(1, 2)]]))["up"], float("inf"))
+
+    def test_head_to_heads(self):
+        # an opponent of equal length contests the cells next to its head, a shorter one does not
+        ours = [(2, 2), (1, 2), (0, 2)]
+        game_state = make_game_state([ours, [(4, 2), (5, 2), (6, 2)]])
+        dangers = main.get_move_dangers(game_state)
+        self.assertEqual(dangers["right"], 1)
+        self.assertEqual(main.get_safe_moves(game_state), ["up", "down"])
+        game_state = make_game_state([ours, [(4, 2), (5, 2)]])
+        self.assertEqual(main.get_move_dangers(game_state)["right"], 0)
+
+        # when every move is contested, the least contested ones are kept
+        game_state = make_game_state([[(0, 0), (0, 1), (0, 2)], [(2, 0), (3, 0), (4, 0)]])
+        self.assertEqual(main.get_safe_moves(game_state), ["right"])
+
+    def test_no_safe_move(self):
+        game_state = make_game_state([[(0, 0), (0, 1), (0, 2)], [(1, 1), (1, 0), (2, 0), (3, 0)]])
+        dangers = main.get_move_dangers(game_state)
+        self.assertTrue(all(danger == float("inf") for danger in dangers.values()))
+        self.assertEqual(main.get_safe_moves(game_state), [])
+        self.assertEqual(main.move(game_state)["move"], "down")
+
+
+class TestPositionHash(unittest.TestCase):
+    """Test the incremental Zobrist hash of the states of the search"""
+
+    def test_incremental_hash(self):
+        game_state = make_game_state([[(1, 1), (1, 2), (1, 3)], [(5, 5), (5, 4), (5, 3), (5, 2)]],
+                                     food=[(3, 3)])
+        moves = [("0", "right"), ("1", "left"), ("0", "right"), ("1", "down"), ("0", "down"),
+                 ("1", "down"), ("0", "left")]
+        hashes = {get_position_hash(game_state)}
+        for snake_id, move in moves:
+            game_state = get_state_from_move(game_state, snake_id, move)
+            self.assertIn(HASH_KEY, game_state)
+            recomputed = dict(game_state)
+            del recomputed[HASH_KEY]
+            self.assertEqual(get_position_hash(game_state), get_position_hash(recomputed))
+            hashes.add(get_position_hash(game_state))
+        self.assertEqual(len(hashes), len(moves) + 1)
+
+    def test_snakes_are_told_apart(self):
+        # swapping two snakes of the same name changes the hash, their keys depend on their ids
+        bodies = [[(1, 1), (1, 2)], [(4, 4), (4, 5)]]
+        self.assertNotEqual(get_position_hash(make_game_state(bodies)),
+                            get_position_hash(make_game_state(bodies[::-1])))
+        self.assertEqual(get_possible_moves(make_game_state(bodies), "1"),
+                         [["1", move] for move in ("down", "up", "left", "right")])
+
+
+class TestEvaluationCache(unittest.TestCase):
+    """Test the LRU eviction and the per-game reset of the evaluation cache"""
+
+    def test_eviction(self):
+        cache = EvaluationCache(max_bytes=3 * EvaluationCache.ENTRY_BYTES)
+        for key in range(3):
+            cache.put((key, "0"), key)
+        # reading an entry makes it the most recently used one
+        self.assertEqual(cache.get((0, "0")), 0)
+        cache.put((3, "0"), 3)
+        self.assertIsNone(cache.get((1, "0")))
+        self.assertEqual([cache.get((key, "0")) for key in (0, 2, 3)], [0, 2, 3])
+        self.assertEqual(cache.stats()["entries"], 3)
+        self.assertEqual(cache.stats()["hits"], 4)
+        self.assertEqual(cache.stats()["misses"], 1)
+
+    def test_start_game(self):
+        cache = EvaluationCache()
+        cache.start_game("a")
+        cache.put((0, "0"), 1)
+        cache.start_game("a")
+        self.assertEqual(cache.get((0, "0")), 1)
+        cache.start_game("b")
+        self.assertIsNone(cache.get((0, "0")))
+        self.assertEqual(cache.stats()["entries"], 0)
+
+
+class TestOpponentModel(unittest.TestCase):
+    """Test the trimming of the replies of the opponents and the models of main.move"""
+
+    def test_select_replies(self):
+        # the opponent faces our head, two cells away, with food below it
+        game_state = make_game_state([[(4, 4), (3, 4), (2, 4)], [(6, 4), (7, 4), (8, 4)]],
+                                     width=9, height=9, food=[(6, 0)])
+        moves = get_possible_moves(game_state, "1")
+        self.assertEqual(len(moves), 4)
+
+        # the replies are only trimmed once enough moves of the opponent have been observed
+        opponent_model = OpponentModel(max_replies=1, min_observations=3)
+        self.assertEqual(opponent_model.select_replies(game_state, "0", "1", moves, 1), moves)
+
+        # the most likely reply is kept, and the reply entering the cell next to our head is
+        # always searched
+        opponent_model = OpponentModel(max_replies=1, min_observations=0)
+        replies = opponent_model.select_replies(game_state, "0", "1", moves, 1)
+        self.assertEqual(len(replies), 2)
+        self.assertEqual(replies[0], moves[0])
+        self.assertIn(["1", "left"], replies)
+
+    def test_observe(self):
+        # the opponent goes down towards the food three turns in a row
+        opponent_model = OpponentModel(max_replies=1, min_observations=3)
+        for turn in range(4):
+            game_state = make_game_state([[(0, 8), (0, 7), (0, 6)],
+                                          [(6, 6 - turn), (6, 7 - turn), (6, 8 - turn)]],
+                                         width=9, height=9, food=[(6, 0)], turn=turn)
+            opponent_model.observe(game_state)
+        self.assertEqual(opponent_model.observations, {"1": 3})
+        probabilities = opponent_model.get_style_probabilities("1")
+        self.assertEqual(probabilities["food"], 4 / 5)
+        moves = get_possible_moves(game_state, "1")
+        self.assertEqual(opponent_model.select_replies(game_state, "0", "1", moves, 1), [["1", "down"]])
+
+    def test_off_board_head(self):
+        # a head past the right wall would map to the first cell of the next row
+        for head in [(7, 2), (-1, 2), (3, 7), (3, -1)]:
+            game_state = make_game_state([[(1, 1), (1, 2)], [head, (3, 3)]], food=[(0, 3)])
+            snake = game_state["board"]["snakes"][1]
+            self.assertEqual(get_style_moves(game_state, snake), {style: set() for style in STYLES})
+
+    def test_models_of_main(self):
+        # each of our snakes in a game has its own model, dropped when the game ends
+        bodies = [[(1, 1), (1, 2), (1, 3)], [(5, 5), (5, 4), (5, 3)]]
+        ours = make_game_state(bodies, game_id="models")
+        theirs = make_game_state(bodies, game_id="models")
+        theirs["you"] = theirs["board"]["snakes"][1]
+        opponent_model = main.get_opponent_model(ours)
+        self.assertIs(main.get_opponent_model(ours), opponent_model)
+        self.assertIsNot(main.get_opponent_model(theirs), opponent_model)
+        main.end(ours)
+        self.assertNotIn(("models", "0"), main.OPPONENT_MODELS)
+        self.assertIn(("models", "1"), main.OPPONENT_MODELS)
+        main.end(theirs)
+
+
+class TestSimultaneousSearch(unittest.TestCase):
+    """Test the simultaneous-move search against a search of every joint move without pruning"""
+
+    @staticmethod
+    def evaluate(game_state: dict, player: str) -> int:
+        # unlike brs.evaluate, the value depends on the moves of the opponents
+        heads = {snake["id"]: snake["body"][0] for snake in game_state["board"]["snakes"]}
+        head = heads.pop(player)
+        return head["x"] + sum((int(snake_id) + 2) * (abs(head["x"] - other["x"]) +
+                                                      abs(head["y"] - other["y"]))
+                               for snake_id, other in heads.items())
+
+    def setUp(self):
+        EVALUATION_CACHE.clear()
+        self.addCleanup(EVALUATION_CACHE.clear)
+        patcher = mock.patch("brs.evaluate", self.evaluate)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def get_value(self, game_state: dict, depth: int, opponents: list, our_move: str = None) -> float:
+        our_moves = [move for _, move in get_possible_moves(game_state, "0")]
+        if our_move is None and (depth <= 0 or len(our_moves) == 0):
+            return self.evaluate(game_state, "0")
+        values = []
+        for move in our_moves if our_move is None else [our_move]:
+            values.append(min(self.get_value(apply_joint_move(game_state, (["0", move], *reply)),
+                                             depth - 1, opponents)
+                              for reply in get_joint_replies(game_state, "0", opponents)))
+        return max(values)
+
+    def test_values(self):
+        bodies = [[(1, 1), (1, 2), (1, 3)], [(4, 4), (4, 5), (4, 6)], [(5, 1), (6, 1), (6, 2)]]
+        for number_of_snakes, depth in ((2, 1), (2, 2), (2, 3), (3, 1), (3, 2)):
+            game_state = make_game_state(bodies[:number_of_snakes])
+            opponents = [str(index) for index in range(1, number_of_snakes)]
+            stats = SearchStats(depth)
+            value = simultaneous_search(float('-inf'), float('inf'), depth, game_state, "0", opponents,
+                                        stats=stats)
+            self.assertEqual(value, self.get_value(game_state, depth, opponents))
+            self.assertGreater(stats.nodes, 0)
+
+            # the move chosen has the best value
+            move = choose_move(game_state, depth)
+            self.assertEqual(self.get_value(game_state, depth, opponents, move), value)
+
+class TestEndgame(unittest.TestCase):
+    """Test the bounds and the paths of the endgame solver"""
+
+    def get_longest_path(self, cell: int, cells: set, neighbour_lists: tuple) -> int:
+        # brute force: every path from cell through cells
+        longest = 0
+        for neighbour in neighbour_lists[cell]:
+            if neighbour in cells:
+                longest = max(longest, 1 + self.get_longest_path(neighbour, cells - {neighbour},
+                                                                 neighbour_lists))
+        return longest
+
+    def test_bounds_and_paths(self):
+        # random regions of a 5x5 board
+        neighbour_lists = get_neighbour_lists(5, 5)
+        rng = random.Random(0)
+        for _ in range(100):
+            free = {cell for cell in range(25) if rng.random() < 0.7}
+            start = rng.randrange(25)
+            cells = flood_fill(list(neighbour_lists[start]), free - {start}, neighbour_lists)
+            longest = self.get_longest_path(start, cells, neighbour_lists)
+            self.assertGreaterEqual(get_parity_bound(start, cells, 5), longest)
+            self.assertGreaterEqual(get_block_bound(start, cells, neighbour_lists), longest)
+
+            path, _ = find_longest_path(start, cells, 5, neighbour_lists, node_limit=10**6)
+            self.assertEqual(len(path) - 1, longest)
+            self.assertEqual(path[0], start)
+            self.assertEqual(len(set(path)), len(path))
+            self.assertTrue(set(path[1:]) <= cells)
+            self.assertTrue(all(b in neighbour_lists[a] for a, b in zip(path, path[1:])))
+
+    def test_solve_endgame(self):
+        PATH_CACHE.clear()
+        self.addCleanup(PATH_CACHE.clear)
+        # the opponent is a wall along x = 3 with its head on the other side
+        opponent = [(4, 6)] + [(3, y) for y in range(6, -1, -1)] + [(3, 0)]
+        game_state = make_game_state([[(0, 6), (0, 5), (0, 4)], opponent])
+        self.assertIsNone(solve_endgame(make_game_state([[(0, 6), (0, 5), (0, 4)], [(2, 2), (2, 1)]]),
+                                        ["right"]))
+
+        # the path found on the first turn is followed while its cells are still free
+        for turn in range(30):
+            stats = SearchStats()
+            safe_moves = main.get_safe_moves(game_state)
+            move = solve_endgame(game_state, safe_moves, stats)
+            self.assertIn(move, safe_moves)
+            if turn > 0 and turn < 15:
+                self.assertEqual(stats.nodes, 0)
+            game_state = get_state_from_move(game_state, "0", move)
+            game_state["you"] = game_state["board"]["snakes"][0]
+            game_state["turn"] += 1
+
+
+class TestEvaluateDecisions(unittest.TestCase):
+    """Test the grouping of the positions and the comparison of the decisions of two runs"""
+
+    def test_group_positions(self):
+        bodies = [[(1, 1), (1, 2)], [(4, 4), (4, 5)]]
+        positions = []
+        for turn in (2, 0, 1):
+            for you in range(2):
+                game_state = make_game_state(bodies, turn=turn)
+                game_state["you"] = game_state["board"]["snakes"][you]
+                positions.append(game_state)
+        groups = group_positions(positions)
+        self.assertEqual(len(groups), 2)
+        for group in groups:
+            self.assertEqual([game_state["turn"] for _, game_state in group], [0, 1, 2])
+            self.assertEqual(len({game_state["you"]["id"] for _, game_state in group}), 1)
+            self.assertTrue(all(positions[index] is game_state for index, game_state in group))
+
+    def test_compare_decisions(self):
+        # in the corner, only right is safe; in the middle, every move but up is safe
+        positions = [make_game_state([[(0, 0), (0, 1), (0, 2)]], turn=0),
+                     make_game_state([[(3, 3), (3, 4), (3, 5)]], turn=1),
+                     make_game_state([[(3, 3), (3, 4), (3, 5)]], turn=2)]
+        keys = [get_position_key(game_state) for game_state in positions]
+
+        def get_decisions(moves):
+            return [{"index": index, "key": key, "move": move}
+                    for index, (key, move) in enumerate(zip(keys, moves))]
+
+        baseline = get_decisions(["left", "right", "down"])[:2]
+        changes = compare_decisions(positions, get_decisions(["right", "left", "left"]), baseline)
+        self.assertEqual(changes, [
+            {"key": keys[0], "baseline": "left", "move": "right", "verdict": "better"},
+            {"key": keys[1], "baseline": "right", "move": "left", "verdict": "neutral"}])
+        changes = compare_decisions(positions, get_decisions(["left", "up", "down"]),
+                                    get_decisions(["right"] * 3))
+        self.assertEqual([change["verdict"] for change in changes], ["worse", "worse", "neutral"])
+        self.assertEqual(compare_decisions(positions, baseline, baseline), [])
+
+
+class TestTournament(unittest.TestCase):
+    """Test the pairwise scores, the Elo ratings and the games of the tournament"""
+
+    def test_pairwise_scores(self):
+        # b and c die on the same turn, and the two seats of a in the second game do not play
+        # each other
+        results = [{"seats": ["a", "b", "c"], "turns": 5, "death_turns": [None, 5, 5]},
+                   {"seats": ["a", "a", "b"], "turns": 9, "death_turns": [3, None, 7]}]
+        scores = get_pairwise_scores(results, ["a", "b", "c"])
+        self.assertEqual(scores[0].tolist(), [[0, 1, 1], [0, 0, 0.5], [0, 0.5, 0]])
+        self.assertEqual(scores[1].tolist(), [[0, 1, 0], [1, 0, 0], [0, 0, 0]])
+
+    def test_fit_elo(self):
+        wins = np.array([[0, 3, 3], [3, 0, 3], [3, 3, 0]])
+        self.assertTrue(np.allclose(fit_elo(wins), 1500))
+        wins = np.array([[0, 8, 9], [2, 0, 6], [1, 4, 0]])
+        elo = fit_elo(wins)
+        self.assertTrue(elo[0] > elo[1] > elo[2])
+        self.assertAlmostEqual(elo.mean(), 1500)
+
+    def test_ratings(self):
+        rng = np.random.default_rng(0)
+        players = ["a", "b", "c"]
+        results = []
+        for _ in range(60):
+            # a survives longer than b, which survives longer than c, most of the time
+            survival = rng.integers(0, 10, size=3) + np.array([4, 2, 0])
+            death_turns = [None if turn == survival.max() else int(turn) for turn in survival]
+            results.append({"seats": players, "turns": int(survival.max()), "death_turns": death_turns})
+        ratings = get_ratings(results, players, bootstrap_samples=50)
+        self.assertEqual([rating["player"] for rating in ratings], players)
+        for rating in ratings:
+            self.assertLessEqual(rating["lower"], rating["elo"])
+            self.assertLessEqual(rating["elo"], rating["upper"])
+            self.assertEqual(rating["games"], 60)
+
+    def test_play_game(self):
+        for seed in range(3):
+            result = play_game(["random", "food"], (7, 7), seed, 50)
+            self.assertEqual(result["seats"], ["random", "food"])
+            self.assertLessEqual(result["turns"], 50)
+            death_turns = [turn for turn in result["death_turns"] if turn is not None]
+            self.assertTrue(all(1 <= turn <= result["turns"] for turn in death_turns))
+            if result["turns"] < 50:
+                # the game ended early: at most one snake survived, the last death ended it
+                self.assertGreaterEqual(len(death_turns), len(result["seats"]) - 1)
+                self.assertEqual(max(death_turns), result["turns"])
+            self.assertEqual(play_game(["random", "food"], (7, 7), seed, 50), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
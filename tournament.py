@@ -0,0 +1,385 @@
+"""
+Local tournament between Battlesnake policies.
+
+Games are played with the rules of the BattlesnakeGym across a process pool. Each game seats
+a random selection of the players, and every pair of seats in a game counts as a match won by
+the snake that survived longer. Elo ratings are fitted on all the matches (Bradley-Terry model)
+and their confidence intervals are estimated by bootstrapping the games.
+
+Players are given as specs:
+    main                     main.move with the default search depth
+    main:depth=2             main.move with a search depth of 2
+    random                   random move that does not hit a wall or the neck
+    food                     move towards the closest food, avoiding the snakes
+    http://localhost:8000    snake served over HTTP (e.g., `python main.py`)
+
+Example:
+    python tournament.py main:depth=1 main:depth=2 random food --games 1000 --processes 8
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing as mp
+import os
+import random
+import sys
+import time
+import urllib.request
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "BattlesnakeGym"))
+
+from snake_gym import BattlesnakeGym, API_MOVE_TO_ACTION, DEFAULT_API_GAME  # noqa: E402
+from vec_env import is_episode_over  # noqa: E402
+
+MOVES = ["up", "down", "left", "right"]
+MOVE_DELTAS = {"up": (0, 1), "down": (0, -1), "left": (-1, 0), "right": (1, 0)}
+DEFAULT_MOVE = "up"
+
+
+def get_safe_moves(game_state: dict) -> List[str]:
+    """
+    Moves of "you" that do not hit a wall or a body (tails are treated as occupied).
+
+    Args:
+    game_state (dict): /move request of the Battlesnake API.
+
+    Returns:
+    list[str]: The safe moves, every move if none is safe.
+    """
+    board = game_state["board"]
+    head = game_state["you"]["head"]
+    occupied = {(part["x"], part["y"]) for snake in board["snakes"] for part in snake["body"]}
+    safe_moves = []
+    for move, (dx, dy) in MOVE_DELTAS.items():
+        x, y = head["x"] + dx, head["y"] + dy
+        if 0 <= x < board["width"] and 0 <= y < board["height"] and (x, y) not in occupied:
+            safe_moves.append(move)
+    return safe_moves if len(safe_moves) > 0 else list(MOVES)
+
+
+def random_move(game_state: dict) -> str:
+    """Baseline choosing a random safe move."""
+    return random.choice(get_safe_moves(game_state))
+
+
+def food_move(game_state: dict) -> str:
+    """Baseline choosing the safe move getting the closest to the closest food."""
+    safe_moves = get_safe_moves(game_state)
+    food = game_state["board"]["food"]
+    if len(food) == 0:
+        return random.choice(safe_moves)
+    head = game_state["you"]["head"]
+
+    def distance_to_food(move):
+        dx, dy = MOVE_DELTAS[move]
+        return min(abs(head["x"] + dx - f["x"]) + abs(head["y"] + dy - f["y"]) for f in food)
+
+    return min(safe_moves, key=distance_to_food)
+
+
+class HttpSnake:
+    """
+    Snake served over HTTP following the Battlesnake API.
+
+    Args:
+    url (str): Base url of the snake, e.g., http://localhost:8000.
+    timeout (float): Seconds to wait for a move, DEFAULT_MOVE is played after a timeout.
+    """
+
+    def __init__(self, url: str, timeout: float = 0.5):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _post(self, path: str, request: bytes) -> bytes:
+        http_request = urllib.request.Request(self.url + path, data=request,
+                                              headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(http_request, timeout=self.timeout) as response:
+            return response.read()
+
+    def start(self, request: bytes):
+        with contextlib.suppress(OSError):
+            self._post("/start", request)
+
+    def move(self, request: bytes) -> str:
+        try:
+            move = json.loads(self._post("/move", request))["move"]
+        except (OSError, ValueError, KeyError):
+            return DEFAULT_MOVE
+        return move if move in MOVE_DELTAS else DEFAULT_MOVE
+
+    def end(self, request: bytes):
+        with contextlib.suppress(OSError):
+            self._post("/end", request)
+
+
+class FunctionSnake:
+    """
+    Snake running a move function in this process.
+
+    Args:
+    move_function (callable): Takes the /move request as a dict and returns a move or
+        a {"move": move} response.
+    """
+
+    def __init__(self, move_function: Callable):
+        self.move_function = move_function
+
+    def start(self, request: bytes):
+        pass
+
+    def move(self, request: bytes) -> str:
+        move = self.move_function(json.loads(request))
+        if isinstance(move, dict):
+            move = move.get("move")
+        return move if move in MOVE_DELTAS else DEFAULT_MOVE
+
+    def end(self, request: bytes):
+        pass
+
+
+def make_snake(spec: str):
+    """
+    Create the snake of a player spec (see the module documentation).
+
+    Args:
+    spec (str): The player spec.
+
+    Returns:
+    HttpSnake or FunctionSnake
+    """
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return HttpSnake(spec)
+    name, _, options = spec.partition(":")
+    kwargs = {}
+    for option in filter(None, options.split(",")):
+        key, _, value = option.partition("=")
+        kwargs[key] = int(value)
+    if name == "main":
+        import main
+        return FunctionSnake(lambda game_state: main.move(game_state, **kwargs))
+    if name == "random":
+        return FunctionSnake(random_move)
+    if name == "food":
+        return FunctionSnake(food_move)
+    raise ValueError("Unknown player spec {}".format(spec))
+
+
+# Snakes of the players, created once in each worker process
+_SNAKES = {}
+
+
+def _init_worker(specs: List[str]):
+    global _SNAKES
+    _SNAKES = {spec: make_snake(spec) for spec in specs}
+
+
+def play_game(seats: List[str], map_size: tuple, seed: int, max_turns: int,
+              minimum_food: int = 1, food_spawn_chance: float = 0.15) -> dict:
+    """
+    Play a game with the rules of the BattlesnakeGym.
+
+    Args:
+    seats (list[str]): The player spec of each snake.
+    map_size (tuple): (height, width) of the board.
+    seed (int): Seed of the game and of the baselines.
+    max_turns (int): The game is stopped after max_turns turns.
+
+    Returns:
+    dict: "seed", "seats", "turns" and "death_turns", the turn each snake died (None if it survived).
+    """
+    snakes = [_SNAKES[spec] if spec in _SNAKES else make_snake(spec) for spec in seats]
+    random.seed(seed)
+    env = BattlesnakeGym(map_size=map_size, number_of_snakes=len(seats), seed=seed,
+                         minimum_food=minimum_food, food_spawn_chance=food_spawn_chance)
+    env.reset()
+    game = dict(DEFAULT_API_GAME, id="tournament-{}".format(seed))
+    requests = env.get_move_requests(game)
+    for i, request in requests.items():
+        snakes[i].start(request)
+
+    death_turns = [None] * len(seats)
+    dones = {i: False for i in range(len(seats))}
+    # main.move prints every move, keep the output of the workers quiet
+    with contextlib.redirect_stdout(io.StringIO()):
+        while not is_episode_over(dones) and env.turn_count < max_turns:
+            actions = np.zeros(len(seats), dtype=np.int64)
+            for i, request in requests.items():
+                actions[i] = API_MOVE_TO_ACTION[snakes[i].move(request)]
+            final_requests = requests
+            _, _, dones, _ = env.step(actions)
+            requests = env.get_move_requests(game)
+            for i in final_requests:
+                if dones[i]:
+                    death_turns[i] = env.turn_count
+                    snakes[i].end(final_requests[i])
+    for i, request in requests.items():
+        snakes[i].end(request)
+    env.close()
+    return {"seed": seed, "seats": seats, "turns": env.turn_count, "death_turns": death_turns}
+
+
+def _play_game(arguments: tuple) -> dict:
+    return play_game(*arguments)
+
+
+def get_pairwise_scores(results: List[dict], players: List[str]) -> np.ndarray:
+    """
+    Score of every pair of seats of different players in the games.
+    The snake surviving longer wins the pair, snakes dying on the same turn draw.
+
+    Args:
+    results (list[dict]): Outputs of play_game.
+    players (list[str]): The player specs.
+
+    Returns:
+    np.ndarray: scores[g, a, b] is the score of player a against player b in game g.
+    """
+    index = {player: k for k, player in enumerate(players)}
+    scores = np.zeros((len(results), len(players), len(players)))
+    for g, result in enumerate(results):
+        # Snakes alive at the end survived the longest
+        survival = [float("inf") if turn is None else turn for turn in result["death_turns"]]
+        for s1, player1 in enumerate(result["seats"]):
+            for s2, player2 in enumerate(result["seats"]):
+                if index[player1] == index[player2]:
+                    continue
+                if survival[s1] > survival[s2]:
+                    scores[g, index[player1], index[player2]] += 1
+                elif survival[s1] == survival[s2]:
+                    scores[g, index[player1], index[player2]] += 0.5
+    return scores
+
+
+def fit_elo(wins: np.ndarray, iterations: int = 200, prior: float = 1.0) -> np.ndarray:
+    """
+    Fit Elo ratings to a matrix of wins with the minorization-maximization algorithm of the
+    Bradley-Terry model. A prior of draws between every pair keeps the ratings finite.
+
+    Args:
+    wins (np.ndarray): wins[a, b] is the score of player a against player b.
+    iterations (int): Number of iterations.
+    prior (float): Number of virtual draws between every pair of players.
+
+    Returns:
+    np.ndarray: The Elo rating of each player, with a mean of 1500.
+    """
+    number_of_players = wins.shape[0]
+    wins = wins + prior / 2 * (1 - np.eye(number_of_players))
+    games = wins + wins.T
+    total_wins = wins.sum(axis=1)
+    strengths = np.ones(number_of_players)
+    for _ in range(iterations):
+        denominators = (games / (strengths[:, None] + strengths[None, :])).sum(axis=1)
+        strengths = total_wins / denominators
+        strengths /= np.exp(np.mean(np.log(strengths)))
+    return 1500 + 400 * np.log10(strengths)
+
+
+def get_ratings(results: List[dict], players: List[str], bootstrap_samples: int = 200,
+                confidence: float = 0.95, seed: int = 0) -> List[dict]:
+    """
+    Elo ratings of the players with bootstrap confidence intervals.
+
+    Returns:
+    list[dict]: The rating, confidence interval, games, wins and average survival of each
+        player, sorted by rating.
+    """
+    scores = get_pairwise_scores(results, players)
+    elo = fit_elo(scores.sum(axis=0))
+
+    rng = np.random.default_rng(seed)
+    bootstrap_elo = np.array([fit_elo(scores[rng.integers(0, len(results), len(results))].sum(axis=0))
+                              for _ in range(bootstrap_samples)])
+    lower, upper = np.percentile(bootstrap_elo, [50 * (1 - confidence), 50 * (1 + confidence)], axis=0)
+
+    ratings = []
+    for k, player in enumerate(players):
+        games = [(result, seat) for result in results for seat, spec in enumerate(result["seats"])
+                 if spec == player]
+        wins = sum(1 for result, seat in games if result["death_turns"][seat] is None
+                   and sum(turn is None for turn in result["death_turns"]) == 1)
+        survival = [result["turns"] if result["death_turns"][seat] is None else result["death_turns"][seat]
+                    for result, seat in games]
+        ratings.append({"player": player, "elo": float(elo[k]), "lower": float(lower[k]),
+                        "upper": float(upper[k]), "games": len(games), "wins": wins,
+                        "average_survival": float(np.mean(survival)) if len(survival) > 0 else 0.0})
+    return sorted(ratings, key=lambda rating: -rating["elo"])
+
+
+def run_tournament(players: List[str], number_of_games: int, snakes_per_game: int = 4,
+                   map_size: tuple = (11, 11), max_turns: int = 500, processes: Optional[int] = None,
+                   seed: int = 0, progress: bool = True) -> Dict:
+    """
+    Play the games of a tournament across a process pool.
+
+    Returns:
+    dict: "results" of each game in the order of their seeds, "games_per_second" and
+        "turns_per_second".
+    """
+    rng = np.random.default_rng(seed)
+    games = []
+    for game in range(number_of_games):
+        replace = len(players) < snakes_per_game
+        seats = [players[k] for k in rng.choice(len(players), size=snakes_per_game, replace=replace)]
+        games.append((seats, map_size, seed * number_of_games + game, max_turns))
+
+    results = []
+    tic = time.perf_counter()
+    with mp.Pool(processes, initializer=_init_worker, initargs=(players,)) as pool:
+        for result in pool.imap_unordered(_play_game, games, chunksize=max(1, number_of_games // 256)):
+            results.append(result)
+            if progress and len(results) % max(1, number_of_games // 20) == 0:
+                elapsed = time.perf_counter() - tic
+                print("{}/{} games, {:.1f} games/s".format(len(results), number_of_games,
+                                                           len(results) / elapsed), file=sys.stderr)
+    elapsed = time.perf_counter() - tic
+    # the games finish in any order, sort them so that the bootstrap of the ratings is reproducible
+    results.sort(key=lambda result: result["seed"])
+    return {"results": results,
+            "games_per_second": number_of_games / elapsed,
+            "turns_per_second": sum(result["turns"] for result in results) / elapsed}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Local tournament between Battlesnake policies",
+                                     formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__)
+    parser.add_argument("players", nargs="+", help="Player specs")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--snakes-per-game", type=int, default=4)
+    parser.add_argument("--width", type=int, default=11)
+    parser.add_argument("--height", type=int, default=11)
+    parser.add_argument("--max-turns", type=int, default=500)
+    parser.add_argument("--processes", type=int, default=None, help="Default: number of cpus")
+    parser.add_argument("--bootstrap-samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Path of a JSON file to write the results and ratings to")
+    args = parser.parse_args(argv)
+
+    players = list(dict.fromkeys(args.players))
+    tournament = run_tournament(players, args.games, args.snakes_per_game, (args.height, args.width),
+                                args.max_turns, args.processes, args.seed)
+    ratings = get_ratings(tournament["results"], players, args.bootstrap_samples, seed=args.seed)
+
+    print("{:<30} {:>7} {:>17} {:>7} {:>7} {:>10}".format("player", "elo", "95% interval", "games",
+                                                           "wins", "survival"))
+    for rating in ratings:
+        print("{:<30} {:>7.0f} {:>8.0f} - {:>6.0f} {:>7} {:>7} {:>10.1f}".format(
+            rating["player"], rating["elo"], rating["lower"], rating["upper"], rating["games"],
+            rating["wins"], rating["average_survival"]))
+    print("{:.2f} games/s, {:.1f} turns/s".format(tournament["games_per_second"],
+                                                  tournament["turns_per_second"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump({"ratings": ratings, **tournament}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())